@@ -0,0 +1,147 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Stacking graph of the host block devices, built from sysfs."""
+import os
+
+SYS_CLASS_BLOCK = '/sys/class/block'
+
+# udev rewrites the database file of a device on every event it handles, so
+# the modification time of the database directory changes with the devices
+UDEV_DATA = '/run/udev/data'
+
+_graph = None
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def udev_stamp():
+    """Return a value which changes whenever udev handles a device event."""
+    try:
+        return os.stat(UDEV_DATA).st_mtime
+    except OSError:
+        return None
+
+
+class BlockDeviceGraph(object):
+    """Stacking graph of the host block devices.
+
+    Every device listed in SYS_CLASS_BLOCK is a node. A device is stacked on
+    its slaves (e.g. a multipath map on its paths, an LVM volume on its
+    physical volumes or an md array on its members) and a partition on its
+    disk. The devices stacked on a device are its holders.
+
+    Physical disks are the whole disks backed by hardware, which are not
+    stacked on any other device. The I/O of the other devices is also
+    accounted by the physical disks below them.
+
+    Args:
+        stamp (tuple): value identifying the state of the devices the graph
+            was built from. See get_block_graph().
+
+    """
+
+    def __init__(self, stamp=None):
+        self.stamp = stamp
+        self._slaves = {}
+        self._holders = {}
+        self._aliases = {}
+        self._majmin = {}
+        self._physical = set()
+
+        partitions = set()
+        for name in _listdir(SYS_CLASS_BLOCK):
+            path = os.path.join(SYS_CLASS_BLOCK, name)
+            slaves = sorted(_listdir(os.path.join(path, 'slaves')))
+            if os.path.exists(os.path.join(path, 'partition')):
+                # /sys/class/block/<part> links to .../block/<disk>/<part>
+                disk = os.path.basename(
+                    os.path.dirname(os.path.realpath(path)))
+                slaves.insert(0, disk)
+                partitions.add(name)
+            elif not slaves and os.path.exists(os.path.join(path,
+                                                            'device')):
+                self._physical.add(name)
+
+            self._slaves[name] = slaves
+            self._holders.setdefault(name, [])
+            self._majmin[name] = _read(os.path.join(path, 'dev'))
+            dm_name = _read(os.path.join(path, 'dm', 'name'))
+            if dm_name:
+                self._aliases[dm_name] = name
+
+        for name, slaves in self._slaves.items():
+            for slave in slaves:
+                self._holders.setdefault(slave, []).append(name)
+
+        if not self._physical:
+            # no device is backed by hardware, e.g. in a container: count
+            # the bottom of the stacks
+            self._physical = set(name for name, slaves in self._slaves.items()
+                                 if not slaves and name not in partitions)
+
+    def resolve(self, name):
+        """Return the kernel name of a device, given a device-mapper name."""
+        return self._aliases.get(name, name)
+
+    def __contains__(self, name):
+        return self.resolve(name) in self._slaves
+
+    def slaves(self, name):
+        """Return the devices a device is stacked on."""
+        return list(self._slaves.get(self.resolve(name), []))
+
+    def holders(self, name):
+        """Return the devices stacked on a device, including partitions."""
+        return sorted(self._holders.get(self.resolve(name), []))
+
+    def majmin(self, name):
+        """Return the 'major:minor' number of a device."""
+        return self._majmin.get(self.resolve(name))
+
+    def physical_disks(self):
+        """Return the names of the physical disks."""
+        return set(self._physical)
+
+
+def get_block_graph():
+    """Return the BlockDeviceGraph of the host.
+
+    The graph is cached and only built again when the block devices or the
+    udev database change.
+    """
+    global _graph
+    stamp = (udev_stamp(), frozenset(_listdir(SYS_CLASS_BLOCK)))
+    graph = _graph
+    if graph is None or graph.stamp != stamp:
+        graph = _graph = BlockDeviceGraph(stamp)
+    return graph
@@ -18,13 +18,17 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+import cherrypy
 from wok.control.base import Collection
 from wok.control.base import Resource
+from wok.control.utils import model_fn
 from wok.control.utils import UrlSubNode
 from wok.plugins.gingerbase.control.cpuinfo import CPUInfo
 from wok.plugins.gingerbase.control.packagesupdate import PackagesUpdate
 from wok.plugins.gingerbase.control.packagesupdate import SwUpdateProgress
 from wok.plugins.gingerbase.control.smt import Smt
+from wok.plugins.gingerbase.hostmetrics import CONTENT_TYPE
+from wok.plugins.gingerbase.statsformat import negotiate
 
 
 HOST_ACTIVITY = {
@@ -35,6 +39,19 @@ HOST_ACTIVITY = {
     },
 }
 
+HOSTSTATS_ACTIVITY = {
+    'POST': {'burst': 'GGBHOST0005L',
+             'flightrecord': 'GGBHOST0006L'},
+}
+
+ALERTRULES_ACTIVITY = {
+    'POST': {'default': 'GGBHOST0003L'},
+}
+
+ALERTRULE_ACTIVITY = {
+    'DELETE': {'default': 'GGBHOST0004L'},
+}
+
 REPOSITORIES_ACTIVITY = {
     'POST': {'default': 'GGBREPOS0001L'},
 }
@@ -75,14 +92,165 @@ class Host(Resource):
 class HostStats(Resource):
     def __init__(self, model, id=None):
         super(HostStats, self).__init__(model, id)
+        self.admin_methods = ['POST']
+        self.burst = self.generate_action_handler_task('burst',
+                                                       ['interval',
+                                                        'duration'])
+        self.bursthistory = HostStatsBurstHistory(self.model)
+        self.flightrecord = self.generate_action_handler_task('flightrecord')
         self.history = HostStatsHistory(self.model)
+        self.stream = HostStatsStream(self.model)
+        self.metrics = HostStatsMetrics(self.model)
+        self.health = HostStatsHealth(self.model)
+        self.processes = HostStatsProcesses(self.model)
+        self.alertrules = HostStatsAlertRules(self.model)
+        self.alerts = HostStatsAlerts(self.model)
+        self.log_map = HOSTSTATS_ACTIVITY
+
+    def lookup(self):
+        # the statistics are encoded by the model, see get()
+        self.info = {}
+
+    def get(self):
+        # forward the query string (e.g. ?percpu=true) to the model, which
+        # encodes each sample once for all requests
+        encoded = getattr(self.model, model_fn(self, 'encoded'))
+        stats = encoded(*self.model_args, **cherrypy.request.params)
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        return stats
+
+
+class HostStatsStream(Resource):
+    # send each event as soon as it is generated instead of buffering the
+    # whole (endless) response
+    _cp_config = {'response.stream': True}
+
+    def lookup(self):
+        # there is no resource data, only the event stream
+        self.info = {}
+
+    def get(self):
+        frames = self.model.hoststats_stream(*self.model_args,
+                                             **cherrypy.request.params)
+        cherrypy.response.headers['Content-Type'] = 'text/event-stream'
+        cherrypy.response.headers['Cache-Control'] = 'no-cache'
+        return frames
+
+
+class HostStatsHealth(Resource):
+    def lookup(self):
+        # statistics of the collector itself, provided by the stats model
+        self.info = self.model.hoststats_health(*self.model_args)
+
+    @property
+    def data(self):
+        return self.info
+
+
+class HostStatsProcesses(Resource):
+    def lookup(self):
+        # forward the count and sort parameters to the model
+        self.info = self.model.hoststatsprocesses_lookup(
+            *self.model_args, **cherrypy.request.params)
+
+    @property
+    def data(self):
+        return self.info
+
+
+class HostStatsAlertRules(Collection):
+    def __init__(self, model):
+        super(HostStatsAlertRules, self).__init__(model)
+        self.admin_methods = ['POST']
+        self.resource = HostStatsAlertRule
+
+        # set user log messages and make sure all parameters are present
+        self.log_map = ALERTRULES_ACTIVITY
+        self.log_args.update({'name': ''})
+
+
+class HostStatsAlertRule(Resource):
+    def __init__(self, model, ident):
+        super(HostStatsAlertRule, self).__init__(model, ident)
+        self.admin_methods = ['DELETE']
+        self.uri_fmt = '/host/stats/alertrules/%s'
+        self.log_map = ALERTRULE_ACTIVITY
 
     @property
     def data(self):
         return self.info
 
 
+class HostStatsAlerts(Collection):
+    def __init__(self, model):
+        super(HostStatsAlerts, self).__init__(model)
+        self.resource = HostStatsAlert
+
+
+class HostStatsAlert(Resource):
+    def __init__(self, model, ident):
+        super(HostStatsAlert, self).__init__(model, ident)
+        self.uri_fmt = '/host/stats/alerts/%s'
+
+    @property
+    def data(self):
+        return self.info
+
+
+class HostStatsMetrics(Resource):
+    def lookup(self):
+        # there is no resource data, only the text exposition
+        self.info = {}
+
+    def get(self):
+        exposition = self.model.hoststats_metrics(*self.model_args)
+        cherrypy.response.headers['Content-Type'] = CONTENT_TYPE
+        return exposition
+
+
 class HostStatsHistory(Resource):
+    def __init__(self, model, id=None):
+        super(HostStatsHistory, self).__init__(model, id)
+        self.aggregate = HostStatsAggregate(self.model)
+
+    def lookup(self):
+        # the history is encoded by the model, see get()
+        self.info = {}
+
+    def get(self):
+        # forward the query string (e.g. ?resolution=10s&window=6h) to the
+        # model, in the format selected by the Accept header: JSON or one of
+        # the columnar formats
+        media_type = negotiate(cherrypy.request.headers.get('Accept'))
+        encoded = getattr(self.model, model_fn(self, 'encoded'))
+        history = encoded(media_type, *self.model_args,
+                          **cherrypy.request.params)
+        cherrypy.response.headers['Content-Type'] = media_type
+        cherrypy.response.headers['Vary'] = 'Accept'
+        return history
+
+
+class HostStatsBurstHistory(Resource):
+    def lookup(self):
+        # the burst samples are encoded by the model, see get()
+        self.info = {}
+
+    def get(self):
+        # same formats as HostStatsHistory
+        media_type = negotiate(cherrypy.request.headers.get('Accept'))
+        encoded = getattr(self.model, model_fn(self, 'encoded'))
+        history = encoded(media_type, *self.model_args)
+        cherrypy.response.headers['Content-Type'] = media_type
+        cherrypy.response.headers['Vary'] = 'Accept'
+        return history
+
+
+class HostStatsAggregate(Resource):
+    def lookup(self):
+        # aggregates of the history, computed by the history model
+        self.info = self.model.hoststatshistory_aggregate(
+            *self.model_args, **cherrypy.request.params)
+
     @property
     def data(self):
         return self.info
@@ -26,6 +26,7 @@ from parted import Device as PDevice
 from parted import Disk as PDisk
 from wok.exception import NotFoundError
 from wok.exception import OperationFailed
+from wok.plugins.gingerbase.blockdevs import get_block_graph
 from wok.stringutils import encode_value
 from wok.utils import run_command
 from wok.utils import wok_log
@@ -90,6 +91,12 @@ def _is_dev_leaf(devNodePath, name=None, devs=None, devtype=None):
                 if encode_value(name) == dev['pkname']:
                     return False
             return True
+        if devtype == 'mpath':
+            # lsblk is known to fail on multipath devices, whose holders
+            # are known by the block device graph
+            graph = get_block_graph()
+            if name is not None and name in graph:
+                return not graph.holders(name)
         # By default, lsblk prints a device information followed by children
         # device information
         childrenCount = len(
@@ -110,15 +117,9 @@ def _is_dev_extended_partition(devType, devNodePath):
 
     if devNodePath.startswith('/dev/mapper'):
         try:
-            dev_maj_min = _get_dev_major_min(devNodePath.split('/')[-1])
-            parent_sys_path = '/sys/dev/block/' + dev_maj_min + '/slaves'
-            parent_dm_name = os.listdir(parent_sys_path)[0]
-            parent_maj_min = open(
-                parent_sys_path
-                + '/'
-                + parent_dm_name
-                + '/dev').readline().rstrip()
-            diskPath = _get_dev_node_path(parent_maj_min)
+            graph = get_block_graph()
+            parent_name = graph.slaves(devNodePath.split('/')[-1])[0]
+            diskPath = _get_dev_node_path(graph.majmin(parent_name))
         except Exception as e:
             wok_log.error(
                 'Error dealing with dev mapper device: ' + devNodePath)
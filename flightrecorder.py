@@ -0,0 +1,215 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Always-on recording of the recent host statistics, saved on incidents."""
+import glob
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+
+from wok.plugins.gingerbase.hostalerts import AlertRule
+from wok.plugins.gingerbase.hostalerts import flatten_sample
+from wok.plugins.gingerbase.hoststats import rates_history
+from wok.plugins.gingerbase.procstats import BurstRecorder
+from wok.plugins.gingerbase.procstats import monotonic
+from wok.plugins.gingerbase.procstats import PROCESS_SORT_KEYS
+from wok.plugins.gingerbase.procstats import ProcessSampler
+from wok.plugins.gingerbase.statsformat import BINARY_MEDIA_TYPE
+from wok.plugins.gingerbase.statsformat import encode
+
+# Records are named like the debug reports, 'flightrecord-<milliseconds>',
+# and saved in the same directory, so they are listed with them
+FLIGHT_RECORD_PREFIX = 'flightrecord-'
+FLIGHT_RECORD_EXTENSION = '.tar.gz'
+
+# Processes saved for each of PROCESS_SORT_KEYS
+FLIGHT_RECORD_PROCESSES = 20
+
+
+def _tarinfo(name, data, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    return info
+
+
+class FlightRecorder(object):
+    """Keep the last seconds of host statistics at a high resolution, to be
+    saved when something goes wrong.
+
+    A thread copies the CPU, disk and network counters every 'interval'
+    seconds into a BurstRecorder ring, which is only parsed when a record is
+    saved: its memory is allocated once and a sample costs three reads. The
+    processes are scanned every 'process_interval' seconds by update(), so
+    the snapshot taken when a record is saved holds their rates over at most
+    that time.
+
+    Args:
+        interval (float): time between samples, in seconds.
+        window (int): seconds of samples kept.
+        devices (callable): returns the names of the (disks, interfaces)
+            accounted by the rates, see BurstRecorder.
+        trigger (str): alert rule saving a record when it fires, see
+            hostalerts.parse_rule(), or None.
+        metrics (set): see hostalerts.parse_rule().
+        process_interval (int): seconds between process scans.
+        sampler (ProcessSampler): scanner of the processes, shared with the
+            other readers of the processes, or None to create one.
+
+    Raises:
+        ValueError: if the trigger rule is malformed.
+
+    """
+
+    def __init__(self, interval, window, devices, trigger=None, metrics=None,
+                 process_interval=10, sampler=None):
+        self.interval = interval
+        self.window = window
+        self.devices = devices
+        self.trigger = None
+        if trigger:
+            self.trigger = AlertRule('flightrecorder', trigger, metrics,
+                                     'conf')
+        self.process_interval = process_interval
+        self.sampler = sampler or ProcessSampler()
+        self._scanned = None
+        # the first sample is only the base of the rates of the second one
+        self.recorder = BurstRecorder(int(round(window / interval)) + 1,
+                                      set(), set())
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.recorder.record,
+                                        args=(interval, self._stopped, True))
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def update(self, sample, timestamp):
+        """Scan the processes if it is time to, and check the trigger rule
+        on a regular host statistics sample.
+
+        Returns:
+            bool: whether the trigger rule fired on this sample.
+
+        """
+        now = monotonic()
+        if (self._scanned is None or
+                now - self._scanned >= self.process_interval):
+            self.sampler.top(0, PROCESS_SORT_KEYS[0])
+            self._scanned = now
+
+        if self.trigger is None:
+            return False
+        alert = self.trigger.evaluate(flatten_sample(sample), timestamp)
+        return alert is not None and alert['state'] == 'firing'
+
+    def freeze(self):
+        """Return the recorded samples and a snapshot of the processes.
+
+        The recording only waits while the samples are copied, not while
+        they are parsed.
+
+        Returns:
+            tuple: a HostStatsHistory of the samples, see
+                hoststats.rates_history(), and a dictionary with the
+                'seconds' covered by the process rates and, for each of
+                PROCESS_SORT_KEYS, the FLIGHT_RECORD_PROCESSES processes
+                using the most of it, see ProcessSampler.top().
+
+        """
+        recorder = self.recorder
+        recorder.disks, recorder.interfaces = self.devices()
+        history = rates_history(recorder.rates(), recorder.samples - 1,
+                                time.time() - monotonic())
+        processes = {}
+        for key in PROCESS_SORT_KEYS:
+            processes['seconds'], processes[key] = self.sampler.top(
+                FLIGHT_RECORD_PROCESSES, key)
+        return history, processes
+
+    def save(self, path, name, reason, history=None, keep=None):
+        """Freeze the recorder and write a record.
+
+        The record is a gzipped tar archive, path/name +
+        FLIGHT_RECORD_EXTENSION, of:
+
+            record.json: the 'name' of the record, the 'reason' it was
+                saved, its 'timestamp', the 'trigger' rule, the 'interval'
+                and 'window' of the recorder and the snapshot of the
+                'processes', see freeze().
+            highres.columns: the recorded samples, in
+                statsformat.BINARY_MEDIA_TYPE.
+            history.columns: 'history', in the same format, if given.
+
+        It is written under a hidden name, then renamed, so a partial record
+        is never listed as a debug report.
+
+        Args:
+            path (str): directory of the records.
+            name (str): name of the record.
+            reason (str): why the record is saved.
+            history (dict): regular samples saved along, see
+                HostStatsArchive.arrays(), or None.
+            keep (int): number of records named FLIGHT_RECORD_PREFIX kept,
+                the oldest are removed. Renamed records are always kept.
+
+        Returns:
+            str: the path of the record.
+
+        """
+        highres, processes = self.freeze()
+        timestamp = time.time()
+        record = {'name': name,
+                  'reason': reason,
+                  'timestamp': timestamp,
+                  'trigger': self.trigger.text if self.trigger else None,
+                  'interval': self.interval,
+                  'window': self.window,
+                  'processes': processes}
+        members = [('record.json', json.dumps(record).encode('utf-8')),
+                   ('highres.columns',
+                    encode({'cursor': highres.last_seq(),
+                            'columns': highres.arrays()},
+                           BINARY_MEDIA_TYPE))]
+        if history is not None:
+            members.append(('history.columns',
+                            encode(history, BINARY_MEDIA_TYPE)))
+
+        target = os.path.join(path, name + FLIGHT_RECORD_EXTENSION)
+        partial = os.path.join(path, '.' + name + FLIGHT_RECORD_EXTENSION)
+        with tarfile.open(partial, 'w:gz') as archive:
+            for member, data in members:
+                archive.addfile(_tarinfo(member, data, timestamp),
+                                io.BytesIO(data))
+        os.rename(partial, target)
+
+        if keep:
+            # the names end with a fixed number of milliseconds
+            records = sorted(glob.glob(os.path.join(
+                path, FLIGHT_RECORD_PREFIX + '*' + FLIGHT_RECORD_EXTENSION)))
+            for old in records[:-keep]:
+                os.remove(old)
+        return target
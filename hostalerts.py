@@ -0,0 +1,397 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Threshold alerts evaluated on each host statistics sample."""
+import collections
+import json
+import operator
+import queue
+import re
+import syslog
+import threading
+import urllib.request
+
+from wok.plugins.gingerbase.hoststats import parse_duration
+from wok.utils import wok_log
+
+OPERATORS = {'>': operator.gt,
+             '>=': operator.ge,
+             '<': operator.lt,
+             '<=': operator.le}
+
+# metric operator threshold[%] [of metric] [for duration], e.g.
+# 'cpu_utilization > 90 for 5m' or 'memory.avail < 5% of memory.total'
+RULE_RE = re.compile(r'^\s*(?P<metric>[\w.]+)\s*(?P<operator>[<>]=?)\s*'
+                     r'(?P<threshold>-?[\d.]+)\s*(?P<percent>%)?'
+                     r'(?:\s+of\s+(?P<reference>[\w.]+))?'
+                     r'(?:\s+for\s+(?P<duration>\w+))?\s*$')
+
+# Alert rule names, as used in URIs and in the API.json schema
+RULE_NAME_RE = re.compile(r'^[_A-Za-z0-9-]+$')
+
+# Alerts kept in the object store: the oldest ones are removed
+ALERT_HISTORY_SIZE = 1000
+
+# Alerts waiting to be stored and sent. Alerts are dropped, and logged,
+# rather than blocking the collector when the sinks are too slow.
+ALERT_QUEUE_SIZE = 256
+
+# Seconds to wait for the webhook to answer
+WEBHOOK_TIMEOUT = 5
+
+ALERT_OBJECT_TYPE = 'hoststats_alert'
+RULE_OBJECT_TYPE = 'hoststats_alert_rule'
+
+
+def parse_rule(text, metrics=None):
+    """Parse an alert rule.
+
+    Args:
+        text (str): 'metric operator threshold [for duration]', where
+            operator is one of OPERATORS and duration accepts the units of
+            parse_duration(), e.g. 'cpu_utilization > 90 for 5m'. A
+            threshold followed by '% of metric' is relative to the value of
+            that metric in the same sample, e.g.
+            'memory.avail < 5% of memory.total'.
+        metrics (set): names of the metrics rules may use, e.g.
+            'cpu_utilization' or 'memory.avail'. Any metric if None.
+
+    Returns:
+        dict: the 'metric', 'operator', 'threshold', 'reference' metric, or
+            None, and the 'duration' the condition must last for, in
+            seconds, or 0.
+
+    Raises:
+        ValueError: if the rule is malformed or uses an unknown metric.
+
+    """
+    match = RULE_RE.match(text)
+    if match is None:
+        raise ValueError("Expected 'metric operator threshold "
+                         "[%% of metric] [for duration]': %s" % text)
+
+    rule = match.groupdict()
+    if bool(rule.pop('percent')) != bool(rule['reference']):
+        raise ValueError("A relative threshold is written "
+                         "'percent% of metric'")
+
+    rule['threshold'] = float(rule['threshold'])
+    if rule['reference']:
+        rule['threshold'] /= 100.0
+    duration = rule['duration']
+    rule['duration'] = parse_duration(duration) if duration else 0
+    for name in (rule['metric'], rule['reference']):
+        if name and metrics is not None and name not in metrics:
+            raise ValueError('Unknown metric: %s' % name)
+    return rule
+
+
+def flatten_sample(sample):
+    """Return the numeric values of a sample, indexed by metric name, with
+    the values of groups named 'group.field'."""
+    values = {}
+    for name, value in sample.items():
+        if isinstance(value, dict):
+            for field, field_value in value.items():
+                if isinstance(field_value, (int, float)):
+                    values[name + '.' + field] = field_value
+        elif isinstance(value, (int, float)):
+            values[name] = value
+    return values
+
+
+class AlertRule(object):
+    """A threshold rule and the state of its condition.
+
+    The condition is checked once per sample, in constant time and memory:
+    the rule only keeps when the condition became true and the running sum
+    and count of the values since then. The rule fires once the condition
+    has held for its duration, and resolves at the first sample where it
+    does not hold anymore.
+
+    Args:
+        name (str): name of the rule.
+        text (str): the rule, see parse_rule().
+        metrics (set): see parse_rule().
+        source (str): 'conf' for gingerbase.conf rules, 'api' for the ones
+            created over REST.
+
+    Raises:
+        ValueError: see parse_rule().
+
+    """
+
+    __slots__ = ('name', 'text', 'source', 'metric', 'operator',
+                 'threshold', 'reference', 'duration', '_compare', 'since',
+                 'count', 'total', 'fired')
+
+    def __init__(self, name, text, metrics=None, source='api'):
+        self.name = name
+        self.text = text
+        self.source = source
+        rule = parse_rule(text, metrics)
+        self.metric = rule['metric']
+        self.operator = rule['operator']
+        self.threshold = rule['threshold']
+        self.reference = rule['reference']
+        self.duration = rule['duration']
+        self._compare = OPERATORS[self.operator]
+        self.since = None
+        self.count = 0
+        self.total = 0.0
+        # time the rule fired, None while it does not fire
+        self.fired = None
+
+    def evaluate(self, values, timestamp):
+        """Check the condition on a sample.
+
+        Args:
+            values (dict): see flatten_sample().
+            timestamp (float): time of the sample, in seconds since the
+                Epoch.
+
+        Returns:
+            dict: the alert fired or resolved by this sample, see alert(),
+                or None.
+
+        """
+        value = values.get(self.metric)
+        if value is None:
+            return None
+
+        limit = self.threshold
+        if self.reference is not None:
+            limit *= values.get(self.reference, 0)
+
+        if self._compare(value, limit):
+            if self.since is None:
+                self.since = timestamp
+                self.count = 0
+                self.total = 0.0
+            self.count += 1
+            self.total += value
+            if self.fired is None and timestamp - self.since >= self.duration:
+                self.fired = timestamp
+                return self.alert('firing', timestamp)
+            return None
+
+        self.since = None
+        if self.fired is not None:
+            alert = self.alert('resolved', timestamp)
+            self.fired = None
+            return alert
+        return None
+
+    def alert(self, state, timestamp):
+        """Return the record of a fired or resolved alert.
+
+        The record has the 'id' of the alert, the name of the 'rule', its
+        'condition' and 'metric', the 'state' ('firing' or 'resolved'), the
+        mean 'value' of the metric while the condition held, and the time
+        the alert 'fired' and was 'resolved', or None, in seconds since the
+        Epoch. A resolved alert has the same id as the fired one.
+        """
+        return {'id': '%s-%d' % (self.name, int(self.fired * 1000)),
+                'rule': self.name,
+                'condition': self.text,
+                'metric': self.metric,
+                'state': state,
+                'value': self.mean(),
+                'fired': self.fired,
+                'resolved': timestamp if state == 'resolved' else None}
+
+    def mean(self):
+        """Return the mean value of the metric since the condition holds."""
+        return self.total / self.count if self.count else None
+
+    def todict(self):
+        return {'name': self.name,
+                'rule': self.text,
+                'source': self.source,
+                'state': ('firing' if self.fired is not None else
+                          'pending' if self.since is not None else
+                          'inactive')}
+
+
+class WebhookSink(object):
+    """Send each alert as a JSON document POSTed to a URL."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, alert):
+        request = urllib.request.Request(
+            self.url, json.dumps(alert).encode('utf-8'),
+            {'Content-Type': 'application/json'})
+        urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT).close()
+
+
+class SyslogSink(object):
+    """Log each alert to the local syslog daemon."""
+
+    def send(self, alert):
+        priority = (syslog.LOG_WARNING if alert['state'] == 'firing'
+                    else syslog.LOG_NOTICE)
+        syslog.syslog(priority, 'gingerbase host stats alert %s %s: %s '
+                      '(value %s)' % (alert['rule'], alert['state'],
+                                      alert['condition'], alert['value']))
+
+
+class AlertDispatcher(threading.Thread):
+    """Store and send the alerts, out of the collector thread.
+
+    The alerts are queued by send() and handled by this thread: each is
+    stored in the object store, replacing the record of the same alert when
+    it resolves, then sent to every sink. Only the last ALERT_HISTORY_SIZE
+    alerts are kept.
+
+    Args:
+        objstore (ObjectStore): store of the alerts, or None.
+        sinks (list): objects with a send(alert) method.
+
+    """
+
+    def __init__(self, objstore, sinks):
+        super(AlertDispatcher, self).__init__()
+        self.daemon = True
+        self.objstore = objstore
+        self.sinks = sinks
+        self.dropped = 0
+        self._queue = queue.Queue(ALERT_QUEUE_SIZE)
+        self._stored = None
+
+    def send(self, alert):
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+            wok_log.warning('Host statistics alert queue is full. Dropping '
+                            'alert %s', alert['id'])
+
+    def run(self):
+        while True:
+            alert = self._queue.get()
+            if self.objstore is not None:
+                try:
+                    self._store(alert)
+                except Exception as e:
+                    wok_log.error('Unable to store host statistics alert '
+                                  '%s. Error: %s', alert['id'], e.__str__())
+
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    wok_log.error('Unable to send host statistics alert %s '
+                                  'to %s. Error: %s', alert['id'],
+                                  type(sink).__name__, e.__str__())
+
+    def _store(self, alert):
+        with self.objstore as session:
+            if self._stored is None:
+                alerts = session.get_list(ALERT_OBJECT_TYPE)
+                self._stored = collections.deque(sorted(
+                    alerts, key=lambda ident: session.get(
+                        ALERT_OBJECT_TYPE, ident)['fired']))
+
+            if alert['id'] not in self._stored:
+                self._stored.append(alert['id'])
+            session.store(ALERT_OBJECT_TYPE, alert['id'], alert)
+            while len(self._stored) > ALERT_HISTORY_SIZE:
+                session.delete(ALERT_OBJECT_TYPE, self._stored.popleft(),
+                               ignore_missing=True)
+
+
+class AlertEngine(object):
+    """Evaluate the alert rules on each host statistics sample.
+
+    The set of rules is replaced as a whole when a rule is added or
+    removed, so the collector evaluates a consistent set without locking.
+
+    Args:
+        metrics (set): see parse_rule().
+        dispatcher (AlertDispatcher): receiver of the fired and resolved
+            alerts, or None.
+
+    """
+
+    def __init__(self, metrics, dispatcher=None):
+        self.metrics = metrics
+        self.dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._rules = {}
+
+    @property
+    def rules(self):
+        return self._rules
+
+    def add(self, name, text, source='api'):
+        """Add a rule.
+
+        Raises:
+            ValueError: if the name does not match RULE_NAME_RE or the rule
+                is malformed.
+            KeyError: if a rule with the same name exists.
+
+        """
+        if not RULE_NAME_RE.match(name):
+            raise ValueError('Invalid rule name: %s' % name)
+        rule = AlertRule(name, text, self.metrics, source)
+        with self._lock:
+            if name in self._rules:
+                raise KeyError(name)
+            rules = dict(self._rules)
+            rules[name] = rule
+            self._rules = rules
+        return rule
+
+    def remove(self, name):
+        """Remove a rule.
+
+        Raises:
+            KeyError: if there is no such rule.
+
+        """
+        with self._lock:
+            rules = dict(self._rules)
+            del rules[name]
+            self._rules = rules
+
+    def evaluate(self, sample, timestamp):
+        """Evaluate every rule on a sample.
+
+        Args:
+            sample (dict): the sample, as stored in the history.
+            timestamp (float): time of the sample, in seconds since the
+                Epoch.
+
+        Returns:
+            list: the alerts fired or resolved by the sample, see
+                AlertRule.alert().
+
+        """
+        values = flatten_sample(sample)
+        alerts = []
+        for rule in self._rules.values():
+            alert = rule.evaluate(values, timestamp)
+            if alert is not None:
+                alerts.append(alert)
+                if self.dispatcher is not None:
+                    self.dispatcher.send(alert)
+        return alerts
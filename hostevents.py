@@ -0,0 +1,199 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Host events, such as software updates or reboots, annotating the host
+statistics timeline."""
+import contextlib
+import operator
+import threading
+import time
+
+from wok.plugins.gingerbase.procstats import boot_time
+from wok.utils import wok_log
+
+# Events kept in the object store: the oldest ones are removed
+EVENT_HISTORY_SIZE = 1000
+
+EVENT_OBJECT_TYPE = 'hoststats_event'
+
+# Events which end when the host starts again
+RESTART_EVENTS = ('reboot', 'shutdown')
+
+_event_logs = {}
+_event_logs_lock = threading.Lock()
+
+
+def get_event_log(objstore):
+    """Return the EventLog stored in an object store, shared by the models
+    which record events and the host statistics which return them."""
+    location = getattr(objstore, 'location', None)
+    with _event_logs_lock:
+        event_log = _event_logs.get(location)
+        if event_log is None:
+            event_log = EventLog(objstore, boot_time())
+            _event_logs[location] = event_log
+        return event_log
+
+
+class EventLog(object):
+    """Log of the host events, each with a start and an end time.
+
+    An event is a dictionary with its 'id', its 'name', e.g. 'swupdate', the
+    'target' of the action, e.g. a package name, or None, the 'start' and
+    'end' times, in seconds since the Epoch, and its 'status': 'running',
+    'finished', 'failed', or 'interrupted' when Wok stopped before the event
+    ended. A running event has no end time.
+
+    The events are kept in memory, sorted by start time, and in the object
+    store, up to EVENT_HISTORY_SIZE. The list is replaced as a whole when an
+    event starts or ends, so it is read without locking.
+
+    Args:
+        objstore (ObjectStore): store of the events, or None.
+        boot_time (float): time the host started, in seconds since the
+            Epoch. The events still running at that time are ended then:
+            the reboots and shutdowns as finished, the others as
+            interrupted.
+
+    """
+
+    def __init__(self, objstore=None, boot_time=None):
+        self.objstore = objstore
+        self._lock = threading.Lock()
+        self._events = []
+        if objstore is not None:
+            with objstore as session:
+                self._events = sorted(
+                    (session.get(EVENT_OBJECT_TYPE, ident)
+                     for ident in session.get_list(EVENT_OBJECT_TYPE)),
+                    key=operator.itemgetter('start'))
+
+        if boot_time is not None:
+            for event in self._events:
+                if event['end'] is None and event['start'] < boot_time:
+                    self._end(event['id'], boot_time,
+                              'finished' if event['name'] in RESTART_EVENTS
+                              else 'interrupted')
+
+    def start(self, name, target=None):
+        """Record the start of an event.
+
+        Returns:
+            str: the id of the event, see end().
+
+        """
+        now = time.time()
+        with self._lock:
+            ids = set(event['id'] for event in self._events)
+            milliseconds = int(now * 1000)
+            while '%s-%d' % (name, milliseconds) in ids:
+                milliseconds += 1
+            event = {'id': '%s-%d' % (name, milliseconds),
+                     'name': name,
+                     'target': target,
+                     'start': now,
+                     'end': None,
+                     'status': 'running'}
+            events = sorted(self._events + [event],
+                            key=operator.itemgetter('start'))
+            removed = events[:-EVENT_HISTORY_SIZE]
+            self._events = events[-EVENT_HISTORY_SIZE:]
+        self._store(event, removed)
+        return event['id']
+
+    def end(self, ident, status='finished'):
+        """Record the end of an event, 'finished' or 'failed'."""
+        self._end(ident, time.time(), status)
+
+    def _end(self, ident, end, status):
+        with self._lock:
+            events = list(self._events)
+            for index, event in enumerate(events):
+                if event['id'] == ident:
+                    break
+            else:
+                # removed meanwhile, by newer events
+                return
+            event = dict(event, end=end, status=status)
+            events[index] = event
+            self._events = events
+        self._store(event)
+
+    def _store(self, event, removed=()):
+        if self.objstore is None:
+            return
+
+        # the event log never makes the action itself fail
+        try:
+            with self.objstore as session:
+                session.store(EVENT_OBJECT_TYPE, event['id'], event)
+                for old in removed:
+                    session.delete(EVENT_OBJECT_TYPE, old['id'],
+                                   ignore_missing=True)
+        except Exception as e:
+            wok_log.error('Unable to store host event %s. Error: %s',
+                          event['id'], e.__str__())
+
+    def between(self, start, end):
+        """Return the events which overlap the time from 'start' to 'end',
+        in seconds since the Epoch, sorted by start time."""
+        return [event for event in self._events
+                if event['start'] <= end and
+                (event['end'] is None or event['end'] >= start)]
+
+    def annotate(self, history):
+        """Add the events which overlap the samples of a history, as
+        returned by HostStatsArchive.arrays(), under its 'events' key."""
+        timestamps = dict(history['columns']).get('timestamp')
+        if timestamps:
+            history['events'] = self.between(timestamps[0], timestamps[-1])
+        else:
+            history['events'] = []
+        return history
+
+    @contextlib.contextmanager
+    def record(self, name, target=None):
+        """Record an event while the body of a with statement runs: it
+        fails if the body raises an exception."""
+        ident = self.start(name, target)
+        status = 'failed'
+        try:
+            yield
+            status = 'finished'
+        finally:
+            self.end(ident, status)
+
+    def task(self, name, function, target=None):
+        """Wrap the function of an AsyncTask, to record an event while it
+        runs. The event fails unless the function reports its success to the
+        task callback."""
+        def run(cb, opaque):
+            ident = self.start(name, target)
+            status = ['failed']
+
+            def status_cb(message, success=None):
+                if success is not None:
+                    status[0] = 'finished' if success else 'failed'
+                cb(message, success)
+
+            try:
+                return function(status_cb, opaque)
+            finally:
+                self.end(ident, status[0])
+        return run
@@ -0,0 +1,96 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Prometheus text exposition format writer."""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METRIC_PREFIX = 'gingerbase_'
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+class MetricsWriter(object):
+    """Build a Prometheus text exposition, metric family by family.
+
+    Metric names are prefixed by METRIC_PREFIX.
+    """
+
+    def __init__(self):
+        self._lines = []
+
+    def add(self, name, kind, doc, samples):
+        """Add a metric family.
+
+        Args:
+            name (str): name of the metric, without METRIC_PREFIX.
+            kind (str): 'counter' or 'gauge'.
+            doc (str): help text of the metric.
+            samples (list): (labels, value) pairs, where labels is a list of
+                (name, value) pairs, or a single value without labels.
+
+        """
+        name = METRIC_PREFIX + name
+        self._lines.append('# HELP %s %s' % (name, doc))
+        self._lines.append('# TYPE %s %s' % (name, kind))
+        if not isinstance(samples, list):
+            samples = [((), samples)]
+
+        for labels, value in samples:
+            if labels:
+                labels = ','.join('%s="%s"' % (label, _escape(label_value))
+                                  for label, label_value in labels)
+                self._lines.append('%s{%s} %s' % (name, labels,
+                                                  _format(value)))
+            else:
+                self._lines.append('%s %s' % (name, _format(value)))
+
+    def add_histogram(self, name, doc, buckets, total):
+        """Add a histogram.
+
+        Args:
+            name (str): see add().
+            doc (str): see add().
+            buckets (list): [upper bound, cumulative count] pairs, sorted by
+                upper bound. The last bound is None (+Inf).
+            total (float): sum of the observed values.
+
+        """
+        name = METRIC_PREFIX + name
+        self._lines.append('# HELP %s %s' % (name, doc))
+        self._lines.append('# TYPE %s histogram' % name)
+        for bound, count in buckets:
+            bound = '+Inf' if bound is None else _format(float(bound))
+            self._lines.append('%s_bucket{le="%s"} %s' %
+                               (name, bound, _format(count)))
+        self._lines.append('%s_sum %s' % (name, _format(float(total))))
+        self._lines.append('%s_count %s' % (name, _format(buckets[-1][1])))
+
+    def getvalue(self):
+        """Return the exposition, encoded in UTF-8."""
+        return ('\n'.join(self._lines) + '\n').encode('utf-8')
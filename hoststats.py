@@ -0,0 +1,1367 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Host statistics storage module."""
+import array
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import operator
+import os
+import threading
+import time
+
+from wok.plugins.gingerbase.statsformat import encode
+from wok.plugins.gingerbase.statsformat import JSON_MEDIA_TYPE
+
+# array.array type codes of the stored columns: 64 bits integers and floats
+INT_TYPECODE = 'q'
+FLOAT_TYPECODE = 'd'
+
+# 60 samples of HOST_STATS_INTERVAL (1 min)
+HOST_STATS_HISTORY_SIZE = 60
+
+# Memory-mapped archive file layout: a fixed-size header, which describes the
+# stored columns and tiers, followed by the ring buffers of every tier
+ARCHIVE_MAGIC = b'GGBSTATS\n'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER_SIZE = 4096
+
+# Round-robin tiers kept by default: 1s raw samples for 5 minutes, 10s
+# consolidation for 6 hours, 1 minute for 7 days and 1 hour for 1 year
+DEFAULT_STATS_TIERS = '1s:5m, 10s:6h, 1m:7d, 1h:1y'
+
+# Time span of the filesystem usage samples the time to full is forecast
+# from: 1 day, so daily cycles (e.g. log rotation) do not skew it
+FILESYSTEM_FORECAST_WINDOW = 24 * 60 * 60
+
+# Metrics watched for anomalies, with the smallest standard deviation their
+# baseline is given, so that the noise of a mostly constant metric, e.g. a
+# few writes on an idle disk, is not flagged: 1% of CPU, 64 KiB/s of I/O and
+# 100 context switches or interrupts per second
+ANOMALY_METRICS = (('cpu_utilization', 1.0),
+                   ('disk_read_rate', 65536.0),
+                   ('disk_write_rate', 65536.0),
+                   ('net_recv_rate', 65536.0),
+                   ('net_sent_rate', 65536.0),
+                   ('context_switch_rate', 100.0),
+                   ('interrupt_rate', 100.0))
+
+# Samples a baseline learns from before its deviations are flagged
+ANOMALY_WARMUP = 30
+
+# Time constant of the hour-of-day baselines: 7 days, i.e. 7 hours of
+# samples per hour of the day
+ANOMALY_SEASONAL_WINDOW = 7 * 60 * 60
+
+# Days an hour-of-day baseline must have seen before it replaces the
+# baseline of all the samples
+ANOMALY_SEASONAL_WARMUP_DAYS = 2
+
+# Percentiles returned by aggregate()
+PERCENTILES = (50, 95, 99)
+
+DURATION_UNITS = {'s': 1,
+                  'm': 60,
+                  'h': 60 * 60,
+                  'd': 24 * 60 * 60,
+                  'w': 7 * 24 * 60 * 60,
+                  'y': 365 * 24 * 60 * 60}
+
+MEMORY_FIELDS = ('total', 'free', 'cached', 'buffers', 'avail', 'swap_total',
+                 'swap_free', 'hugepages_total', 'hugepages_free',
+                 'anon_hugepages')
+
+# Paging activity: bytes swapped in and out per second, and major page
+# faults and transparent hugepage allocations (on fault and by collapsing
+# pages) per second
+PAGING_COLUMNS = (('paging.swap_in_rate', INT_TYPECODE),
+                  ('paging.swap_out_rate', INT_TYPECODE),
+                  ('paging.major_fault_rate', FLOAT_TYPECODE),
+                  ('paging.thp_fault_rate', FLOAT_TYPECODE),
+                  ('paging.thp_collapse_rate', FLOAT_TYPECODE))
+
+# Breakdown of the CPU time, as percent of the host CPU time. 'user' does
+# not include the 'guest' time, unlike in /proc/stat.
+CPU_STATES = ('user', 'system', 'iowait', 'irq', 'softirq', 'steal', 'guest')
+
+# Load averages and run queue
+LOAD_COLUMNS = (('load.avg1', FLOAT_TYPECODE),
+                ('load.avg5', FLOAT_TYPECODE),
+                ('load.avg15', FLOAT_TYPECODE),
+                ('load.running', INT_TYPECODE),
+                ('load.blocked', INT_TYPECODE))
+
+# Pressure Stall Information: percent of the time some or all tasks were
+# stalled on each resource
+PRESSURE_FIELDS = ('cpu_some', 'cpu_full', 'memory_some', 'memory_full',
+                   'io_some', 'io_full')
+
+STATS_COLUMNS = (('cpu_utilization', FLOAT_TYPECODE),
+                 ('disk_read_rate', INT_TYPECODE),
+                 ('disk_write_rate', INT_TYPECODE),
+                 ('net_recv_rate', INT_TYPECODE),
+                 ('net_sent_rate', INT_TYPECODE),
+                 ('context_switch_rate', INT_TYPECODE),
+                 ('interrupt_rate', INT_TYPECODE))
+
+# Columns identifying each stored sample: a sequence number, which increases
+# by one for every sample stored in a tier, and the sample time
+SAMPLE_COLUMNS = (('seq', INT_TYPECODE),
+                  ('timestamp', FLOAT_TYPECODE))
+
+# Columns of the burst samples, see procstats.BurstRecorder
+BURST_COLUMNS = SAMPLE_COLUMNS + STATS_COLUMNS
+
+# Every stored column: the sample identification, the flat metrics, the
+# memory fields, the paging activity, the CPU states, the load, the
+# pressure and the anomalies. Columns named 'group.field' are returned as a
+# 'group' dictionary per sample.
+COLUMNS = (SAMPLE_COLUMNS + STATS_COLUMNS +
+           tuple(('memory.' + field, INT_TYPECODE)
+                 for field in MEMORY_FIELDS) +
+           PAGING_COLUMNS +
+           tuple(('cpu.' + state, FLOAT_TYPECODE) for state in CPU_STATES) +
+           LOAD_COLUMNS +
+           tuple(('pressure.' + field, FLOAT_TYPECODE)
+                 for field in PRESSURE_FIELDS) +
+           tuple(('anomaly.' + metric, FLOAT_TYPECODE)
+                 for metric, _ in ANOMALY_METRICS))
+
+
+def percpu_columns(cpus):
+    """Return the columns of the utilization of each CPU, as percent.
+
+    They are returned as a 'percpu' dictionary, indexed by CPU name (e.g.
+    'cpu0'), and are only stored by the raw tiers. See HostStatsArchive.
+    """
+    return tuple(('percpu.cpu%d' % cpu, FLOAT_TYPECODE)
+                 for cpu in range(cpus))
+
+
+def numa_columns(nodes):
+    """Return the columns of the free memory of each NUMA node, in bytes.
+
+    They are returned as a 'numa' dictionary, indexed by node name (e.g.
+    'node0'), and, like percpu_columns(), are only stored by the raw tiers.
+    """
+    return tuple(('numa.' + node, INT_TYPECODE) for node in nodes)
+
+
+def parse_duration(value):
+    """Convert a duration to seconds.
+
+    Args:
+        value (str|int): a number of seconds or a number followed by one of
+            the DURATION_UNITS suffixes, e.g. '10s', '5m' or '1y'.
+
+    Returns:
+        int: the duration in seconds.
+
+    Raises:
+        ValueError: if value is not a positive duration.
+
+    """
+    value = str(value).strip().lower()
+    unit = 1
+    if value and value[-1] in DURATION_UNITS:
+        unit = DURATION_UNITS[value[-1]]
+        value = value[:-1]
+
+    seconds = int(value) * unit
+    if seconds <= 0:
+        raise ValueError('Duration must be greater than 0')
+    return seconds
+
+
+def parse_tiers(value):
+    """Parse the stats_tiers option of gingerbase.conf.
+
+    Args:
+        value (str|list): comma separated (or list of) 'step:retention'
+            entries, e.g. '1s:5m, 10s:6h'.
+
+    Returns:
+        List[tuple]: (step, size) pairs sorted by step, where size is the
+            number of consolidated samples kept for the tier.
+
+    Raises:
+        ValueError: if an entry is malformed.
+
+    """
+    if isinstance(value, (list, tuple)):
+        entries = value
+    else:
+        entries = str(value).split(',')
+
+    tiers = {}
+    for entry in entries:
+        step, retention = entry.split(':')
+        step = parse_duration(step)
+        retention = parse_duration(retention)
+        if retention < step:
+            raise ValueError('Tier retention must not be smaller than step')
+        tiers[step] = retention // step
+
+    if not tiers:
+        raise ValueError('At least one tier must be configured')
+    return sorted(tiers.items())
+
+
+def _percentile(ordered, percent):
+    """Return a percentile of sorted values, interpolating between them."""
+    rank = (len(ordered) - 1) * percent / 100.0
+    low = int(rank)
+    if low + 1 >= len(ordered):
+        return float(ordered[low])
+    return ordered[low] + (ordered[low + 1] - ordered[low]) * (rank - low)
+
+
+def aggregate(values, timestamps):
+    """Summarize the values of a metric.
+
+    The values are processed by builtins iterating over the arrays in C,
+    without Python loops.
+
+    Args:
+        values (array.array): values of the metric, from the oldest to the
+            newest.
+        timestamps (array.array): time of each value, in seconds.
+
+    Returns:
+        dict: the 'min', 'max', 'mean' and PERCENTILES (e.g. 'p95') of the
+            values, and the 'rate' of change of the metric, in units per
+            second, which is the slope of the least squares line of the
+            values over time. Values are None without samples.
+
+    """
+    count = len(values)
+    if not count:
+        result = dict.fromkeys(['min', 'max', 'mean', 'rate'])
+        result.update(('p%d' % percent, None) for percent in PERCENTILES)
+        return result
+
+    mean = math.fsum(values) / count
+    ordered = sorted(values)
+    result = {'min': ordered[0], 'max': ordered[-1], 'mean': mean}
+    for percent in PERCENTILES:
+        result['p%d' % percent] = _percentile(ordered, percent)
+
+    result['rate'] = _slope(values, timestamps, mean)
+    return result
+
+
+def _slope(values, timestamps, mean=None):
+    """Return the slope of the least squares line of values over time, in
+    units per second, or 0.0 without at least two distinct timestamps."""
+    count = len(values)
+    if count < 2:
+        return 0.0
+    if mean is None:
+        mean = math.fsum(values) / count
+
+    # timestamps relative to the first one, so their squares do not lose
+    # precision
+    times = array.array(FLOAT_TYPECODE, map(
+        operator.sub, timestamps, itertools.repeat(timestamps[0], count)))
+    mean_time = math.fsum(times) / count
+    variance = math.fsum(map(operator.mul, times, times)) - (
+        count * mean_time * mean_time)
+    covariance = math.fsum(map(operator.mul, times, values)) - (
+        count * mean_time * mean)
+    return covariance / variance if variance > 0 else 0.0
+
+
+def _group(name):
+    """Return the group of a column, or its name if it has no group."""
+    return name.split('.', 1)[0]
+
+
+def _flatten(sample, columns=COLUMNS):
+    """Return the metric values of a sample, in columns order."""
+    values = []
+    for name, _ in columns[len(SAMPLE_COLUMNS):]:
+        if '.' in name:
+            group, field = name.split('.')
+            values.append(sample[group][field])
+        else:
+            values.append(sample[name])
+    return values
+
+
+def _unflatten(values, names):
+    """Build a sample, or a history, from the values of the named columns."""
+    sample = {}
+    groups = {}
+    for name, value in zip(names, values):
+        if '.' in name:
+            group, field = name.split('.')
+            groups.setdefault(group, ([], []))
+            groups[group][0].append(field)
+            groups[group][1].append(value)
+        else:
+            sample[name] = value
+
+    for group, (fields, group_values) in groups.items():
+        if group_values and isinstance(group_values[0], list):
+            sample[group] = [dict(zip(fields, item))
+                             for item in zip(*group_values)]
+        else:
+            sample[group] = dict(zip(fields, group_values))
+    return sample
+
+
+class RingBuffer(object):
+    """Fixed-capacity circular buffer backed by an array.array.
+
+    The storage is allocated once, when the buffer is created. Appending to a
+    full buffer overwrites the oldest value, so the memory used by the buffer
+    never changes and no list is copied or reallocated.
+
+    The buffer can also live in memory provided by the caller, such as a
+    region of a memory-mapped file. Its position and length are then kept in
+    the first STATE_SIZE bytes of that memory, followed by the values, so the
+    buffer can be reloaded later. See nbytes().
+
+    Args:
+        capacity (int): maximum number of values kept.
+        typecode (str): array.array type code of the stored values.
+        buf (buffer): writable memory of nbytes() bytes to store the buffer
+            in.
+
+    """
+
+    STATE_SIZE = 16
+
+    def __init__(self, capacity, typecode=FLOAT_TYPECODE, buf=None):
+        if capacity < 1:
+            raise ValueError('RingBuffer capacity must be greater than 0')
+
+        self.capacity = capacity
+        self.typecode = typecode
+        if buf is None:
+            self._state = array.array(INT_TYPECODE, [0, 0])
+            self._data = array.array(typecode, [0]) * capacity
+            return
+
+        view = memoryview(buf).cast('B')
+        if len(view) != RingBuffer.nbytes(capacity, typecode):
+            raise ValueError('RingBuffer memory does not match its capacity')
+
+        self._state = view[:self.STATE_SIZE].cast(INT_TYPECODE)
+        self._data = view[self.STATE_SIZE:].cast(typecode)
+        head, count = self._state
+        if not (0 <= head < capacity and 0 <= count <= capacity):
+            # not a stored buffer: start from scratch
+            self._state[0] = self._state[1] = 0
+
+    @staticmethod
+    def nbytes(capacity, typecode):
+        """Return the memory needed to store a buffer, in bytes."""
+        itemsize = array.array(typecode).itemsize
+        return RingBuffer.STATE_SIZE + capacity * itemsize
+
+    @property
+    def _head(self):
+        return self._state[0]
+
+    @property
+    def _count(self):
+        return self._state[1]
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        """Store value, overwriting the oldest one if the buffer is full."""
+        head, count = self._state
+        self._data[head] = value
+        self._state[0] = (head + 1) % self.capacity
+        if count < self.capacity:
+            self._state[1] = count + 1
+
+    def last(self):
+        """Return the most recent value.
+
+        Raises:
+            IndexError: if the buffer is empty.
+
+        """
+        if not self._count:
+            raise IndexError('RingBuffer is empty')
+        return self._data[self._head - 1]
+
+    def tolist(self, count=None):
+        """Return the stored values ordered from the oldest to the newest.
+
+        Args:
+            count (int): return only the newest 'count' values.
+
+        Returns:
+            list: the values, as Python numbers.
+
+        """
+        start, end = self._range(count)
+        if end <= self.capacity:
+            return self._data[start:end].tolist()
+
+        return (self._data[start:].tolist() +
+                self._data[:end - self.capacity].tolist())
+
+    def toarray(self, count=None):
+        """Return the stored values ordered from the oldest to the newest.
+
+        Unlike tolist(), the values are copied as a whole into an
+        array.array, without creating a Python number for each one.
+        """
+        start, end = self._range(count)
+        if end <= self.capacity:
+            return self._array(start, end)
+
+        return self._array(start, self.capacity) + self._array(
+            0, end - self.capacity)
+
+    def _range(self, count):
+        if count is None or count > self._count:
+            count = self._count
+
+        start = (self._head - count) % self.capacity
+        return start, start + count
+
+    def _array(self, start, end):
+        values = self._data[start:end]
+        if isinstance(values, array.array):
+            return values
+        # memory-mapped buffer
+        return array.array(self.typecode, values.tobytes())
+
+
+class HostStatsHistory(object):
+    """History of host statistics, stored as one ring buffer per metric.
+
+    Grouped statistics, such as the memory fields, are kept as parallel
+    columns (one ring buffer per field) instead of one dictionary per sample.
+
+    Args:
+        size (int): number of samples kept for each metric.
+        allocate (callable): function returning the memory of each ring
+            buffer, given its size in bytes. See RingBuffer.
+        columns (tuple): (name, typecode) pairs of the stored columns,
+            starting with SAMPLE_COLUMNS.
+
+    """
+
+    def __init__(self, size=HOST_STATS_HISTORY_SIZE, allocate=None,
+                 columns=COLUMNS):
+        self.size = size
+        self.columns = columns
+        self._columns = []
+        for _, typecode in columns:
+            buf = None
+            if allocate is not None:
+                buf = allocate(RingBuffer.nbytes(size, typecode))
+            self._columns.append(RingBuffer(size, typecode, buf))
+
+    @staticmethod
+    def nbytes(size, columns=COLUMNS):
+        """Return the memory needed to store a history, in bytes."""
+        return sum(RingBuffer.nbytes(size, typecode)
+                   for _, typecode in columns)
+
+    def column(self, name):
+        """Return the RingBuffer of a column.
+
+        Raises:
+            KeyError: if there is no such column.
+
+        """
+        for (column_name, _), column in zip(self.columns, self._columns):
+            if column_name == name:
+                return column
+        raise KeyError(name)
+
+    def metrics(self, names=None):
+        """Return the names of the metric columns.
+
+        Args:
+            names (list): names of metric columns or column groups (e.g.
+                'memory'). Default is every metric column.
+
+        Raises:
+            KeyError: if a name matches no column.
+
+        """
+        metrics = [name for name, _ in self.columns[len(SAMPLE_COLUMNS):]]
+        if names is None:
+            return metrics
+
+        selected = []
+        for name in names:
+            matches = [metric for metric in metrics
+                       if metric == name or _group(metric) == name]
+            if not matches:
+                raise KeyError(name)
+            selected.extend(matches)
+        return selected
+
+    def _select(self, exclude):
+        return [(name, column)
+                for (name, _), column in zip(self.columns, self._columns)
+                if _group(name) not in exclude]
+
+    def __len__(self):
+        return min(len(column) for column in self._columns)
+
+    def append(self, sample):
+        """Store a sample, in the format returned by last()."""
+        self.append_values([sample['seq'], sample['timestamp']] +
+                           _flatten(sample, self.columns))
+
+    def append_values(self, values):
+        """Store a sample given as a list of values, in columns order."""
+        for column, value in zip(self._columns, values):
+            column.append(value)
+
+    def last(self, exclude=()):
+        """Return the most recent sample.
+
+        Args:
+            exclude (tuple): names of the columns, or column groups, left
+                out of the sample.
+
+        Raises:
+            IndexError: if no sample was stored yet.
+
+        """
+        names, columns = zip(*self._select(exclude))
+        return _unflatten([column.last() for column in columns], names)
+
+    def last_seq(self):
+        """Return the sequence number of the most recent sample, or 0."""
+        seq = self._columns[0]
+        return seq.last() if len(seq) else 0
+
+    def snapshot(self, count=None, exclude=()):
+        """Return an ordered copy of the history.
+
+        All metrics are trimmed to the same number of samples.
+
+        Args:
+            count (int): return only the newest 'count' samples.
+            exclude (tuple): see last().
+
+        Returns:
+            dict: a list of values per column, from the oldest to the newest.
+                Column groups, such as 'memory', are lists of dictionaries
+                with a key per field.
+
+        """
+        length = len(self)
+        if count is None or count > length:
+            count = length
+
+        names, columns = zip(*self._select(exclude))
+        return _unflatten([column.tolist(count) for column in columns],
+                          names)
+
+    def arrays(self, count=None, exclude=()):
+        """Return an ordered copy of the history, column by column.
+
+        Args:
+            count (int): see snapshot().
+            exclude (tuple): see last().
+
+        Returns:
+            list: (name, array.array) pairs, in columns order, with the
+                values of each column from the oldest to the newest.
+
+        """
+        length = len(self)
+        if count is None or count > length:
+            count = length
+
+        return [(name, column.toarray(count))
+                for name, column in self._select(exclude)]
+
+
+def rates_history(rates, size, offset):
+    """Store the samples of a BurstRecorder in a history.
+
+    Args:
+        rates (iterable): (time, sample) pairs, see BurstRecorder.rates().
+        size (int): number of samples kept.
+        offset (float): difference between the wall clock and the clock of
+            the samples, in seconds.
+
+    Returns:
+        HostStatsHistory: the samples, in BURST_COLUMNS, numbered from 1 and
+            timed on the wall clock.
+
+    """
+    history = HostStatsHistory(size, columns=BURST_COLUMNS)
+    for seq, (sample_time, sample) in enumerate(rates, 1):
+        sample['seq'] = seq
+        sample['timestamp'] = offset + sample_time
+        history.append(sample)
+    return history
+
+
+def _tohistory(history, exclude=()):
+    """Convert the columns returned by StatsTier.arrays() to the format of
+    StatsTier.snapshot(), leaving out the 'exclude' column groups."""
+    def unflatten(columns):
+        columns = [(name, values) for name, values in columns
+                   if _group(name) not in exclude]
+        return _unflatten([values.tolist() for _, values in columns],
+                          [name for name, _ in columns])
+
+    result = unflatten(history['columns'])
+    result['cursor'] = history['cursor']
+    if 'events' in history:
+        result['events'] = history['events']
+    for name in ('min', 'max'):
+        if name in history:
+            result[name] = unflatten(history[name])
+    return result
+
+
+class StatsTier(object):
+    """Round-robin archive of host statistics at a given resolution.
+
+    Samples are consolidated incrementally: the tier accumulates the
+    minimum, sum and maximum of every metric for the current 'step' seconds
+    bucket and only stores them when a sample from the next bucket arrives.
+    A raw tier, whose step is not larger than the collector interval, stores
+    samples as they come.
+
+    Args:
+        step (int): resolution of the tier, in seconds.
+        size (int): number of consolidated samples kept.
+        raw (bool): whether samples are stored without consolidation.
+        allocate (callable): see HostStatsHistory.
+        columns (tuple): see HostStatsHistory.
+
+    """
+
+    def __init__(self, step, size, raw=False, allocate=None,
+                 columns=COLUMNS):
+        self.step = step
+        self.size = size
+        self.raw = raw
+        self.columns = columns
+        self.avg = HostStatsHistory(size, allocate, columns)
+        if raw:
+            self.min = self.max = self.avg
+            return
+
+        self.min = HostStatsHistory(size, allocate, columns)
+        self.max = HostStatsHistory(size, allocate, columns)
+        self._bucket = None
+        self._count = 0
+        ncolumns = len(columns) - len(SAMPLE_COLUMNS)
+        self._min = [0] * ncolumns
+        self._sum = [0] * ncolumns
+        self._max = [0] * ncolumns
+
+    def add(self, sample, timestamp):
+        """Account a collected sample, taken at 'timestamp' (in seconds)."""
+        if self.raw:
+            self.avg.append_values([self.avg.last_seq() + 1, timestamp] +
+                                   _flatten(sample, self.columns))
+            return
+
+        bucket = int(timestamp // self.step)
+        if bucket != self._bucket:
+            self._flush()
+            self._bucket = bucket
+
+        values = _flatten(sample, self.columns)
+        if not self._count:
+            self._min[:] = values
+            self._sum[:] = values
+            self._max[:] = values
+        else:
+            for i, value in enumerate(values):
+                if value < self._min[i]:
+                    self._min[i] = value
+                elif value > self._max[i]:
+                    self._max[i] = value
+                self._sum[i] += value
+        self._count += 1
+
+    def _flush(self):
+        if not self._count:
+            return
+
+        # consolidated samples are identified by the start of their bucket
+        ident = [self.avg.last_seq() + 1, float(self._bucket * self.step)]
+        avg = []
+        for (_, typecode), total in zip(self.columns[len(ident):],
+                                        self._sum):
+            value = float(total) / self._count
+            avg.append(int(value + 0.5) if typecode == INT_TYPECODE
+                       else value)
+
+        self.min.append_values(ident + self._min)
+        self.avg.append_values(ident + avg)
+        self.max.append_values(ident + self._max)
+        self._count = 0
+
+    def snapshot(self, count=None, since=None, exclude=()):
+        """Return the newest consolidated samples of the tier.
+
+        Args:
+            count (int): maximum number of samples returned.
+            since (int): return only the samples whose sequence number is
+                greater than it. A value greater than the newest sequence
+                number, e.g. from before the archive was recreated, is
+                ignored.
+            exclude (tuple): see HostStatsHistory.last().
+
+        Returns:
+            dict: the average values, in the format of
+                HostStatsHistory.snapshot(), and the sequence number of the
+                newest sample under the 'cursor' key (0 if there is none), to
+                be used as 'since' on the next call. Consolidated tiers also
+                return the minimum and maximum values under the 'min' and
+                'max' keys, in the same format of the average values.
+
+        """
+        return _tohistory(self.arrays(count, since, exclude))
+
+    def arrays(self, count=None, since=None, exclude=()):
+        """Return the newest consolidated samples of the tier, column by
+        column.
+
+        Returns:
+            dict: the average values, as returned by
+                HostStatsHistory.arrays(), under 'columns', and the 'cursor',
+                'min' and 'max' keys of snapshot(), the latter two in the
+                format of the 'columns'. See snapshot() for the arguments.
+
+        """
+        cursor = self.avg.last_seq()
+        count = self._count_since(count, since)
+        history = {'cursor': cursor,
+                   'columns': self.avg.arrays(count, exclude)}
+        if not self.raw:
+            history['min'] = self.min.arrays(count, exclude)
+            history['max'] = self.max.arrays(count, exclude)
+        return history
+
+    def _count_since(self, count, since):
+        cursor = self.avg.last_seq()
+        if since is not None and since <= cursor:
+            newer = cursor - since
+            count = newer if count is None else min(count, newer)
+        return count
+
+    def aggregate(self, names=None, count=None, since=None):
+        """Summarize the newest consolidated samples of the tier.
+
+        Args:
+            names (list): see HostStatsHistory.metrics().
+            count (int): maximum number of samples summarized.
+            since (int): see snapshot().
+
+        Returns:
+            dict: the aggregate() of each metric under 'metrics'. The number
+                of samples summarized is returned under 'samples', the time
+                of the oldest and newest ones under 'start' and 'end', and
+                the sequence number of the newest sample of the tier under
+                'cursor'. For consolidated tiers, 'min' and 'max' are taken
+                from the minimum and maximum values, while the other values
+                are computed over the averages.
+
+        Raises:
+            KeyError: if a name matches no metric.
+
+        """
+        metrics = self.avg.metrics(names)
+        count = self._count_since(count, since)
+        if count is None or count > len(self.avg):
+            count = len(self.avg)
+
+        timestamps = self.avg.column('timestamp').toarray(count)
+        result = {'cursor': self.avg.last_seq(),
+                  'samples': len(timestamps),
+                  'start': timestamps[0] if count else None,
+                  'end': timestamps[-1] if count else None,
+                  'metrics': {}}
+        for name in metrics:
+            stats = aggregate(self.avg.column(name).toarray(count),
+                              timestamps)
+            if not self.raw and count:
+                stats['min'] = min(self.min.column(name).toarray(count))
+                stats['max'] = max(self.max.column(name).toarray(count))
+            result['metrics'][name] = stats
+        return result
+
+    @staticmethod
+    def nbytes(size, raw=False, columns=COLUMNS):
+        """Return the memory needed to store a tier, in bytes."""
+        return HostStatsHistory.nbytes(size, columns) * (1 if raw else 3)
+
+
+class HostStatsArchive(object):
+    """Set of StatsTier fed by the host statistics collector.
+
+    The number of samples of each tier is fixed when the archive is
+    created, so its memory use is bounded and known in advance.
+
+    When a path is given, the tiers are stored in that file, which is
+    memory-mapped: samples are written in place, without rewriting or
+    syncing the file, and the kernel writes the pages back to disk. The
+    archive survives restarts as long as the tiers and the stored metrics
+    do not change; otherwise the file is created again. Pages are only read
+    from disk when accessed, so opening a large archive is cheap.
+
+    The archive has a single writer, the collector, and is read without
+    locking by the other threads. A version counter, odd while a sample is
+    being added, tells the readers to copy the samples again when the
+    collector wrote meanwhile, so the columns they return always come from
+    the same samples.
+
+    Args:
+        tiers (List[tuple]): (step, size) pairs, as returned by parse_tiers.
+        interval (int): collector interval, in seconds.
+        path (str): file to store the archive in.
+        raw_columns (tuple): (name, typecode) pairs of additional columns
+            only stored by the raw tiers, such as percpu_columns(). They are
+            too large to be kept for long, and are not consolidated.
+
+    Raises:
+        EnvironmentError: if the file can not be created or mapped.
+
+    """
+
+    def __init__(self, tiers, interval=1, path=None, raw_columns=()):
+        self.interval = interval
+        self.path = path
+        self.raw_columns = COLUMNS + tuple(raw_columns)
+        self._version = 0
+        # serializes the writers, should requests add samples too
+        self._write_lock = threading.Lock()
+        tiers = [(step, size, step <= interval) for step, size in tiers]
+
+        allocate = None
+        if path is not None:
+            allocate = self._map(path, tiers)
+
+        self.tiers = [StatsTier(step, size, raw, allocate,
+                                self.raw_columns if raw else COLUMNS)
+                      for step, size, raw in tiers]
+
+    def _map(self, path, tiers):
+        # raw columns may be too many to be listed in the header
+        raw_columns = json.dumps(self.raw_columns[len(COLUMNS):])
+        header = json.dumps({
+            'version': ARCHIVE_VERSION,
+            'columns': COLUMNS,
+            'raw_columns': hashlib.sha1(
+                raw_columns.encode('ascii')).hexdigest(),
+            'tiers': tiers}, sort_keys=True)
+        header = (ARCHIVE_MAGIC + header.encode('ascii')).ljust(
+            ARCHIVE_HEADER_SIZE, b'\0')
+        if len(header) > ARCHIVE_HEADER_SIZE:
+            raise EnvironmentError('Too many tiers in stats archive')
+
+        size = ARCHIVE_HEADER_SIZE + sum(
+            StatsTier.nbytes(size, raw, self.raw_columns if raw else COLUMNS)
+            for _, size, raw in tiers)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            stored = os.read(fd, ARCHIVE_HEADER_SIZE)
+            if stored != header or os.fstat(fd).st_size != size:
+                # new archive or different layout: start from scratch.
+                # ftruncate() fills the file with zeros without writing them.
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, header)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        view = memoryview(self._mmap)
+        offset = [ARCHIVE_HEADER_SIZE]
+
+        def allocate(nbytes):
+            start = offset[0]
+            offset[0] += nbytes
+            return view[start:offset[0]]
+
+        return allocate
+
+    def add(self, sample, timestamp):
+        with self._write_lock:
+            self._version += 1
+            try:
+                for tier in self.tiers:
+                    tier.add(sample, timestamp)
+            finally:
+                self._version += 1
+
+    def _read(self, function, *args):
+        """Return function(*args), which copies samples of the tiers,
+        calling it again until no sample was added while it ran."""
+        while True:
+            version = self._version
+            if not version % 2:
+                result = function(*args)
+                if self._version == version:
+                    return result
+            # let the collector finish the sample
+            time.sleep(0)
+
+    def last(self, exclude=()):
+        return self.tiers[0].avg.last(exclude)
+
+    def last_seq(self):
+        return self.tiers[0].avg.last_seq()
+
+    def samples(self, since, exclude=()):
+        """Return the samples of the finest tier newer than 'since', a
+        sequence number, from the oldest to the newest, in the format of
+        last(). A 'since' greater than the newest sequence number selects
+        no sample."""
+        history = self._read(self.tiers[0].arrays, None, since, exclude)
+        if since > history['cursor']:
+            return []
+
+        names = [name for name, _ in history['columns']]
+        return [_unflatten(values, names) for values in
+                zip(*[values for _, values in history['columns']])]
+
+    def publish(self, extra=None, events=None):
+        """Return a StatsSnapshot of the newest samples of the archive.
+
+        Args:
+            extra (dict): values added to the newest sample of the snapshot,
+                which are not stored by the archive, such as the filesystem
+                usage.
+            events (EventLog): see arrays().
+
+        """
+        seq = self.last_seq()
+        sample = None
+        if seq:
+            sample = self.last()
+            if extra:
+                sample.update(extra)
+        return StatsSnapshot(seq, sample,
+                             lambda: self._published(seq, events))
+
+    def _published(self, seq, events=None):
+        """Return the default history, see arrays(), as it was when 'seq'
+        was the newest sample of the finest tier."""
+        tier = self.tiers[0]
+
+        def read():
+            newer = max(tier.avg.last_seq() - seq, 0)
+            history = tier.arrays(HOST_STATS_HISTORY_SIZE + newer)
+            if newer:
+                for name in ('columns', 'min', 'max'):
+                    if name in history:
+                        history[name] = [(column, values[:-newer])
+                                         for column, values in history[name]]
+            history['cursor'] = seq
+            return history
+
+        history = self._read(read)
+        if events is not None:
+            events.annotate(history)
+        return history
+
+    def get_tier(self, resolution=None, window=None):
+        """Select the tier that best answers a history request.
+
+        Args:
+            resolution (int): wanted resolution, in seconds. The finest tier
+                not finer than it is selected.
+            window (int): wanted time span, in seconds. Without resolution,
+                the finest tier covering the whole window is selected.
+
+        Returns:
+            StatsTier: the selected tier. The coarsest tier is returned when
+                none matches.
+
+        """
+        for tier in self.tiers:
+            if resolution is not None:
+                if tier.step >= resolution:
+                    return tier
+            elif window is None or tier.step * tier.size >= window:
+                return tier
+        return self.tiers[-1]
+
+    def snapshot(self, resolution=None, window=None, since=None,
+                 exclude=(), events=None):
+        """Return the history for the given resolution and window.
+
+        Without window and since, the last HOST_STATS_HISTORY_SIZE samples
+        of the selected tier are returned. See StatsTier.snapshot() and
+        arrays().
+        """
+        return _tohistory(self.arrays(resolution, window, since, exclude,
+                                      events))
+
+    def arrays(self, resolution=None, window=None, since=None, exclude=(),
+               events=None):
+        """Return the history selected as in snapshot(), column by column.
+
+        See StatsTier.arrays(). With an hostevents.EventLog as 'events',
+        the events which overlap the samples are returned under 'events'.
+        """
+        tier = self.get_tier(resolution, window)
+        history = self._read(tier.arrays, self._count(tier, window, since),
+                             since, exclude)
+        if events is not None:
+            events.annotate(history)
+        return history
+
+    def aggregate(self, names=None, resolution=None, window=None,
+                  since=None):
+        """Summarize the history for the given resolution and window.
+
+        The samples are selected as in snapshot(). See StatsTier.aggregate().
+        """
+        tier = self.get_tier(resolution, window)
+        result = self._read(tier.aggregate, names,
+                            self._count(tier, window, since), since)
+        result['resolution'] = tier.step
+        return result
+
+    def _count(self, tier, window, since):
+        if window is not None:
+            return -(-window // tier.step)
+        elif since is None:
+            return HOST_STATS_HISTORY_SIZE
+        return None
+
+
+class FilesystemHistory(object):
+    """Usage history of the mounted filesystems, to forecast when they fill.
+
+    The used bytes and inodes of each filesystem are kept in RingBuffers of
+    a fixed size, so the memory used by each filesystem is bounded. The
+    history of a filesystem is dropped when it is no longer mounted.
+
+    Args:
+        size (int): number of samples kept per filesystem.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        # mount point: (timestamps, used, inodes_used)
+        self._history = {}
+
+    def add(self, usage, timestamp):
+        """Store a sample.
+
+        Args:
+            usage (dict): filesystem usage, see
+                procstats.FilesystemCollector.usage().
+            timestamp (float): time of the sample, in seconds.
+
+        """
+        history = {}
+        for mount_point, fs in usage.items():
+            buffers = self._history.get(mount_point)
+            if buffers is None:
+                buffers = (RingBuffer(self.size, FLOAT_TYPECODE),
+                           RingBuffer(self.size, INT_TYPECODE),
+                           RingBuffer(self.size, INT_TYPECODE))
+            buffers[0].append(timestamp)
+            buffers[1].append(fs['used'])
+            buffers[2].append(fs['inodes_used'])
+            history[mount_point] = buffers
+        self._history = history
+
+    def forecast(self, usage):
+        """Return the usage of the filesystems with their time to full.
+
+        The growth of the used bytes and inodes is the slope of their least
+        squares line over the stored samples.
+
+        Args:
+            usage (dict): the newest filesystem usage, see add().
+
+        Returns:
+            dict: {mount point: usage}, where each usage is a copy of the
+                given one with the 'growth_rate' of the used space, in
+                bytes per second, and the 'inodes_growth_rate', in inodes
+                per second, and the seconds until the available space and
+                inodes run out at that rate, under 'full_in' and
+                'inodes_full_in'. Times to full are None when the usage
+                does not grow.
+
+        """
+        result = {}
+        for mount_point, fs in usage.items():
+            fs = dict(fs)
+            buffers = self._history.get(mount_point)
+            timestamps = buffers[0].toarray() if buffers else ()
+            for prefix, index in (('', 1), ('inodes_', 2)):
+                rate = 0.0
+                if buffers:
+                    rate = _slope(buffers[index].toarray(), timestamps)
+                fs[prefix + 'growth_rate'] = round(rate, 3)
+                fs[prefix + 'full_in'] = (int(fs[prefix + 'avail'] / rate)
+                                          if rate > 0 else None)
+            result[mount_point] = fs
+        return result
+
+
+class Baseline(object):
+    """Exponentially weighted mean and variance of a metric.
+
+    Each sample updates the baseline in constant time. Its weight depends on
+    the time elapsed since the previous sample, so the baseline forgets at
+    the same pace whatever the collector interval. The first samples are
+    averaged evenly, so the baseline does not start biased towards the
+    first one.
+
+    Args:
+        window (float): time constant, in seconds: the weight of a sample
+            is divided by e every 'window' seconds.
+        min_stddev (float): smallest standard deviation returned by
+            stddev().
+
+    """
+
+    __slots__ = ('window', 'min_stddev', 'mean', 'variance', 'count', 'day',
+                 'days')
+
+    def __init__(self, window, min_stddev):
+        self.window = window
+        self.min_stddev = min_stddev
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+        # days the baseline was updated in: the last one and their number
+        self.day = None
+        self.days = 0
+
+    def add(self, value, elapsed, day=None):
+        """Update the baseline with a sample taken 'elapsed' seconds after
+        the previous one, on 'day'."""
+        self.count += 1
+        weight = max(1 - math.exp(-elapsed / self.window), 1.0 / self.count)
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.variance = (1 - weight) * (self.variance + diff * increment)
+        if day != self.day:
+            self.day = day
+            self.days += 1
+
+    def stddev(self):
+        return max(math.sqrt(self.variance), self.min_stddev)
+
+    def score(self, value):
+        """Return the deviation of a value from the mean, in standard
+        deviations."""
+        return (value - self.mean) / self.stddev()
+
+
+class AnomalyDetector(object):
+    """Flag the samples deviating from the baseline of their metrics.
+
+    A Baseline of every metric of ANOMALY_METRICS is updated by each
+    sample. With the seasonal profile, each metric also has a Baseline per
+    hour of the day, updated by the samples of that hour only, which is
+    used instead once it has learnt from ANOMALY_SEASONAL_WARMUP_DAYS days:
+    a backup running every night is then not flagged every night.
+
+    Args:
+        window (float): time constant of the baselines, see Baseline.
+        sigma (float): deviation, in standard deviations, from which a
+            sample is flagged.
+        seasonal (bool): keep an hour-of-day profile of each metric.
+
+    """
+
+    def __init__(self, window, sigma, seasonal=False):
+        self.window = window
+        self.sigma = sigma
+        self.seasonal = seasonal
+        self._baselines = [Baseline(window, min_stddev)
+                           for _, min_stddev in ANOMALY_METRICS]
+        self._profiles = None
+        if seasonal:
+            self._profiles = [[Baseline(ANOMALY_SEASONAL_WINDOW, min_stddev)
+                               for _ in range(24)]
+                              for _, min_stddev in ANOMALY_METRICS]
+        self._timestamp = None
+
+    def update(self, sample, timestamp):
+        """Score a sample against the baselines, then add it to them.
+
+        Args:
+            sample (dict): the sample, with every metric of
+                ANOMALY_METRICS.
+            timestamp (float): time of the sample, in seconds since the
+                Epoch.
+
+        Returns:
+            dict: the deviation of each metric from its baseline, in
+                standard deviations, when it is at least 'sigma', or 0,
+                indexed by metric name. Nothing is flagged while the
+                baselines learn.
+
+        """
+        elapsed = 0.0
+        if self._timestamp is not None:
+            elapsed = max(timestamp - self._timestamp, 0.0)
+        self._timestamp = timestamp
+        hour = day = None
+        if self._profiles is not None:
+            now = time.localtime(timestamp)
+            hour = now.tm_hour
+            day = (now.tm_year, now.tm_yday)
+
+        anomalies = {}
+        for index, (metric, _) in enumerate(ANOMALY_METRICS):
+            value = sample[metric]
+            baseline = self._baselines[index]
+            reference = baseline
+            if hour is not None:
+                profile = self._profiles[index][hour]
+                if profile.days >= ANOMALY_SEASONAL_WARMUP_DAYS:
+                    reference = profile
+                profile.add(value, elapsed, day)
+
+            score = 0.0
+            if reference.count >= ANOMALY_WARMUP:
+                score = reference.score(value)
+                if abs(score) < self.sigma:
+                    score = 0.0
+            anomalies[metric] = round(score, 2)
+            baseline.add(value, elapsed)
+        return anomalies
+
+
+def _exclude(sample, exclude):
+    """Return a copy of a sample without the excluded groups."""
+    if not exclude:
+        return sample
+
+    return dict((name, value) for name, value in sample.items()
+                if name not in exclude)
+
+
+def _exclude_columns(history, exclude):
+    """Return a copy of StatsTier.arrays() without the excluded groups."""
+    if not exclude:
+        return history
+
+    history = dict(history)
+    for name in ('columns', 'min', 'max'):
+        if name in history:
+            history[name] = [(column, values)
+                             for column, values in history[name]
+                             if _group(column) not in exclude]
+    return history
+
+
+class StatsSnapshot(object):
+    """Immutable view of the newest host statistics.
+
+    The collector publishes a new snapshot after storing each sample, by
+    replacing the reference to the previous one. Readers take the current
+    reference once and use it without locking: the snapshot is never
+    modified, so its samples are consistent with each other even while the
+    collector writes the next one. The history and the encodings of its
+    contents are computed on first use and shared by every reader of the
+    snapshot, so publishing one costs nothing when nobody reads it.
+
+    Args:
+        seq (int): sequence number of the newest sample, 0 if there is none.
+        sample (dict): the newest sample, see HostStatsHistory.last().
+        load (callable): returns the default history up to the 'seq'
+            sample, see HostStatsArchive.arrays().
+
+    """
+
+    __slots__ = ('seq', '_sample', '_load', '_history', '_encoded')
+
+    def __init__(self, seq, sample, load):
+        self.seq = seq
+        self._sample = sample
+        self._load = load
+        self._history = None
+        self._encoded = {}
+
+    def _get_history(self):
+        history = self._history
+        if history is None:
+            # as for the encodings, concurrent readers may load it twice
+            history = self._history = self._load()
+        return history
+
+    def last(self, exclude=()):
+        """Return the newest sample.
+
+        Args:
+            exclude (tuple): groups of columns left out of the sample.
+
+        Raises:
+            IndexError: if no sample was stored yet.
+
+        """
+        if self._sample is None:
+            raise IndexError('No host statistics sample was stored yet')
+        return _exclude(self._sample, exclude)
+
+    def history(self, exclude=()):
+        """Return the default history, see last()."""
+        return _tohistory(self._get_history(), exclude)
+
+    def encode(self, name, exclude=(), media_type=JSON_MEDIA_TYPE):
+        """Return the encoding of last() or history().
+
+        Args:
+            name (str): 'last' or 'history'.
+            exclude (tuple): see last().
+            media_type (str): one of statsformat.MEDIA_TYPES. Only the
+                history has columnar encodings.
+
+        Returns:
+            bytes: the JSON encoding, in UTF-8, or the columnar one.
+
+        """
+        key = (name, tuple(exclude), media_type)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            # concurrent readers may encode it twice, but never see a
+            # partial value: the dictionary item is set atomically
+            if media_type == JSON_MEDIA_TYPE:
+                encoded = json.dumps(getattr(self, name)(exclude))
+                encoded = encoded.encode('utf-8')
+            else:
+                encoded = encode(_exclude_columns(self._get_history(),
+                                                  exclude),
+                                 media_type)
+            self._encoded[key] = encoded
+        return encoded
@@ -47,6 +47,36 @@ messages = {
     'GGBHOST0002E': _('Unable to reboot host machine as there are running virtual machines'),
     'GGBHOST0003E': _('There may be virtual machines running on the host'),
     'GGBHOST0005E': _('When specifying CPU topology, each element must be an integer greater than zero.'),
+    'GGBHOST0006E': _("Invalid value '%(value)s' for parameter %(param)s. It must be a positive number of seconds, "
+                      "optionally followed by one of the units s, m, h, d, w or y."),
+    'GGBHOST0007E': _("Invalid value '%(value)s' for parameter since. It must be a sequence number greater or "
+                      "equal to zero."),
+    'GGBHOST0008E': _('Host statistics streaming requires the statistics history. Enable statshistory_on in '
+                      'gingerbase.conf and restart Wok.'),
+    'GGBHOST0009E': _('Too many host statistics streams are open. Try again later.'),
+    'GGBHOST0010E': _("Invalid value '%(value)s' for parameter %(param)s. It must be true or false."),
+    'GGBHOST0011E': _("Invalid value '%(value)s' for parameter devices. It must be a comma separated list of "
+                      "device names or shell-style patterns, such as sd*,eth0."),
+    'GGBHOST0012E': _("Unknown host statistics metric '%(value)s' in parameter metrics."),
+    'GGBHOST0013E': _('Host statistics aggregation requires the statistics history. Enable statshistory_on in '
+                      'gingerbase.conf and restart Wok.'),
+    'GGBHOST0014E': _("Invalid value '%(value)s' for parameter count. It must be a number greater than 0."),
+    'GGBHOST0015E': _("Invalid value '%(value)s' for parameter sort. It must be one of: %(keys)s."),
+    'GGBHOST0016E': _("Invalid alert rule '%(rule)s'. Details: %(err)s"),
+    'GGBHOST0017E': _("Alert rule '%(name)s' already exists."),
+    'GGBHOST0018E': _("Alert rule '%(name)s' does not exist."),
+    'GGBHOST0019E': _("Alert rule '%(name)s' is defined in gingerbase.conf and can not be removed over the API."),
+    'GGBHOST0020E': _("Alert rule name must be a string of letters, digits, '_' and '-'."),
+    'GGBHOST0021E': _("Alert rule must be a string such as 'cpu_utilization > 90 for 5m'."),
+    'GGBHOST0022E': _("Burst sampling interval must be an integer between 10 and 1000 milliseconds."),
+    'GGBHOST0023E': _("Burst sampling duration must be an integer between 1 and 60 seconds."),
+    'GGBHOST0024E': _("A host statistics burst sampling is already running."),
+    'GGBHOST0025E': _("Burst sampling every %(interval)s milliseconds for %(duration)s seconds exceeds the "
+                      "limit of %(samples)d samples."),
+    'GGBHOST0026E': _("No host statistics burst sampling was recorded yet."),
+    'GGBHOST0027E': _("Host statistics flight recorder is disabled. Enable statshistory_on and "
+                      "stats_flight_recorder in gingerbase.conf and restart Wok."),
+    'GGBHOST0028E': _("A host statistics flight record is already being saved."),
 
     'GGBPKGUPD0001E': _('No packages marked for update'),
     'GGBPKGUPD0002E': _('Package %(name)s is not marked to be updated.'),
@@ -119,6 +149,10 @@ messages = {
     'GGBDR0003L': _("Remove host debug report '%(ident)s'"),
     'GGBHOST0001L': _('Reboot host'),
     'GGBHOST0002L': _('Shutdown host'),
+    'GGBHOST0003L': _("Add host statistics alert rule '%(name)s'"),
+    'GGBHOST0004L': _("Remove host statistics alert rule '%(ident)s'"),
+    'GGBHOST0005L': _('Start host statistics burst sampling'),
+    'GGBHOST0006L': _('Save host statistics flight record'),
     'GGBPKGUPD0001L': _('Update host software'),
     'GGBPKGUPD0002L': _("Update package '%(ident)s'"),
     'GGBREPOS0001L': _("Add host software repository '%(repo_id)s'"),
@@ -27,6 +27,7 @@ from wok.asynctask import AsyncTask
 from wok.objectstore import ObjectStore
 from wok.plugins.gingerbase import config
 from wok.plugins.gingerbase import swupdate
+from wok.plugins.gingerbase.hostevents import get_event_log
 from wok.plugins.gingerbase.model import cpuinfo
 from wok.plugins.gingerbase.model.debugreports import DebugReportsModel
 from wok.plugins.gingerbase.model.model import Model
@@ -83,7 +84,9 @@ class MockModel(Model):
 
     def _gen_debugreport_file(self, name):
         return AsyncTask('/plugins/gingerbase/debugreports/%s' % name,
-                         self._create_log, name).id
+                         get_event_log(self.objstore).task(
+                             'debugreport', self._create_log, name),
+                         name).id
 
     def _create_log(self, cb, name):
         path = config.get_debugreports_path()
@@ -99,9 +102,13 @@ class MockModel(Model):
 
     def _mock_host_shutdown(self, *name):
         wok_log.info('The host system will be shutted down')
+        with get_event_log(self.objstore).record('shutdown'):
+            pass
 
     def _mock_host_reboot(self, *name):
         wok_log.info('The host system will be rebooted')
+        with get_event_log(self.objstore).record('reboot'):
+            pass
 
     def _mock_packagesupdate_get_list(self):
         return self._mock_swupdate.pkgs.values()
@@ -115,13 +122,15 @@ class MockModel(Model):
     def _mock_packageupdate_upgrade(self, pkg_name):
         pkgs_list = [pkg_name] + self._mock_swupdate.deps.get(pkg_name, [])
         taskid = AsyncTask('/plugins/gingerbase/host/packagesupdate/%s/upgrade'
-                           % pkg_name, self._mock_swupdate.doUpdate,
-                           pkgs_list).id
+                           % pkg_name, get_event_log(self.objstore).task(
+                               'upgrade', self._mock_swupdate.doUpdate,
+                               pkg_name), pkgs_list).id
         return self.task_lookup(taskid)
 
     def _mock_host_swupdate(self, args=None):
         task_id = AsyncTask('/plugins/gingerbase/host/swupdate',
-                            self._mock_swupdate.doUpdate).id
+                            get_event_log(self.objstore).task(
+                                'swupdate', self._mock_swupdate.doUpdate)).id
         return self.task_lookup(task_id)
 
     def _mock_swupdateprogress_lookup(self, *name):
@@ -32,6 +32,7 @@ from wok.exception import OperationFailed
 from wok.exception import WokException
 from wok.model.tasks import TaskModel
 from wok.plugins.gingerbase import config
+from wok.plugins.gingerbase.hostevents import get_event_log
 from wok.utils import run_command
 from wok.utils import wok_log
 
@@ -40,6 +41,7 @@ class DebugReportsModel(object):
     def __init__(self, **kargs):
         self.objstore = kargs['objstore']
         self.task = TaskModel(**kargs)
+        self.events = get_event_log(self.objstore)
 
     def create(self, params):
         ident = params.get('name').strip()
@@ -66,7 +68,8 @@ class DebugReportsModel(object):
 
         if gen_cmd is not None:
             return AsyncTask('/plugins/gingerbase/debugreports/%s' % name,
-                             gen_cmd, name).id
+                             self.events.task('debugreport', gen_cmd, name),
+                             name).id
 
         raise OperationFailed('GGBDR0002E')
 
@@ -20,30 +20,117 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
 import distro
 import glob
+import json
 import os
 import platform
 import re
+import threading
 import time
-from collections import defaultdict
 
+import cherrypy
 import psutil
-from cherrypy.process.plugins import BackgroundTask
 from wok.asynctask import AsyncTask
 from wok.basemodel import Singleton
 from wok.exception import InvalidOperation
+from wok.exception import InvalidParameter
+from wok.exception import NotFoundError
 from wok.exception import OperationFailed
 from wok.model.tasks import TaskModel
+from wok.plugins.gingerbase.blockdevs import get_block_graph
 from wok.plugins.gingerbase.config import config
+from wok.plugins.gingerbase.config import get_debugreports_path
+from wok.plugins.gingerbase.config import get_stats_archive_path
+from wok.plugins.gingerbase.flightrecorder import FLIGHT_RECORD_PREFIX
+from wok.plugins.gingerbase.flightrecorder import FlightRecorder
+from wok.plugins.gingerbase.hostalerts import ALERT_OBJECT_TYPE
+from wok.plugins.gingerbase.hostalerts import AlertDispatcher
+from wok.plugins.gingerbase.hostalerts import AlertEngine
+from wok.plugins.gingerbase.hostalerts import RULE_NAME_RE
+from wok.plugins.gingerbase.hostalerts import RULE_OBJECT_TYPE
+from wok.plugins.gingerbase.hostalerts import SyslogSink
+from wok.plugins.gingerbase.hostalerts import WebhookSink
+from wok.plugins.gingerbase.hostevents import get_event_log
+from wok.plugins.gingerbase.hostmetrics import MetricsWriter
+from wok.plugins.gingerbase.hoststats import AnomalyDetector
+from wok.plugins.gingerbase.hoststats import DEFAULT_STATS_TIERS
+from wok.plugins.gingerbase.hoststats import FILESYSTEM_FORECAST_WINDOW
+from wok.plugins.gingerbase.hoststats import FilesystemHistory
+from wok.plugins.gingerbase.hoststats import HostStatsArchive
+from wok.plugins.gingerbase.hoststats import numa_columns
+from wok.plugins.gingerbase.hoststats import parse_duration
+from wok.plugins.gingerbase.hoststats import parse_tiers
+from wok.plugins.gingerbase.hoststats import percpu_columns
+from wok.plugins.gingerbase.hoststats import rates_history
+from wok.plugins.gingerbase.hoststats import SAMPLE_COLUMNS
 from wok.plugins.gingerbase.i18n import messages
 from wok.plugins.gingerbase.lscpu import LsCpu
 from wok.plugins.gingerbase.model.debugreports import DebugReportsModel
 from wok.plugins.gingerbase.model.smt import SmtModel
+from wok.plugins.gingerbase.procstats import BurstRecorder
+from wok.plugins.gingerbase.procstats import CollectorStats
+from wok.plugins.gingerbase.procstats import CounterReset
+from wok.plugins.gingerbase.procstats import CPU_TIMES
+from wok.plugins.gingerbase.procstats import DeadlineTask
+from wok.plugins.gingerbase.procstats import DISK_IO_TIME
+from wok.plugins.gingerbase.procstats import DISK_READS
+from wok.plugins.gingerbase.procstats import DISK_SECTORS_READ
+from wok.plugins.gingerbase.procstats import DISK_SECTORS_WRITTEN
+from wok.plugins.gingerbase.procstats import disk_rates
+from wok.plugins.gingerbase.procstats import DISK_WRITES
+from wok.plugins.gingerbase.procstats import FilesystemCollector
+from wok.plugins.gingerbase.procstats import HostStatsCollector
+from wok.plugins.gingerbase.procstats import monotonic
+from wok.plugins.gingerbase.procstats import NET_RX_BYTES
+from wok.plugins.gingerbase.procstats import NET_RX_DROPS
+from wok.plugins.gingerbase.procstats import NET_RX_ERRORS
+from wok.plugins.gingerbase.procstats import NET_RX_PACKETS
+from wok.plugins.gingerbase.procstats import NET_TX_BYTES
+from wok.plugins.gingerbase.procstats import NET_TX_DROPS
+from wok.plugins.gingerbase.procstats import NET_TX_ERRORS
+from wok.plugins.gingerbase.procstats import NET_TX_PACKETS
+from wok.plugins.gingerbase.procstats import net_rates
+from wok.plugins.gingerbase.procstats import PROCESS_SORT_KEYS
+from wok.plugins.gingerbase.procstats import ProcessSampler
+from wok.plugins.gingerbase.procstats import SECTOR_SIZE
+from wok.plugins.gingerbase.procstats import stall_percent
+from wok.plugins.gingerbase.statsformat import encode
+from wok.plugins.gingerbase.statsformat import JSON_MEDIA_TYPE
 from wok.plugins.gingerbase.repositories import Repositories
 from wok.plugins.gingerbase.swupdate import SoftwareUpdate
 from wok.utils import run_command
 from wok.utils import wok_log
 
 HOST_STATS_INTERVAL = 1
+# filesystems fill up slowly: their usage is collected once per minute
+HOST_STATS_FILESYSTEM_INTERVAL = 60
+# Without readers for HOST_STATS_IDLE_TIMEOUT seconds, statistics are only
+# collected every HOST_STATS_IDLE_INTERVAL seconds
+HOST_STATS_IDLE_INTERVAL = 30
+HOST_STATS_IDLE_TIMEOUT = 300
+# Samples deviating by HOST_STATS_ANOMALY_SIGMA standard deviations from a
+# baseline which forgets with a time constant of HOST_STATS_ANOMALY_WINDOW
+# seconds are flagged as anomalies
+HOST_STATS_ANOMALY_WINDOW = 600
+HOST_STATS_ANOMALY_SIGMA = 4
+# Default interval, in milliseconds, and duration, in seconds, of the burst
+# sampling. The samples of a burst are limited, as its /proc copies are kept
+# in memory until it ends.
+HOST_STATS_BURST_INTERVAL = 100
+HOST_STATS_BURST_DURATION = 10
+HOST_STATS_BURST_MAX_SAMPLES = 600
+# The flight recorder keeps the last HOST_STATS_FLIGHT_WINDOW seconds of
+# samples taken every HOST_STATS_FLIGHT_INTERVAL milliseconds, within the
+# limit of the burst samples. A record is saved HOST_STATS_FLIGHT_DELAY
+# seconds after it is requested, to cover what follows, and only the last
+# HOST_STATS_FLIGHT_KEEP records are kept.
+HOST_STATS_FLIGHT_INTERVAL = 250
+HOST_STATS_FLIGHT_WINDOW = 60
+HOST_STATS_FLIGHT_DELAY = 10
+HOST_STATS_FLIGHT_KEEP = 10
+# Each stream keeps a server thread busy, so they are limited to leave
+# threads for other requests
+HOST_STATS_STREAM_MAX_CLIENTS = 8
+HOST_STATS_STREAM_KEEPALIVE = 15
 DOM_STATE_MAP = {0: 'nostate',
                  1: 'running',
                  2: 'blocked',
@@ -69,6 +156,7 @@ class HostModel(object):
         self.objstore = kargs['objstore']
         self.task = TaskModel(**kargs)
         self.lscpu = LsCpu()
+        self.events = get_event_log(self.objstore)
 
     def _get_ppc_cpu_model(self):
         """
@@ -344,7 +432,8 @@ class HostModel(object):
 
         wok_log.debug('Host is going to be updated.')
         taskid = AsyncTask('/plugins/gingerbase/host/swupdate',
-                           swupdate.doUpdate).id
+                           self.events.task('swupdate',
+                                            swupdate.doUpdate)).id
         return self.task.lookup(taskid)
 
     def shutdown(self, args=None):
@@ -354,7 +443,7 @@ class HostModel(object):
             raise OperationFailed('GGBHOST0001E')
 
         wok_log.info('Host is going to shutdown.')
-        os.system('shutdown -h now')
+        self._restart('shutdown', 'shutdown -h now')
 
     def reboot(self, args=None):
         # Check for running vms before reboot
@@ -363,7 +452,13 @@ class HostModel(object):
             raise OperationFailed('GGBHOST0002E')
 
         wok_log.info('Host is going to reboot.')
-        os.system('reboot')
+        self._restart('reboot', 'reboot')
+
+    def _restart(self, name, command):
+        # the event ends when the host starts again, see EventLog
+        ident = self.events.start(name)
+        if os.system(command) != 0:
+            self.events.end(ident, 'failed')
 
     def get_vmlist_bystate(self, state='running'):
         try:
@@ -390,122 +485,843 @@ class HostModel(object):
             raise OperationFailed('GGBHOST0003E')
 
 
-class HostStatsModel(object):
-    __metaclass__ = Singleton
+def _get_since_param(params):
+    value = params.get('since')
+    if value is None:
+        return None
+
+    try:
+        since = int(value)
+    except ValueError:
+        since = -1
+
+    if since < 0:
+        raise InvalidParameter('GGBHOST0007E', {'value': value})
+    return since
+
+
+def _get_stats_exclude(params):
+    # the utilization of each CPU is only returned on request, as it is
+    # large on hosts with many CPUs
+    value = params.get('percpu', 'false')
+    if value.lower() not in ('true', 'false'):
+        raise InvalidParameter('GGBHOST0010E',
+                               {'param': 'percpu', 'value': value})
+    return () if value.lower() == 'true' else ('percpu',)
+
+
+def _get_devices_param(params):
+    value = params.get('devices')
+    if value is None:
+        return None
+
+    patterns = [pattern.strip() for pattern in value.split(',')]
+    if not all(patterns):
+        raise InvalidParameter('GGBHOST0011E', {'value': value})
+    return patterns
+
+
+def _stream_event(seq, data):
+    # a server-sent event, identified by the sequence number of its sample
+    return b''.join([('id: %d\ndata: ' % seq).encode('utf-8'), data,
+                     b'\n\n'])
+
+
+class HostStatsModel(object, metaclass=Singleton):
+    # one collector, archive and alert engine shared by every host
+    # statistics resource
 
     def __init__(self, **kargs):
-        self.host_stats = defaultdict(list)
+        # wall clock and monotonic() times of the last sample
+        self.timestamp = None
+        self.sample_time = None
+        # (monotonic() time, diskstats, net_dev) counters of the last two
+        # samples, to compute the per-device rates on request
+        self._device_counters = (None, None)
+        # (stat_counters, pressure totals) of the last sample
+        self._load_counters = (None, None)
+        # vmstat counters of the last sample
+        self._vm_counters = None
+        self.collector = HostStatsCollector(
+            lambda: self.nics() + self.wlans())
         gbconfig = config.get('gingerbase', {})
         self.statshistory_on = gbconfig.get('statshistory_on', True)
+        self.interval = self._get_stats_duration(
+            gbconfig, 'stats_interval', HOST_STATS_INTERVAL)
+        self.filesystem_collector = FilesystemCollector()
+        self.filesystem_interval = self._get_stats_duration(
+            gbconfig, 'stats_filesystem_interval',
+            HOST_STATS_FILESYSTEM_INTERVAL)
+        self.filesystem_history = FilesystemHistory(
+            max(FILESYSTEM_FORECAST_WINDOW // self.filesystem_interval, 2))
+        # monotonic() time and forecast of the last filesystem sample
+        self._filesystem_time = None
+        self.filesystems = {}
+        self.anomaly_detector = AnomalyDetector(
+            self._get_stats_duration(gbconfig, 'stats_anomaly_window',
+                                     HOST_STATS_ANOMALY_WINDOW),
+            self._get_stats_seconds(gbconfig, 'stats_anomaly_sigma',
+                                    HOST_STATS_ANOMALY_SIGMA),
+            str(gbconfig.get('stats_anomaly_seasonal',
+                             False)).lower() == 'true')
+        self.host_stats = self._get_stats_archive(
+            self._get_stats_tiers(gbconfig))
+        self.events = get_event_log(kargs.get('objstore'))
+        # wall clock time of the last published sample
+        self._published = None
+        # StatsSnapshot of the last sample, replaced by the collector after
+        # each sample and read without locking
+        self.stats_snapshot = self.host_stats.publish(events=self.events)
+        self.idle_interval = self._get_stats_seconds(
+            gbconfig, 'stats_idle_interval', HOST_STATS_IDLE_INTERVAL)
+        self.idle_timeout = self._get_stats_seconds(
+            gbconfig, 'stats_idle_timeout', HOST_STATS_IDLE_TIMEOUT)
+        self.last_access = 0
+        self.collector_stats = CollectorStats(self.interval)
+        self.alert_engine = self._get_alert_engine(gbconfig,
+                                                   kargs.get('objstore'))
+        self.task = TaskModel(**kargs)
+        # HostStatsHistory of the last burst sampling, see burst()
+        self.burst_history = None
+        self._burst_lock = threading.Lock()
+        self._burst_running = False
+        # FlightRecorder sampling along the collector, see below
+        self.flight_recorder = None
+        self.flight_delay = self._get_stats_seconds(
+            gbconfig, 'stats_flight_recorder_delay', HOST_STATS_FLIGHT_DELAY)
+        self.flight_keep = self._get_stats_seconds(
+            gbconfig, 'stats_flight_recorder_keep', HOST_STATS_FLIGHT_KEEP)
+        self._flight_lock = threading.Lock()
+        self._flight_saving = False
+        # Prometheus exposition of the last sample: (seq, exposition)
+        self._metrics = (None, None)
+
+        # the last sample, encoded once as a server-sent event, shared by
+        # all stream() clients
+        self._stream_cond = threading.Condition()
+        self._stream_clients = 0
+        self._stream_frame = (0, None)
 
         # create thread to collect statistcs and cache values only if
-        # statshistory_on is enabled in gingerbase.conf
+        # statshistory_on is enabled in gingerbase.conf. The flight recorder
+        # runs and stops with it.
         if self.statshistory_on:
-            self.host_stats_thread = BackgroundTask(HOST_STATS_INTERVAL,
-                                                    self.update_host_stats)
+            self.flight_recorder = self._get_flight_recorder(gbconfig)
+            self.host_stats_thread = DeadlineTask(self.interval,
+                                                  self._collect_host_stats)
             self.host_stats_thread.start()
+            cherrypy.engine.subscribe('exit', self._stop_host_stats)
 
-    def lookup(self, *name):
+    def _stop_host_stats(self):
+        self.host_stats_thread.cancel()
+        if self.flight_recorder is not None:
+            self.flight_recorder.stop()
+
+    def lookup(self, *name, **params):
+        self.last_access = monotonic()
+        exclude = _get_stats_exclude(params)
+        devices = _get_devices_param(params)
         if not self.statshistory_on:
             self.update_host_stats()
 
-        return {'cpu_utilization': self.host_stats['cpu_utilization'][-1],
-                'memory': self.host_stats['memory'][-1],
-                'disk_read_rate': self.host_stats['disk_read_rate'][-1],
-                'disk_write_rate': self.host_stats['disk_write_rate'][-1],
-                'net_recv_rate': self.host_stats['net_recv_rate'][-1],
-                'net_sent_rate': self.host_stats['net_sent_rate'][-1]}
+        stats = dict(self.stats_snapshot.last(exclude))
+        if devices is not None:
+            stats.update(self._get_device_stats(devices))
+        return stats
+
+    def encoded(self, *name, **params):
+        """
+        Return lookup() encoded in JSON. The encoding of the last sample is
+        shared by every request until the next sample is collected.
+        """
+        if _get_devices_param(params) is not None:
+            # per-device rates are computed on request
+            return json.dumps(self.lookup(*name, **params)).encode('utf-8')
+
+        self.last_access = monotonic()
+        exclude = _get_stats_exclude(params)
+        if not self.statshistory_on:
+            self.update_host_stats()
+        return self.stats_snapshot.encode('last', exclude)
+
+    def burst(self, name, interval=None, duration=None):
+        """
+        Start recording the host CPU, disk and network rates every
+        'interval' milliseconds for 'duration' seconds, in a task, besides
+        the regular samples. See BurstRecorder.
+        """
+        interval = interval or HOST_STATS_BURST_INTERVAL
+        duration = duration or HOST_STATS_BURST_DURATION
+        samples = duration * 1000 // interval
+        if samples > HOST_STATS_BURST_MAX_SAMPLES:
+            raise InvalidParameter('GGBHOST0025E',
+                                   {'interval': interval,
+                                    'duration': duration,
+                                    'samples': HOST_STATS_BURST_MAX_SAMPLES})
+
+        with self._burst_lock:
+            if self._burst_running:
+                raise InvalidOperation('GGBHOST0024E')
+            self._burst_running = True
+
+        taskid = AsyncTask('/plugins/gingerbase/host/stats/bursthistory',
+                           self._record_burst, (interval / 1000.0, samples)).id
+        return self.task.lookup(taskid)
+
+    def _record_burst(self, cb, params):
+        interval, samples = params
+        try:
+            disks, interfaces = self._get_burst_devices()
+            # everything is allocated before recording: the first sample is
+            # only the base of the rates of the second one
+            recorder = BurstRecorder(samples + 1, disks, interfaces)
+            cb('Recording %d samples' % samples)
+            recorder.record(interval)
+            # the samples are timed on the monotonic clock
+            self.burst_history = rates_history(recorder.rates(), samples,
+                                               time.time() - monotonic())
+            cb('OK', True)
+        finally:
+            self._burst_running = False
+
+    def _get_burst_devices(self):
+        # the devices accounted by the host disk and network rates
+        disks = set(name.encode('utf-8') for name in
+                    get_block_graph().physical_disks())
+        interfaces = set(name.encode('utf-8') for name in
+                         self.nics() + self.wlans())
+        return disks, interfaces
+
+    def flightrecord(self, name):
+        """
+        Save the samples of the flight recorder as a debug report, in a
+        task. See FlightRecorder.save().
+        """
+        if self.flight_recorder is None:
+            raise InvalidOperation('GGBHOST0027E')
+
+        taskid = self._save_flight_record('request')
+        if taskid is None:
+            raise InvalidOperation('GGBHOST0028E')
+        return self.task.lookup(taskid)
+
+    def _save_flight_record(self, reason):
+        # one record at a time, the recorder is shared
+        with self._flight_lock:
+            if self._flight_saving:
+                return None
+            self._flight_saving = True
+
+        name = FLIGHT_RECORD_PREFIX + str(int(time.time() * 1000))
+        try:
+            return AsyncTask('/plugins/gingerbase/debugreports/%s' % name,
+                             self._write_flight_record, (name, reason)).id
+        except Exception:
+            self._flight_saving = False
+            raise
+
+    def _write_flight_record(self, cb, params):
+        name, reason = params
+        try:
+            if self.flight_delay:
+                cb('Recording %d more seconds' % self.flight_delay)
+                time.sleep(self.flight_delay)
+            cb('Saving flight record %s' % name)
+            # the regular samples of the same time, for the metrics the
+            # recorder does not sample
+            history = self.host_stats.arrays(
+                window=self.flight_recorder.window + self.flight_delay)
+            self.flight_recorder.save(get_debugreports_path(), name, reason,
+                                      history, self.flight_keep)
+            cb('OK', True)
+        finally:
+            self._flight_saving = False
+
+    def _get_device_stats(self, patterns):
+        prev, last = self._device_counters
+        if prev is None:
+            return {'disks': {}, 'interfaces': {}}
+
+        seconds = last[0] - prev[0]
+        disks = disk_rates(prev[1], last[1], seconds, patterns)
+        # the stacking of the devices tells which ones account the same I/O
+        graph = get_block_graph()
+        physical = graph.physical_disks()
+        for name, disk in disks.items():
+            disk['physical'] = name in physical
+            disk['slaves'] = graph.slaves(name)
+            disk['holders'] = graph.holders(name)
+
+        return {'disks': disks,
+                'interfaces': net_rates(prev[2], last[2], seconds, patterns)}
+
+    def _collect_host_stats(self, now, deadline):
+        # Collect at full rate while someone is reading the statistics and
+        # slow down when nobody is. Rates are computed over the time elapsed
+        # since the previous sample, so they stay correct at any rate.
+        self.collector_stats.tick(now, deadline)
+        if (self.idle_interval and not self._stream_clients and
+                now - self.last_access > self.idle_timeout and
+                self.sample_time and
+                now - self.sample_time < self.idle_interval):
+            return
+
+        try:
+            self.update_host_stats()
+        except Exception as e:
+            # keep the collector thread alive, the next tick may succeed
+            wok_log.error('Unable to collect host statistics. Error: %s',
+                          e.__str__())
+
+    def _get_stats_tiers(self, gbconfig):
+        # without history, only the last sample is needed
+        if not self.statshistory_on:
+            return [(self.interval, 1)]
+
+        stats_tiers = gbconfig.get('stats_tiers', DEFAULT_STATS_TIERS)
+        try:
+            return parse_tiers(stats_tiers)
+        except ValueError as e:
+            wok_log.error('Invalid stats_tiers value in gingerbase.conf: '
+                          '%s. Error: %s. Using default value: %s',
+                          stats_tiers, e.__str__(), DEFAULT_STATS_TIERS)
+            return parse_tiers(DEFAULT_STATS_TIERS)
+
+    def _get_stats_duration(self, gbconfig, option, default):
+        value = gbconfig.get(option, default)
+        try:
+            return parse_duration(value)
+        except ValueError as e:
+            wok_log.error('Invalid %s value in gingerbase.conf: %s. Error: '
+                          '%s. Using default value: %d', option, value,
+                          e.__str__(), default)
+            return default
+
+    def _get_stats_seconds(self, gbconfig, option, default):
+        value = gbconfig.get(option, default)
+        try:
+            value = int(value)
+            if value < 0:
+                raise ValueError('negative value')
+            return value
+        except (TypeError, ValueError) as e:
+            wok_log.error('Invalid %s value in gingerbase.conf: %s (%s). '
+                          'Using %d.', option, value, e.__str__(), default)
+            return default
+
+    def _get_alert_engine(self, gbconfig, objstore):
+        sinks = []
+        webhook = gbconfig.get('stats_alert_webhook')
+        if webhook:
+            sinks.append(WebhookSink(webhook))
+        if str(gbconfig.get('stats_alert_syslog', False)).lower() == 'true':
+            sinks.append(SyslogSink())
+        dispatcher = AlertDispatcher(objstore, sinks)
+        dispatcher.start()
+
+        engine = AlertEngine(self._get_stats_metrics(), dispatcher)
+        rules = [(name, rule, 'conf')
+                 for name, rule in config.get('statsalerts', {}).items()]
+        if objstore is not None:
+            with objstore as session:
+                rules.extend((name, session.get(RULE_OBJECT_TYPE,
+                                                name)['rule'], 'api')
+                             for name in session.get_list(RULE_OBJECT_TYPE))
+
+        for name, rule, source in rules:
+            try:
+                engine.add(name, rule, source)
+            except (KeyError, ValueError) as e:
+                wok_log.error('Invalid host statistics alert rule %s = %s. '
+                              'Error: %s', name, rule, e.__str__())
+        return engine
+
+    def _get_stats_metrics(self):
+        # the metrics alert rules may use
+        return set(name for name, _ in
+                   self.host_stats.raw_columns[len(SAMPLE_COLUMNS):])
+
+    def _get_flight_recorder(self, gbconfig):
+        enabled = gbconfig.get('stats_flight_recorder', True)
+        if str(enabled).lower() != 'true':
+            return None
+
+        interval = self._get_stats_seconds(
+            gbconfig, 'stats_flight_recorder_interval',
+            HOST_STATS_FLIGHT_INTERVAL)
+        window = self._get_stats_duration(
+            gbconfig, 'stats_flight_recorder_window',
+            HOST_STATS_FLIGHT_WINDOW)
+        if not interval or window * 1000 // interval > \
+                HOST_STATS_BURST_MAX_SAMPLES:
+            wok_log.error('Host statistics flight recorder samples every %s '
+                          'milliseconds for %s seconds exceed the limit of '
+                          '%d samples. Using default values: %d and %d.',
+                          interval, window, HOST_STATS_BURST_MAX_SAMPLES,
+                          HOST_STATS_FLIGHT_INTERVAL, HOST_STATS_FLIGHT_WINDOW)
+            interval = HOST_STATS_FLIGHT_INTERVAL
+            window = HOST_STATS_FLIGHT_WINDOW
+
+        trigger = gbconfig.get('stats_flight_recorder_trigger')
+        # the processes are scanned by the processes resource too
+        sampler = HostStatsProcessesModel().sampler
+        try:
+            recorder = FlightRecorder(interval / 1000.0, window,
+                                      self._get_burst_devices, trigger,
+                                      self._get_stats_metrics(),
+                                      sampler=sampler)
+        except ValueError as e:
+            wok_log.error('Invalid stats_flight_recorder_trigger value in '
+                          'gingerbase.conf: %s. Error: %s. Records are only '
+                          'saved on request.', trigger, e.__str__())
+            recorder = FlightRecorder(interval / 1000.0, window,
+                                      self._get_burst_devices,
+                                      sampler=sampler)
+        recorder.start()
+        return recorder
+
+    def _get_stats_archive(self, tiers):
+        raw_columns = (percpu_columns(self.collector.cpus) +
+                       numa_columns(self.collector.nodes))
+        # keep the history on disk so it survives Wok restarts
+        if self.statshistory_on:
+            path = get_stats_archive_path()
+            try:
+                return HostStatsArchive(tiers, self.interval, path,
+                                        raw_columns)
+            except EnvironmentError as e:
+                wok_log.error('Unable to open host stats archive %s. '
+                              'Error: %s', path, e.__str__())
+
+        return HostStatsArchive(tiers, self.interval,
+                                raw_columns=raw_columns)
 
     def update_host_stats(self):
-        preTimeStamp = self.host_stats['timestamp']
+        # Rates are computed over monotonic() time, which is not affected by
+        # changes of the system clock. The samples are stored at wall clock
+        # time.
+        prev_time = self.sample_time
+        now = monotonic()
         timestamp = time.time()
-        # FIXME when we upgrade psutil, we can get uptime by psutil.uptime
-        # we get uptime by float(open("/proc/uptime").readline().split()[0])
-        # and calculate the first io_rate after the OS started.
-        with open('/proc/uptime') as time_f:
-            seconds = (timestamp - preTimeStamp if preTimeStamp else
-                       float(time_f.readline().split()[0]))
-
-        self.host_stats['timestamp'] = timestamp
-        self._get_host_disk_io_rate(seconds)
-        self._get_host_network_io_rate(seconds)
-
-        self._get_percentage_host_cpu_usage()
-        self._get_host_memory_stats()
-
-        # store only 60 stats (1 min)
-        for key, value in self.host_stats.items():
-            if isinstance(value, list):
-                if len(value) == 60:
-                    self.host_stats[key] = value[10:]
-
-    def _get_percentage_host_cpu_usage(self):
+        if prev_time is None:
+            # FIXME when we upgrade psutil, we can get uptime by
+            # psutil.uptime: the first rates are computed since the OS
+            # started
+            with open('/proc/uptime') as time_f:
+                seconds = float(time_f.readline().split()[0])
+        else:
+            seconds = now - prev_time
+
+        last = self._device_counters[1]
+        prev_diskstats, prev_net_dev = last[1:] if last else (None, None)
+        self.sample_time = now
+        self.timestamp = timestamp
+        sample = {}
+        reset = None
+        measure = self.collector_stats.measure
+        with self.collector_stats.collect():
+            with measure('disk'):
+                diskstats = self.collector.diskstats()
+                try:
+                    sample.update(self._get_host_disk_io_rate(
+                        seconds, diskstats, prev_diskstats))
+                except CounterReset as e:
+                    reset = e
+            with measure('net'):
+                net_dev = self.collector.net_dev()
+                try:
+                    sample.update(self._get_host_network_io_rate(
+                        seconds, net_dev, prev_net_dev))
+                except CounterReset as e:
+                    reset = e
+            with measure('cpu'):
+                sample.update(self._get_host_cpu_stats())
+            with measure('load'):
+                sample.update(self._get_host_load_stats(seconds))
+            with measure('memory'):
+                sample['memory'] = self._get_host_memory_stats()
+                sample['paging'] = self._get_host_paging_stats(seconds)
+                sample['numa'] = self.collector.numa()
+            # the ticks are not exactly filesystem_interval apart: tolerate
+            # half a collector interval of jitter
+            if (self._filesystem_time is None or
+                    now - self._filesystem_time >=
+                    self.filesystem_interval - self.interval / 2.0):
+                with measure('filesystems'):
+                    self._update_filesystem_stats(now, timestamp)
+
+            self._device_counters = (self._device_counters[1],
+                                     (now, diskstats, net_dev))
+            if reset is not None:
+                # the rates of this sample are meaningless, the next one is
+                # computed from the new counters
+                wok_log.warning('Dropping host statistics sample: %s',
+                                reset.__str__())
+                self.collector_stats.dropped += 1
+                return
+
+            with measure('anomalies'):
+                sample['anomaly'] = self.anomaly_detector.update(sample,
+                                                                 timestamp)
+
+            # each tier keeps a fixed number of samples, overwriting the
+            # oldest one
+            with measure('store'):
+                self.host_stats.add(sample, timestamp)
+                # the last sample carries the events since the previous one
+                events = self.events.between(self._published or timestamp,
+                                             timestamp)
+                self.stats_snapshot = self.host_stats.publish(
+                    {'filesystems': self.filesystems, 'events': events},
+                    self.events)
+                self._published = timestamp
+            with measure('alerts'):
+                self.alert_engine.evaluate(sample, timestamp)
+            if self.flight_recorder is not None:
+                with measure('flightrecorder'):
+                    if (self.flight_recorder.update(sample, timestamp) and
+                            self._save_flight_record('trigger') is None):
+                        wok_log.warning('Host statistics flight recorder '
+                                        'triggered while saving a record')
+        self._publish_host_stats()
+
+    def _update_filesystem_stats(self, now, timestamp):
+        # The filesystems are not stored by the archive: their set changes
+        # with the mounts. Their usage is kept apart, long enough to
+        # forecast when they fill up.
+        usage = self.filesystem_collector.usage()
+        self.filesystem_history.add(usage, timestamp)
+        self.filesystems = self.filesystem_history.forecast(usage)
+        self._filesystem_time = now
+
+    def _publish_host_stats(self):
+        if not self._stream_clients:
+            return
+
+        snapshot = self.stats_snapshot
+        frame = _stream_event(snapshot.seq,
+                              snapshot.encode('last', ('percpu',)))
+        with self._stream_cond:
+            self._stream_frame = (snapshot.seq, frame)
+            self._stream_cond.notify_all()
+
+    def stream(self, *name, **params):
+        """
+        Return a generator of server-sent events, one for each sample
+        collected from now on. With the 'since' parameter, the samples newer
+        than it still kept by the finest tier of the history are sent first.
+        """
+        if not self.statshistory_on:
+            raise InvalidOperation('GGBHOST0008E')
+
+        since = _get_since_param(params)
+        # counted before the newest sequence number is read, so the samples
+        # collected while the missed ones are sent are published as frames
+        with self._stream_cond:
+            if self._stream_clients >= HOST_STATS_STREAM_MAX_CLIENTS:
+                raise OperationFailed('GGBHOST0009E')
+            self._stream_clients += 1
+
+        frames = self._stream_frames(since)
+        # started up to its first yield, so that the slot is released by the
+        # generator even when it is closed before the first frame is sent
+        next(frames)
+        return frames
+
+    def _stream_frames(self, since):
+        try:
+            seq = self.stats_snapshot.seq
+            yield
+            if since is not None:
+                for frame_seq, frame in self._missed_frames(since):
+                    seq = frame_seq
+                    yield frame
+
+            while True:
+                with self._stream_cond:
+                    if self._stream_frame[0] <= seq:
+                        self._stream_cond.wait(HOST_STATS_STREAM_KEEPALIVE)
+                    frame_seq, frame = self._stream_frame
+
+                if frame_seq > seq:
+                    seq = frame_seq
+                    yield frame
+                else:
+                    # an SSE comment, to keep the connection open and to
+                    # notice clients that went away
+                    yield b': keepalive\n\n'
+        finally:
+            with self._stream_cond:
+                self._stream_clients -= 1
+
+    def _missed_frames(self, since):
+        # The samples a reconnecting client missed, read from the archive.
+        # They carry the events since the previous sample, as the published
+        # ones, but not the filesystems, which the archive does not keep.
+        prev = None
+        for sample in self.host_stats.samples(since, ('percpu',)):
+            timestamp = sample['timestamp']
+            sample['events'] = self.events.between(prev or timestamp,
+                                                   timestamp)
+            prev = timestamp
+            yield sample['seq'], _stream_event(
+                sample['seq'], json.dumps(sample).encode('utf-8'))
+
+    def metrics(self, *name):
+        """
+        Return the raw counters read by the collector and the collector
+        health in the Prometheus text exposition format. It is rendered once
+        per collected sample, however often it is requested.
+        """
+        self.last_access = monotonic()
+        if not self.statshistory_on:
+            self.update_host_stats()
+
+        seq = self.stats_snapshot.seq
+        rendered_seq, exposition = self._metrics
+        if rendered_seq != seq:
+            exposition = self._render_metrics(seq)
+            self._metrics = (seq, exposition)
+        return exposition
+
+    def health(self, *name):
+        """
+        Return the statistics of the host statistics collector itself: time
+        taken by each sub-collector, scheduling jitter and missed ticks.
+        """
+        health = self.collector_stats.todict()
+        health['stream_clients'] = self._stream_clients
+        return health
+
+    def _render_metrics(self, seq):
+        writer = MetricsWriter()
+        collector_stats = self.collector_stats.todict()
+        writer.add('stats_samples_total', 'counter',
+                   'Host statistics samples collected.', seq)
+        writer.add('stats_collection_duration_seconds', 'gauge',
+                   'Time taken to collect the last sample.',
+                   collector_stats['duration'])
+        writer.add('stats_stream_clients', 'gauge',
+                   'Open host statistics streams.', self._stream_clients)
+        writer.add('stats_ticks_total', 'counter',
+                   'Host statistics collector ticks.',
+                   collector_stats['ticks'])
+        writer.add('stats_missed_ticks_total', 'counter',
+                   'Host statistics collector ticks started one or more '
+                   'intervals late.', collector_stats['missed'])
+        writer.add('stats_samples_dropped_total', 'counter',
+                   'Host statistics samples dropped because device counters '
+                   'went backwards.', collector_stats['dropped'])
+        jitter = collector_stats['jitter']
+        writer.add_histogram('stats_tick_jitter_seconds',
+                             'Delay of the host statistics collector ticks.',
+                             jitter['buckets'], jitter['sum'])
+        collectors = sorted(collector_stats['collectors'].items())
+        writer.add('stats_collector_seconds_total', 'counter',
+                   'Wall time spent by each host statistics sub-collector.',
+                   [((('collector', name),), stats['wall_total'])
+                    for name, stats in collectors])
+        writer.add('stats_collector_cpu_seconds_total', 'counter',
+                   'CPU time spent by each host statistics sub-collector.',
+                   [((('collector', name),), stats['cpu_total'])
+                    for name, stats in collectors])
+        _, last = self._device_counters
+        if not seq or last is None:
+            return writer.getvalue()
+
+        _, diskstats, net_dev = last
+        writer.add('stats_last_sample_timestamp_seconds', 'gauge',
+                   'Time of the last sample, in seconds since the Epoch.',
+                   self.timestamp)
+
+        clock_ticks = float(os.sysconf('SC_CLK_TCK'))
+        cpu_times = self.collector.cpu_times[b'cpu']
+        writer.add('cpu_seconds_total', 'counter',
+                   'Host CPU time spent in each mode.',
+                   [((('mode', mode),), ticks / clock_ticks)
+                    for mode, ticks in zip(CPU_TIMES, cpu_times)])
+
+        sample = self.stats_snapshot.last(('percpu',))
+        writer.add('memory_bytes', 'gauge', 'Host memory statistics.',
+                   [((('field', field),), value)
+                    for field, value in sorted(sample['memory'].items())])
+
+        counters, pressure = self._load_counters
+        writer.add('context_switches_total', 'counter',
+                   'Host context switches.',
+                   counters.get('context_switches', 0))
+        writer.add('interrupts_total', 'counter', 'Host interrupts.',
+                   counters.get('interrupts', 0))
+        load = sample['load']
+        writer.add('load_average', 'gauge', 'Host load average.',
+                   [((('period', period),), load[field])
+                    for period, field in [('1m', 'avg1'), ('5m', 'avg5'),
+                                          ('15m', 'avg15')]])
+        writer.add('procs_running', 'gauge',
+                   'Tasks running or ready to run.', load['running'])
+        writer.add('procs_blocked', 'gauge', 'Tasks blocked on I/O.',
+                   load['blocked'])
+        writer.add('pressure_stalled_seconds_total', 'counter',
+                   'Time some or all tasks were stalled on each resource.',
+                   [(tuple(zip(('resource', 'kind'), name.split('_'))),
+                     total / 1000000.0)
+                    for name, total in sorted(pressure.items())])
+
+        vm_counters = self._vm_counters
+        writer.add('swap_bytes_total', 'counter',
+                   'Bytes swapped in and out.',
+                   [((('direction', direction),),
+                     vm_counters['swap_' + direction] *
+                     self.collector.page_size)
+                    for direction in ('in', 'out')])
+        writer.add('vm_events_total', 'counter',
+                   'Major page faults and transparent hugepage allocations.',
+                   [((('event', event),), vm_counters[event])
+                    for event in ('major_faults', 'thp_faults',
+                                  'thp_collapses')])
+        writer.add('numa_node_free_bytes', 'gauge',
+                   'Free memory of each NUMA node.',
+                   [((('node', node),), free)
+                    for node, free in sorted(sample.get('numa', {}).items())])
+
+        read_bytes, write_bytes = self.collector.disk_io(diskstats)
+        writer.add('disk_read_bytes_total', 'counter',
+                   'Bytes read from the physical disks.', read_bytes)
+        writer.add('disk_written_bytes_total', 'counter',
+                   'Bytes written to the physical disks.', write_bytes)
+        recv_bytes, sent_bytes = self.collector.net_io(net_dev)
+        writer.add('network_receive_bytes_total', 'counter',
+                   'Bytes received by the host NICs and WLANs.', recv_bytes)
+        writer.add('network_transmit_bytes_total', 'counter',
+                   'Bytes sent by the host NICs and WLANs.', sent_bytes)
+
+        disks = sorted((name.decode('utf-8'), counters)
+                       for name, counters in diskstats.items())
+        for metric, doc, index, scale in [
+                ('disk_device_read_bytes_total', 'Bytes read by device.',
+                 DISK_SECTORS_READ, SECTOR_SIZE),
+                ('disk_device_written_bytes_total', 'Bytes written by device.',
+                 DISK_SECTORS_WRITTEN, SECTOR_SIZE),
+                ('disk_device_reads_completed_total',
+                 'Reads completed by device.', DISK_READS, 1),
+                ('disk_device_writes_completed_total',
+                 'Writes completed by device.', DISK_WRITES, 1),
+                ('disk_device_io_time_seconds_total',
+                 'Time spent doing I/O by device.', DISK_IO_TIME, 0.001)]:
+            writer.add(metric, 'counter', doc,
+                       [((('device', name),), int(counters[index]) * scale)
+                        for name, counters in disks])
+
+        ifaces = sorted((name.decode('utf-8'), counters)
+                        for name, counters in net_dev.items())
+        for metric, doc, index in [
+                ('network_device_receive_bytes_total',
+                 'Bytes received by interface.', NET_RX_BYTES),
+                ('network_device_receive_packets_total',
+                 'Packets received by interface.', NET_RX_PACKETS),
+                ('network_device_receive_errs_total',
+                 'Receive errors by interface.', NET_RX_ERRORS),
+                ('network_device_receive_drop_total',
+                 'Received packets dropped by interface.', NET_RX_DROPS),
+                ('network_device_transmit_bytes_total',
+                 'Bytes sent by interface.', NET_TX_BYTES),
+                ('network_device_transmit_packets_total',
+                 'Packets sent by interface.', NET_TX_PACKETS),
+                ('network_device_transmit_errs_total',
+                 'Transmit errors by interface.', NET_TX_ERRORS),
+                ('network_device_transmit_drop_total',
+                 'Sent packets dropped by interface.', NET_TX_DROPS)]:
+            writer.add(metric, 'counter', doc,
+                       [((('device', name),), int(counters[index]))
+                        for name, counters in ifaces])
+
+        filesystems = sorted(self.filesystems.items())
+        for metric, doc, field in [
+                ('filesystem_size_bytes', 'Filesystem size.', 'size'),
+                ('filesystem_used_bytes', 'Filesystem space used.', 'used'),
+                ('filesystem_avail_bytes',
+                 'Filesystem space available to unprivileged users.',
+                 'avail'),
+                ('filesystem_inodes', 'Filesystem inodes.', 'inodes'),
+                ('filesystem_inodes_used', 'Filesystem inodes used.',
+                 'inodes_used')]:
+            writer.add(metric, 'gauge', doc,
+                       [((('mountpoint', mount_point),
+                          ('device', fs['device']),
+                          ('fstype', fs['type'])), fs[field])
+                        for mount_point, fs in filesystems])
+        return writer.getvalue()
+
+    def _get_host_cpu_stats(self):
         # This is cpu usage producer. This producer will calculate the usage
         # at an interval of HOST_STATS_INTERVAL.
-        # The psutil.cpu_percent works as non blocking.
-        # psutil.cpu_percent maintains a cpu time sample.
-        # It will update the cpu time sample when it is called.
-        # So only this producer can call psutil.cpu_percent in gingerbase.
-        self.host_stats['cpu_utilization'].append(psutil.cpu_percent(None))
+        # The collector keeps the cpu times of its previous call, so only
+        # this producer can call cpu in gingerbase.
+        cpu = self.collector.cpu()
+        return {'cpu_utilization': cpu['utilization'],
+                'cpu': cpu['states'],
+                'percpu': cpu['percpu']}
+
+    def _get_host_load_stats(self, seconds):
+        # The /proc/stat counters are read by _get_host_cpu_stats(). Without
+        # previous counters, the rates are computed since the OS started.
+        prev_counters, prev_pressure = self._load_counters
+        prev_counters = prev_counters or {}
+        counters = self.collector.stat_counters
+        pressure = self.collector.pressure()
+        self._load_counters = (counters, pressure)
+
+        rates = {}
+        for rate, counter in [('context_switch_rate', 'context_switches'),
+                              ('interrupt_rate', 'interrupts')]:
+            delta = counters.get(counter, 0) - prev_counters.get(counter, 0)
+            rates[rate] = int(float(max(delta, 0)) / seconds + 0.5)
+
+        rates['load'] = self.collector.load()
+        rates['pressure'] = stall_percent(prev_pressure, pressure, seconds)
+        return rates
 
     def _get_host_memory_stats(self):
-        virt_mem = psutil.virtual_memory()
-        # available:
+        # avail:
         #  the actual amount of available memory that can be given
-        #  instantly to processes that request more memory in bytes; this
-        #  is calculated by summing different memory values depending on
-        #  the platform (e.g. free + buffers + cached on Linux)
-        memory_stats = {'total': virt_mem.total,
-                        'free': virt_mem.free,
-                        'cached': virt_mem.cached,
-                        'buffers': virt_mem.buffers,
-                        'avail': virt_mem.available}
-        self.host_stats['memory'].append(memory_stats)
-
-    def _get_host_disk_io_rate(self, seconds):
-        disk_read_bytes = self.host_stats['disk_read_bytes']
-        disk_write_bytes = self.host_stats['disk_write_bytes']
-        prev_read_bytes = disk_read_bytes[-1] if disk_read_bytes else 0
-        prev_write_bytes = disk_write_bytes[-1] if disk_write_bytes else 0
-
-        disk_io = psutil.disk_io_counters(False)
-        read_bytes = disk_io.read_bytes
-        write_bytes = disk_io.write_bytes
-
-        rd_rate = int(float(read_bytes - prev_read_bytes) / seconds + 0.5)
-        wr_rate = int(float(write_bytes - prev_write_bytes) / seconds + 0.5)
-
-        self.host_stats['disk_read_rate'].append(rd_rate)
-        self.host_stats['disk_write_rate'].append(wr_rate)
-        self.host_stats['disk_read_bytes'].append(read_bytes)
-        self.host_stats['disk_write_bytes'].append(write_bytes)
-
-    def _get_host_network_io_rate(self, seconds):
-        net_recv_bytes = self.host_stats['net_recv_bytes']
-        net_sent_bytes = self.host_stats['net_sent_bytes']
-        prev_recv_bytes = net_recv_bytes[-1] if net_recv_bytes else 0
-        prev_sent_bytes = net_sent_bytes[-1] if net_sent_bytes else 0
-
-        net_ios = None
-        if hasattr(psutil, 'net_io_counters'):
-            net_ios = psutil.net_io_counters(True)
-        elif hasattr(psutil, 'network_io_counters'):
-            net_ios = psutil.network_io_counters(True)
-
-        recv_bytes = 0
-        sent_bytes = 0
-        for key in set(self.nics() +
-                       self.wlans()) & set(net_ios.keys()):
-            recv_bytes = recv_bytes + net_ios[key].bytes_recv
-            sent_bytes = sent_bytes + net_ios[key].bytes_sent
-
-        rx_rate = int(float(recv_bytes - prev_recv_bytes) / seconds + 0.5)
-        tx_rate = int(float(sent_bytes - prev_sent_bytes) / seconds + 0.5)
-
-        self.host_stats['net_recv_rate'].append(rx_rate)
-        self.host_stats['net_sent_rate'].append(tx_rate)
-        self.host_stats['net_recv_bytes'].append(recv_bytes)
-        self.host_stats['net_sent_bytes'].append(sent_bytes)
+        #  instantly to processes that request more memory in bytes
+        #  (MemAvailable or, on older kernels, free + buffers + cached)
+        return self.collector.memory()
+
+    def _get_host_paging_stats(self, seconds):
+        # Without previous counters, the rates are computed since the OS
+        # started.
+        prev = self._vm_counters or {}
+        counters = self.collector.vmstat()
+        self._vm_counters = counters
+
+        rates = {}
+        for name, counter in [('swap_in_rate', 'swap_in'),
+                              ('swap_out_rate', 'swap_out')]:
+            delta = max(counters[counter] - prev.get(counter, 0), 0)
+            rates[name] = int(float(delta * self.collector.page_size) /
+                              seconds + 0.5)
+        for name, counter in [('major_fault_rate', 'major_faults'),
+                              ('thp_fault_rate', 'thp_faults'),
+                              ('thp_collapse_rate', 'thp_collapses')]:
+            delta = max(counters[counter] - prev.get(counter, 0), 0)
+            rates[name] = round(delta / seconds, 2)
+        return rates
+
+    def _get_host_disk_io_rate(self, seconds, diskstats, prev):
+        # without previous counters, the bytes since boot are returned
+        read_bytes, write_bytes = self.collector.disk_io(diskstats, prev)
+
+        rd_rate = int(float(read_bytes) / seconds + 0.5)
+        wr_rate = int(float(write_bytes) / seconds + 0.5)
+        return {'disk_read_rate': rd_rate, 'disk_write_rate': wr_rate}
+
+    def _get_host_network_io_rate(self, seconds, net_dev, prev):
+        recv_bytes, sent_bytes = self.collector.net_io(net_dev, prev)
+
+        rx_rate = int(float(recv_bytes) / seconds + 0.5)
+        tx_rate = int(float(sent_bytes) / seconds + 0.5)
+        return {'net_recv_rate': rx_rate, 'net_sent_rate': tx_rate}
 
     def wlans(self):
         WLAN_PATH = '/sys/class/net/*/wireless'
@@ -522,17 +1338,221 @@ class HostStatsHistoryModel(object):
     def __init__(self, **kargs):
         self.history = HostStatsModel(**kargs)
 
-    def lookup(self, *name):
+    def lookup(self, *name, **params):
+        self.history.last_access = monotonic()
         if not self.history.statshistory_on:
             # return values of only one execution
-            return self.history.lookup()
-
-        return {'cpu_utilization': self.history.host_stats['cpu_utilization'],
-                'memory': self.history.host_stats['memory'],
-                'disk_read_rate': self.history.host_stats['disk_read_rate'],
-                'disk_write_rate': self.history.host_stats['disk_write_rate'],
-                'net_recv_rate': self.history.host_stats['net_recv_rate'],
-                'net_sent_rate': self.history.host_stats['net_sent_rate']}
+            return self.history.lookup(**params)
+
+        resolution = self._get_duration_param(params, 'resolution')
+        window = self._get_duration_param(params, 'window')
+        since = _get_since_param(params)
+        exclude = _get_stats_exclude(params)
+        if resolution is None and window is None and since is None:
+            return self.history.stats_snapshot.history(exclude)
+        return self.history.host_stats.snapshot(resolution, window, since,
+                                                exclude, self.history.events)
+
+    def encoded(self, media_type, *name, **params):
+        """
+        Return lookup() in one of the statsformat.MEDIA_TYPES: JSON or one
+        of the columnar formats. The encoding of the default history is
+        shared by every request until the next sample is collected.
+        """
+        history = self.history
+        default = all(params.get(param) is None
+                      for param in ('resolution', 'window', 'since'))
+        if history.statshistory_on and default:
+            history.last_access = monotonic()
+            exclude = _get_stats_exclude(params)
+            return history.stats_snapshot.encode('history', exclude,
+                                                 media_type)
+
+        if media_type == JSON_MEDIA_TYPE:
+            return json.dumps(self.lookup(*name, **params)).encode('utf-8')
+
+        history.last_access = monotonic()
+        exclude = _get_stats_exclude(params)
+        if not history.statshistory_on:
+            # the history only keeps the last sample
+            history.update_host_stats()
+            return encode(history.host_stats.arrays(exclude=exclude,
+                                                    events=history.events),
+                          media_type)
+
+        resolution = self._get_duration_param(params, 'resolution')
+        window = self._get_duration_param(params, 'window')
+        since = _get_since_param(params)
+        return encode(history.host_stats.arrays(resolution, window, since,
+                                                exclude, history.events),
+                      media_type)
+
+    def aggregate(self, *name, **params):
+        """
+        Return the min, max, mean, percentiles and rate of change of the
+        metrics in the 'metrics' parameter (a comma separated list, default
+        all), over the samples selected as in lookup().
+        """
+        self.history.last_access = monotonic()
+        if not self.history.statshistory_on:
+            raise InvalidOperation('GGBHOST0013E')
+
+        resolution = self._get_duration_param(params, 'resolution')
+        window = self._get_duration_param(params, 'window')
+        since = _get_since_param(params)
+        metrics = params.get('metrics')
+        if metrics is not None:
+            metrics = [metric.strip() for metric in metrics.split(',')]
+
+        try:
+            return self.history.host_stats.aggregate(metrics, resolution,
+                                                     window, since)
+        except KeyError as e:
+            raise InvalidParameter('GGBHOST0012E', {'value': e.args[0]})
+
+    def _get_duration_param(self, params, name):
+        value = params.get(name)
+        if value is None:
+            return None
+
+        try:
+            return parse_duration(value)
+        except ValueError:
+            raise InvalidParameter('GGBHOST0006E',
+                                   {'param': name, 'value': value})
+
+
+class HostStatsBurstHistoryModel(object):
+    def __init__(self, **kargs):
+        self.stats = HostStatsModel(**kargs)
+
+    def _get_history(self):
+        history = self.stats.burst_history
+        if history is None:
+            raise NotFoundError('GGBHOST0026E')
+        return history
+
+    def lookup(self, *name):
+        history = self._get_history()
+        result = history.snapshot()
+        result['cursor'] = history.last_seq()
+        return result
+
+    def encoded(self, media_type, *name):
+        """
+        Return the samples of the last burst sampling in one of the
+        statsformat.MEDIA_TYPES, like HostStatsHistoryModel.encoded().
+        """
+        if media_type == JSON_MEDIA_TYPE:
+            return json.dumps(self.lookup(*name)).encode('utf-8')
+
+        history = self._get_history()
+        return encode({'cursor': history.last_seq(),
+                       'columns': history.arrays()}, media_type)
+
+
+class HostStatsProcessesModel(object, metaclass=Singleton):
+    # the sampler keeps the previous scan, to compute the rates
+
+    def __init__(self, **kargs):
+        self.sampler = ProcessSampler()
+
+    def lookup(self, *name, **params):
+        """
+        Return the 'count' processes (default 10) using the most CPU time,
+        memory or I/O, as selected by the 'sort' parameter: one of
+        procstats.PROCESS_SORT_KEYS, default 'cpu'.
+        """
+        count = params.get('count', 10)
+        try:
+            count = int(count)
+        except ValueError:
+            count = 0
+        if count <= 0:
+            raise InvalidParameter('GGBHOST0014E',
+                                   {'value': params.get('count')})
+
+        key = params.get('sort', 'cpu')
+        if key not in PROCESS_SORT_KEYS:
+            raise InvalidParameter('GGBHOST0015E',
+                                   {'value': key,
+                                    'keys': ', '.join(PROCESS_SORT_KEYS)})
+
+        seconds, processes = self.sampler.top(count, key)
+        return {'seconds': seconds,
+                'sort': key,
+                'scan_duration': round(self.sampler.duration, 6),
+                'processes': processes}
+
+
+class HostStatsAlertRulesModel(object):
+    def __init__(self, **kargs):
+        self.objstore = kargs['objstore']
+        self.stats = HostStatsModel(**kargs)
+
+    def get_list(self):
+        return sorted(self.stats.alert_engine.rules)
+
+    def create(self, params):
+        name = params['name']
+        rule = params['rule']
+        if not RULE_NAME_RE.match(name):
+            raise InvalidParameter('GGBHOST0020E')
+        try:
+            self.stats.alert_engine.add(name, rule)
+        except ValueError as e:
+            raise InvalidParameter('GGBHOST0016E',
+                                   {'rule': rule, 'err': e.__str__()})
+        except KeyError:
+            raise InvalidParameter('GGBHOST0017E', {'name': name})
+
+        with self.objstore as session:
+            session.store(RULE_OBJECT_TYPE, name, {'rule': rule})
+        return name
+
+
+class HostStatsAlertRuleModel(object):
+    def __init__(self, **kargs):
+        self.objstore = kargs['objstore']
+        self.stats = HostStatsModel(**kargs)
+
+    def _get_rule(self, name):
+        rule = self.stats.alert_engine.rules.get(name)
+        if rule is None:
+            raise NotFoundError('GGBHOST0018E', {'name': name})
+        return rule
+
+    def lookup(self, name):
+        return self._get_rule(name).todict()
+
+    def delete(self, name):
+        if self._get_rule(name).source == 'conf':
+            raise InvalidOperation('GGBHOST0019E', {'name': name})
+
+        self.stats.alert_engine.remove(name)
+        with self.objstore as session:
+            session.delete(RULE_OBJECT_TYPE, name, ignore_missing=True)
+
+
+class HostStatsAlertsModel(object):
+    def __init__(self, **kargs):
+        self.objstore = kargs['objstore']
+
+    def get_list(self):
+        # newest first: alert ids end with the time they fired, in ms
+        with self.objstore as session:
+            alerts = session.get_list(ALERT_OBJECT_TYPE)
+        return sorted(alerts, key=lambda ident: int(ident.rsplit('-', 1)[1]),
+                      reverse=True)
+
+
+class HostStatsAlertModel(object):
+    def __init__(self, **kargs):
+        self.objstore = kargs['objstore']
+
+    def lookup(self, ident):
+        with self.objstore as session:
+            return session.get(ALERT_OBJECT_TYPE, ident)
 
 
 class CapabilitiesModel(object):
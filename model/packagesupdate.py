@@ -21,6 +21,7 @@
 from wok.asynctask import AsyncTask
 from wok.exception import OperationFailed
 from wok.model.tasks import TaskModel
+from wok.plugins.gingerbase.hostevents import get_event_log
 from wok.plugins.gingerbase.swupdate import SoftwareUpdate
 from wok.utils import wok_log
 
@@ -43,6 +44,7 @@ class PackageUpdateModel(object):
     def __init__(self, **kargs):
         self.task = TaskModel(**kargs)
         self.objstore = kargs['objstore']
+        self.events = get_event_log(self.objstore)
         self.pkgs2update = []
         try:
             self.host_swupdate = SoftwareUpdate()
@@ -87,8 +89,10 @@ class PackageUpdateModel(object):
         pkgs_list = self._resolve_dependencies(name)
         msg = 'The following packages will be updated: ' + ', '.join(pkgs_list)
         wok_log.debug(msg)
+        upgrade = self.events.task('upgrade', self.host_swupdate.doUpdate,
+                                   name)
         taskid = AsyncTask('/plugins/gingerbase/host/packagesupdate/%s/upgrade'
-                           % name, self.host_swupdate.doUpdate, pkgs_list).id
+                           % name, upgrade, pkgs_list).id
         return self.task.lookup(taskid)
 
 
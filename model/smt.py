@@ -25,6 +25,7 @@ import shutil
 from wok.exception import InvalidOperation
 from wok.exception import InvalidParameter
 from wok.exception import OperationFailed
+from wok.plugins.gingerbase.hostevents import get_event_log
 from wok.plugins.gingerbase.lscpu import LsCpu
 from wok.utils import run_command
 from wok.utils import wok_log
@@ -43,7 +44,7 @@ class SmtModel(object):
     _confirm_timeout = 10.0
 
     def __init__(self, **kargs):
-        pass
+        self.events = get_event_log(kargs.get('objstore'))
 
     def lookup(self, name):
         if ARCH.startswith('s390x'):
@@ -162,7 +163,8 @@ class SmtModel(object):
         Enables the SMT.
         """
         if ARCH.startswith('s390x'):
-            self.enable_smt_s390x(name, smt_val)
+            with self.events.record('smt_enable', smt_val):
+                self.enable_smt_s390x(name, smt_val)
         else:
             raise InvalidOperation('GINSMT0007E', {'name': 'enable'})
 
@@ -171,7 +173,8 @@ class SmtModel(object):
         Disables the SMT.
         """
         if ARCH.startswith('s390x'):
-            self.disable_smt_s390x(name)
+            with self.events.record('smt_disable'):
+                self.disable_smt_s390x(name)
         else:
             raise InvalidOperation('GINSMT0007E', {'name': 'disable'})
 
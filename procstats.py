@@ -0,0 +1,1280 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Low overhead host statistics collectors, reading /proc directly."""
+import array
+import fnmatch
+import heapq
+import io
+import operator
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from time import monotonic
+
+from wok.plugins.gingerbase.blockdevs import get_block_graph
+from wok.plugins.gingerbase.blockdevs import udev_stamp
+
+PROC_STAT = '/proc/stat'
+PROC_MEMINFO = '/proc/meminfo'
+PROC_VMSTAT = '/proc/vmstat'
+PROC_DISKSTATS = '/proc/diskstats'
+PROC_NET_DEV = '/proc/net/dev'
+PROC_LOADAVG = '/proc/loadavg'
+PROC_PRESSURE = '/proc/pressure'
+PROC_UPTIME = '/proc/uptime'
+PROC_MOUNTINFO = '/proc/self/mountinfo'
+PROC_FILESYSTEMS = '/proc/filesystems'
+PROC = '/proc'
+SYS_NODE = '/sys/devices/system/node'
+
+# Upper bounds, in seconds, of the scheduling jitter histogram buckets
+JITTER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# /proc/stat cpu line fields, in clock ticks
+CPU_TIMES = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+             'steal', 'guest', 'guest_nice')
+
+# /proc/stat lines following the cpu lines, by name of the counter kept
+# from each. Only the first value of a line is read: for 'intr', the total
+# of all interrupts.
+STAT_COUNTERS = {b'intr': 'interrupts',
+                 b'ctxt': 'context_switches',
+                 b'procs_running': 'running',
+                 b'procs_blocked': 'blocked'}
+
+# Resources of the Pressure Stall Information (PSI), in PROC_PRESSURE, and
+# the 'some' (at least one task stalled) and 'full' (all non-idle tasks
+# stalled) totals of each
+PSI_RESOURCES = ('cpu', 'memory', 'io')
+PSI_TOTALS = tuple('%s_%s' % (resource, kind) for resource in PSI_RESOURCES
+                   for kind in ('some', 'full'))
+
+# Seconds a ProcessSampler scan is shared by its callers
+PROCESS_SAMPLE_CACHE = 1.0
+
+# Keys ProcessSampler.top() can sort processes by
+PROCESS_SORT_KEYS = ('cpu', 'rss', 'io')
+
+# Indexes of the /proc/<pid>/stat fields following the command name
+PID_STATE = 0
+PID_UTIME = 11
+PID_STIME = 12
+PID_STARTTIME = 19
+PID_RSS = 21
+
+# Filesystem types without a backing device which FilesystemCollector still
+# reports, as they can fill up like disks
+MEMORY_FILESYSTEMS = ('tmpfs',)
+
+# /proc/diskstats always counts 512 bytes sectors
+SECTOR_SIZE = 512
+
+# Indexes of the /proc/diskstats fields following the device name
+DISK_READS = 0
+DISK_SECTORS_READ = 2
+DISK_READ_TIME = 3
+DISK_WRITES = 4
+DISK_SECTORS_WRITTEN = 6
+DISK_WRITE_TIME = 7
+DISK_IO_TIME = 9
+
+# Indexes of the /proc/net/dev fields following the interface name
+NET_RX_BYTES = 0
+NET_RX_PACKETS = 1
+NET_RX_ERRORS = 2
+NET_RX_DROPS = 3
+NET_TX_BYTES = 8
+NET_TX_PACKETS = 9
+NET_TX_ERRORS = 10
+NET_TX_DROPS = 11
+
+# /proc/meminfo fields (in kB) used by the memory statistics. Fields not
+# provided by the kernel, e.g. without swap or THP support, are 0.
+MEMINFO_FIELDS = {'total': b'MemTotal:',
+                  'free': b'MemFree:',
+                  'buffers': b'Buffers:',
+                  'cached': b'Cached:',
+                  'avail': b'MemAvailable:',
+                  'swap_total': b'SwapTotal:',
+                  'swap_free': b'SwapFree:',
+                  'anon_hugepages': b'AnonHugePages:'}
+
+# /proc/meminfo fields of the default size hugepage pool, in pages
+MEMINFO_HUGEPAGES = {'hugepages_total': b'HugePages_Total:',
+                     'hugepages_free': b'HugePages_Free:'}
+
+# /proc/vmstat counters, by name of the counter kept from each: swapped
+# pages, major page faults and transparent hugepages allocated on fault and
+# by khugepaged collapsing pages
+VMSTAT_COUNTERS = {'swap_in': b'pswpin',
+                   'swap_out': b'pswpout',
+                   'major_faults': b'pgmajfault',
+                   'thp_faults': b'thp_fault_alloc',
+                   'thp_collapses': b'thp_collapse_alloc'}
+
+
+class ProcFile(object):
+    """A /proc file kept open and read again from its beginning.
+
+    The file is opened once and every read() seeks back to offset 0 and
+    reads into the same buffer, which only grows if the file does not fit.
+    This avoids opening, closing and allocating on every read.
+
+    Args:
+        path (str): path of the file.
+        size (int): initial size of the buffer, in bytes.
+
+    """
+
+    def __init__(self, path, size=4096):
+        self.path = path
+        self._file = io.FileIO(path, 'r')
+        self._buf = bytearray(size)
+
+    def read(self):
+        """Return the current content of the file.
+
+        Returns:
+            tuple: (buffer, length). Only the first 'length' bytes of the
+                buffer are valid; its content is overwritten by the next
+                read().
+
+        """
+        self._file.seek(0)
+        length = 0
+        while True:
+            if length == len(self._buf):
+                self._buf.extend(bytearray(len(self._buf)))
+            read = self._file.readinto(memoryview(self._buf)[length:])
+            if not read:
+                return self._buf, length
+            length += read
+
+    def close(self):
+        self._file.close()
+
+
+def _lines(buf, length, start=0):
+    """Iterate over the lines of buf[start:length], without copying it."""
+    while start < length:
+        end = buf.find(b'\n', start, length)
+        if end < 0:
+            end = length
+        yield start, end
+        start = end + 1
+
+
+def _field(buf, length, key):
+    """Return the first value of the line of buf starting with key, or
+    None, without splitting the other lines."""
+    start = buf.find(key, 0, length)
+    if start < 0:
+        return None
+    if start and buf[start - 1:start] != b'\n':
+        # key found in the middle of a line, e.g. in a longer name
+        start = buf.find(b'\n' + key, 0, length) + 1
+        if not start:
+            return None
+    end = buf.find(b'\n', start, length)
+    if end < 0:
+        end = length
+    return int(buf[start + len(key):end].split()[0])
+
+
+def _percent(value, total):
+    """Return value as percent of total, rounded to one decimal."""
+    if total <= 0:
+        return 0.0
+    percent = 100.0 * value / total
+    return round(min(max(percent, 0.0), 100.0), 1)
+
+
+class HostStatsCollector(object):
+    """Collect host statistics from /proc with persistent descriptors.
+
+    Only the fields needed by the host statistics are parsed. The sets of
+    block devices and network interfaces are cached and only discovered
+    again when the devices listed by the kernel, or the udev database,
+    change.
+
+    The utilization of each possible CPU (see the 'cpus' attribute) is
+    collected as well, from the same read of /proc/stat. The CPU_TIMES read
+    by the last cpu() call are kept in the 'cpu_times' attribute, indexed by
+    CPU name (b'cpu' for the whole host), and the other STAT_COUNTERS in the
+    'stat_counters' attribute.
+
+    Args:
+        interfaces (callable): function returning the names of the network
+            interfaces accounted by net_io().
+
+    """
+
+    def __init__(self, interfaces):
+        self._interfaces = interfaces
+        self._stat = ProcFile(PROC_STAT)
+        self._meminfo = ProcFile(PROC_MEMINFO)
+        self._vmstat = ProcFile(PROC_VMSTAT, 8192)
+        self._nodes = []
+        try:
+            nodes = sorted((name for name in os.listdir(SYS_NODE)
+                            if name[:4] == 'node' and name[4:].isdigit()),
+                           key=lambda name: int(name[4:]))
+        except OSError:
+            # kernels built without NUMA support
+            nodes = []
+        for node in nodes:
+            self._nodes.append((node, ProcFile(
+                os.path.join(SYS_NODE, node, 'meminfo'))))
+        self.nodes = [node for node, _ in self._nodes]
+        self._diskstats = ProcFile(PROC_DISKSTATS, 16384)
+        self._net_dev = ProcFile(PROC_NET_DEV, 16384)
+        self._loadavg = ProcFile(PROC_LOADAVG, 256)
+        self._pressure = {}
+        for resource in PSI_RESOURCES:
+            try:
+                self._pressure[resource] = ProcFile(
+                    os.path.join(PROC_PRESSURE, resource), 256)
+            except (IOError, OSError):
+                # kernels older than 4.20 or built without PSI
+                pass
+        self.cpu_times = None
+        self.stat_counters = {}
+        self.cpus = os.sysconf('SC_NPROCESSORS_CONF')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self._cpu_names = [('cpu%d' % cpu, ('cpu%d' % cpu).encode('ascii'))
+                           for cpu in range(self.cpus)]
+        self._disks = None
+        self._disks_listed = None
+        self._disks_stamp = None
+        self._ifaces = None
+        self._ifaces_listed = None
+
+    def cpu(self):
+        """Return the CPU utilization since the previous call, as percent.
+
+        The first call returns the utilization since the host boot.
+
+        Returns:
+            dict: the host CPU 'utilization', its breakdown by CPU_STATES
+                under 'states' and the utilization of each CPU under
+                'percpu', indexed by CPU name. Offline CPUs are reported as
+                idle.
+
+        """
+        buf, length = self._stat.read()
+        times = {}
+        counters = {}
+        for start, end in _lines(buf, length):
+            # cpu lines come first: cpu user nice system idle iowait irq
+            # softirq steal guest guest_nice. guest times are also accounted
+            # in user and nice.
+            if buf[start:start + 3] == b'cpu':
+                fields = buf[start:end].split()
+                values = [int(value) for value in fields[1:11]]
+                times[bytes(fields[0])] = values + [0] * (10 - len(values))
+                continue
+
+            # 'name value ...': the intr line lists every interrupt, so it
+            # is not split
+            space = buf.find(b' ', start, end)
+            name = STAT_COUNTERS.get(bytes(buf[start:space]))
+            if name is not None:
+                value_end = buf.find(b' ', space + 1, end)
+                counters[name] = int(buf[space + 1:value_end if value_end >= 0
+                                         else end])
+
+        prev_times = self.cpu_times or {}
+        self.cpu_times = times
+        self.stat_counters = counters
+
+        host = times[b'cpu']
+        prev = prev_times.get(b'cpu', [0] * 10)
+        deltas = [value - prev_value for value, prev_value in zip(host, prev)]
+        total = sum(deltas[:8])
+        guest = deltas[8] + deltas[9]
+        states = {'user': deltas[0] + deltas[1] - guest,
+                  'system': deltas[2],
+                  'iowait': deltas[4],
+                  'irq': deltas[5],
+                  'softirq': deltas[6],
+                  'steal': deltas[7],
+                  'guest': guest}
+        cpu = {'utilization': _percent(total - deltas[3] - deltas[4], total),
+               'states': dict((state, _percent(value, total))
+                              for state, value in states.items()),
+               'percpu': {}}
+
+        for name, key in self._cpu_names:
+            if key not in times:
+                cpu['percpu'][name] = 0.0
+                continue
+            cpu_times = times[key]
+            prev = prev_times.get(key, [0] * 10)
+            total = sum(cpu_times[:8]) - sum(prev[:8])
+            idle = (cpu_times[3] + cpu_times[4]) - (prev[3] + prev[4])
+            cpu['percpu'][name] = _percent(total - idle, total)
+        return cpu
+
+    def load(self):
+        """Return the load averages and the run queue of the host.
+
+        Returns:
+            dict: the 1, 5 and 15 minutes load averages, under 'avg1',
+                'avg5' and 'avg15', and the number of tasks 'running' or
+                ready to run, not counting the collector itself, and of
+                tasks 'blocked' on I/O, as read by the last cpu() call.
+
+        """
+        buf, length = self._loadavg.read()
+        fields = buf[:length].split()
+        counters = self.stat_counters
+        return {'avg1': float(fields[0]),
+                'avg5': float(fields[1]),
+                'avg15': float(fields[2]),
+                'running': max(counters.get('running', 1) - 1, 0),
+                'blocked': counters.get('blocked', 0)}
+
+    def pressure(self):
+        """Return the Pressure Stall Information totals.
+
+        Returns:
+            dict: the total time tasks were stalled, in microseconds,
+                indexed by PSI_TOTALS name. The totals not provided by the
+                kernel are 0: PSI requires Linux 4.20 and can be disabled at
+                boot, and cpu_full requires Linux 5.13.
+
+        """
+        totals = dict.fromkeys(PSI_TOTALS, 0)
+        for resource, proc_file in list(self._pressure.items()):
+            try:
+                buf, length = proc_file.read()
+            except (IOError, OSError):
+                # PSI disabled at boot (psi=0)
+                proc_file.close()
+                del self._pressure[resource]
+                continue
+
+            for start, end in _lines(buf, length):
+                # some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+                fields = buf[start:end].split()
+                kind = bytes(fields[0]).decode('ascii')
+                totals['%s_%s' % (resource, kind)] = int(fields[-1][6:])
+        return totals
+
+    def memory(self):
+        """Return the host memory statistics, in bytes.
+
+        Returns:
+            dict: the MEMINFO_FIELDS and the MEMINFO_HUGEPAGES, converted
+                from pages to bytes.
+
+        """
+        buf, length = self._meminfo.read()
+        memory = {}
+        for field, key in MEMINFO_FIELDS.items():
+            # 'key    value kB', at the start of a line
+            value = _field(buf, length, key)
+            memory[field] = value * 1024 if value is not None else None
+
+        if memory['avail'] is None:
+            # kernels older than 3.14 do not provide MemAvailable
+            memory['avail'] = (memory['free'] + memory['buffers'] +
+                               memory['cached'])
+        page_size = (_field(buf, length, b'Hugepagesize:') or 0) * 1024
+        for field, key in MEMINFO_HUGEPAGES.items():
+            memory[field] = (_field(buf, length, key) or 0) * page_size
+        for field, value in memory.items():
+            if value is None:
+                memory[field] = 0
+        return memory
+
+    def vmstat(self):
+        """Return the VMSTAT_COUNTERS, since the host boot.
+
+        Returns:
+            dict: the value of each counter, indexed by VMSTAT_COUNTERS
+                name. Counters not provided by the kernel are 0.
+
+        """
+        buf, length = self._vmstat.read()
+        counters = {}
+        for name, key in VMSTAT_COUNTERS.items():
+            # 'key value', at the start of a line
+            counters[name] = _field(buf, length, key + b' ') or 0
+        return counters
+
+    def numa(self):
+        """Return the free memory of each NUMA node, in bytes.
+
+        Returns:
+            dict: {node name: free bytes}, for each node of the 'nodes'
+                attribute, e.g. 'node0'. Empty without NUMA support.
+
+        """
+        free = {}
+        for node, proc_file in self._nodes:
+            buf, length = proc_file.read()
+            # 'Node 0 MemFree:   123 kB' lines
+            start = buf.find(b'MemFree:', 0, length)
+            end = buf.find(b'\n', start, length)
+            free[node] = int(buf[start + 8:end].split()[0]) * 1024
+        return free
+
+    def diskstats(self):
+        """Return the I/O counters of every block device.
+
+        Returns:
+            dict: the /proc/diskstats fields following the device name, as
+                bytes, indexed by device name (as bytes). See the DISK_*
+                indexes.
+
+        """
+        return _parse_diskstats(*self._diskstats.read())
+
+    def disk_io(self, stats=None, prev=None):
+        """Return the bytes read and written by the host disks.
+
+        Only the physical disks are counted, so the I/O of partitions and
+        stacked devices, such as multipath maps, LVM volumes or md arrays,
+        is not counted twice. See BlockDeviceGraph.
+
+        Args:
+            stats (dict): counters returned by diskstats(), which is called
+                when they are not given.
+            prev (dict): counters returned by a previous diskstats() call.
+                When given, only the bytes since then are returned, for the
+                disks listed by both calls.
+
+        Raises:
+            CounterReset: if the counters of a disk went backwards since
+                prev.
+
+        """
+        if stats is None:
+            stats = self.diskstats()
+
+        names = set(stats)
+        stamp = udev_stamp()
+        if names != self._disks_listed or stamp != self._disks_stamp:
+            self._disks = set(name.encode('utf-8') for name in
+                              get_block_graph().physical_disks()) & names
+            self._disks_listed = names
+            self._disks_stamp = stamp
+
+        read_sectors, written_sectors = _sum_counters(
+            self._disks, stats, prev,
+            (DISK_SECTORS_READ, DISK_SECTORS_WRITTEN))
+        return read_sectors * SECTOR_SIZE, written_sectors * SECTOR_SIZE
+
+    def net_dev(self):
+        """Return the counters of every network interface.
+
+        Returns:
+            dict: the /proc/net/dev fields following the interface name, as
+                bytes, indexed by interface name (as bytes). See the NET_*
+                indexes.
+
+        """
+        return _parse_net_dev(*self._net_dev.read())
+
+    def net_io(self, stats=None, prev=None):
+        """Return the bytes received and sent by the host NICs and WLANs.
+
+        Args:
+            stats (dict): counters returned by net_dev(), which is called
+                when they are not given.
+            prev (dict): counters returned by a previous net_dev() call.
+                When given, only the bytes since then are returned, for the
+                interfaces listed by both calls.
+
+        Raises:
+            CounterReset: if the counters of an interface went backwards
+                since prev.
+
+        """
+        if stats is None:
+            stats = self.net_dev()
+
+        names = set(stats)
+        if names != self._ifaces_listed:
+            self._ifaces = set(iface.encode('utf-8')
+                               for iface in self._interfaces()) & names
+            self._ifaces_listed = names
+
+        return _sum_counters(self._ifaces, stats, prev,
+                             (NET_RX_BYTES, NET_TX_BYTES))
+
+
+def _parse_diskstats(buf, length):
+    """Parse /proc/diskstats, see HostStatsCollector.diskstats()."""
+    stats = {}
+    for start, end in _lines(buf, length):
+        # major minor name reads merged sectors_read ms writes merged
+        # sectors_written ...
+        fields = buf[start:end].split()
+        if len(fields) >= 14:
+            stats[bytes(fields[2])] = fields[3:14]
+    return stats
+
+
+def _parse_net_dev(buf, length):
+    """Parse /proc/net/dev, see HostStatsCollector.net_dev()."""
+    stats = {}
+    for start, end in _lines(buf, length):
+        # the header lines have no ':'
+        name, sep, counters = buf[start:end].partition(b':')
+        if sep:
+            # rx: bytes packets errs drop fifo frame compressed
+            # multicast, tx: bytes ...
+            stats[bytes(name.strip())] = counters.split()
+    return stats
+
+
+def _parse_stat_totals(buf, length):
+    """Return the busy and total host CPU time, the context switches and
+    the interrupts of /proc/stat."""
+    end = buf.find(b'\n', 0, length)
+    times = [int(value) for value in buf[:end].split()[1:9]]
+    total = sum(times)
+    return (total - times[3] - times[4], total,
+            _field(buf, length, b'ctxt') or 0,
+            _field(buf, length, b'intr') or 0)
+
+
+class BurstRecorder(object):
+    """Record the host CPU, disk and network counters at a sub-second
+    interval.
+
+    The recording loop only copies /proc/stat, /proc/diskstats and
+    /proc/net/dev into slots of buffers allocated beforehand, and the time
+    of each copy into a preallocated array: it neither allocates buffers
+    nor parses anything per sample, which would disturb the bursts it
+    measures. The copies are parsed by rates(), once the recording is over.
+
+    Each slot is twice the size of its file when the recorder is created,
+    so devices may be added meanwhile. Samples whose files do not fit their
+    slots are skipped by rates().
+
+    A recording in 'ring' mode goes on until it is stopped, overwriting the
+    oldest sample, and rates() returns the last 'samples' ones: the copies
+    are made under a lock, so the recording waits while rates() takes them.
+
+    Args:
+        samples (int): number of samples to record.
+        disks (set): names of the block devices accounted by the disk
+            rates, as bytes, i.e. the physical disks.
+        interfaces (set): names of the network interfaces accounted by the
+            network rates, as bytes.
+
+    """
+
+    def __init__(self, samples, disks, interfaces):
+        self.samples = samples
+        self.disks = disks
+        self.interfaces = interfaces
+        # samples recorded so far
+        self.count = 0
+        self._lock = threading.Lock()
+        self._times = array.array('d', [0.0]) * samples
+        self._files = []
+        for path in (PROC_STAT, PROC_DISKSTATS, PROC_NET_DEV):
+            proc_file = io.FileIO(path, 'r')
+            size = -(-2 * len(proc_file.readall()) // 4096) * 4096
+            view = memoryview(bytearray(size * samples))
+            slots = [view[index * size:(index + 1) * size]
+                     for index in range(samples)]
+            lengths = array.array('l', [0]) * samples
+            self._files.append((proc_file, slots, lengths))
+
+    def record(self, interval, stopped=None, ring=False):
+        """Record the samples, on absolute deadlines 'interval' seconds
+        apart, see DeadlineTask.
+
+        Args:
+            interval (float): time between samples, in seconds.
+            stopped (threading.Event): stops the recording when set.
+            ring (bool): record until stopped, overwriting the oldest
+                sample.
+
+        """
+        times = self._times
+        files = self._files
+        samples = self.samples
+        lock = self._lock
+        deadline = monotonic()
+        count = 0
+        while ring or count < samples:
+            if stopped is not None and stopped.is_set():
+                break
+            index = count % samples
+            with lock:
+                times[index] = monotonic()
+                for proc_file, slots, lengths in files:
+                    proc_file.seek(0)
+                    lengths[index] = proc_file.readinto(slots[index])
+                count += 1
+                self.count = count
+            if not ring and count == samples:
+                break
+            deadline += interval
+            delay = deadline - monotonic()
+            if delay < 0 and interval > 0:
+                # skip the missed deadlines, e.g. while rates() held the
+                # lock
+                skipped = int(-delay // interval) + 1
+                deadline += skipped * interval
+                delay += skipped * interval
+            if delay > 0:
+                if stopped is not None:
+                    stopped.wait(delay)
+                else:
+                    time.sleep(delay)
+
+        for proc_file, _, _ in files:
+            proc_file.close()
+
+    def rates(self):
+        """Parse the recorded samples.
+
+        Yields:
+            tuple: the monotonic() time of each sample but the first one
+                and its 'cpu_utilization', 'disk_read_rate',
+                'disk_write_rate', 'net_recv_rate', 'net_sent_rate',
+                'context_switch_rate' and 'interrupt_rate' since the
+                previous sample, in the format of the host statistics.
+
+        """
+        prev = None
+        for sample_time, counters in self._copy():
+            if counters is not None:
+                stat = _parse_stat_totals(*counters[0])
+                diskstats = _parse_diskstats(*counters[1])
+                net_dev = _parse_net_dev(*counters[2])
+                current = (sample_time, stat, diskstats, net_dev)
+                if prev is not None:
+                    sample = self._rates(prev, current)
+                    if sample is not None:
+                        yield current[0], sample
+                prev = current
+
+    def _copy(self):
+        # copy the recorded samples, from the oldest to the newest, so the
+        # recording goes on while they are parsed
+        samples = []
+        with self._lock:
+            for count in range(max(self.count - self.samples, 0),
+                               self.count):
+                index = count % self.samples
+                counters = []
+                for _, slots, lengths in self._files:
+                    if lengths[index] >= len(slots[index]):
+                        # truncated: the file outgrew its slot
+                        counters = None
+                        break
+                    counters.append((slots[index][:lengths[index]].tobytes(),
+                                     lengths[index]))
+                samples.append((self._times[index], counters))
+        return samples
+
+    def _rates(self, prev, current):
+        seconds = current[0] - prev[0]
+        stat = [value - prev_value
+                for value, prev_value in zip(current[1], prev[1])]
+        try:
+            disk_io = _sum_counters(self.disks & set(current[2]), current[2],
+                                    prev[2], (DISK_SECTORS_READ,
+                                              DISK_SECTORS_WRITTEN))
+            net_io = _sum_counters(self.interfaces & set(current[3]),
+                                   current[3], prev[3],
+                                   (NET_RX_BYTES, NET_TX_BYTES))
+        except CounterReset:
+            return None
+
+        def rate(value):
+            return int(float(max(value, 0)) / seconds + 0.5)
+
+        return {'cpu_utilization': _percent(stat[0], stat[1]),
+                'disk_read_rate': rate(disk_io[0] * SECTOR_SIZE),
+                'disk_write_rate': rate(disk_io[1] * SECTOR_SIZE),
+                'net_recv_rate': rate(net_io[0]),
+                'net_sent_rate': rate(net_io[1]),
+                'context_switch_rate': rate(stat[2]),
+                'interrupt_rate': rate(stat[3])}
+
+
+class CounterReset(Exception):
+    """The counters of a device went backwards.
+
+    The device was reset, removed and added again, or a counter wrapped
+    around, so its counters can not be compared with the previous ones.
+    """
+
+    def __init__(self, name):
+        super(CounterReset, self).__init__(
+            'Counters of device %s went backwards' % name.decode('utf-8'))
+        self.name = name
+
+
+def _deltas(prev, counters, indexes):
+    return [int(counters[i]) - int(prev[i]) for i in indexes]
+
+
+def _sum_counters(names, stats, prev, indexes):
+    totals = [0] * len(indexes)
+    for name in names:
+        if prev is None:
+            values = [int(stats[name][i]) for i in indexes]
+        elif name in prev:
+            values = _deltas(prev[name], stats[name], indexes)
+            if min(values) < 0:
+                raise CounterReset(name)
+        else:
+            # added since prev
+            continue
+        totals = [total + value for total, value in zip(totals, values)]
+    return tuple(totals)
+
+
+def _select(stats, patterns):
+    for name in stats:
+        decoded = name.decode('utf-8')
+        if any(fnmatch.fnmatchcase(decoded, pattern) for pattern in patterns):
+            yield name, decoded
+
+
+def disk_rates(prev, stats, seconds, patterns=('*',)):
+    """Return the I/O rates of each block device between two diskstats().
+
+    Args:
+        prev (dict): counters returned by a previous diskstats() call.
+        stats (dict): counters returned by the last diskstats() call.
+        seconds (float): time elapsed between both calls.
+        patterns (tuple): shell-style patterns of the device names to
+            return. Devices added since the previous call, or whose counters
+            went backwards (see CounterReset), are skipped.
+
+    Returns:
+        dict: read_rate and write_rate (B/s), read_iops and write_iops, await
+            (average time to complete a request, in ms) and util (percentage
+            of time the device was busy) of each device, indexed by name.
+
+    """
+    rates = {}
+    for name, decoded in _select(stats, patterns):
+        if name not in prev:
+            continue
+        (reads, sectors_read, read_time, writes, sectors_written, write_time,
+         io_time) = _deltas(prev[name], stats[name],
+                            (DISK_READS, DISK_SECTORS_READ, DISK_READ_TIME,
+                             DISK_WRITES, DISK_SECTORS_WRITTEN,
+                             DISK_WRITE_TIME, DISK_IO_TIME))
+        if min(reads, sectors_read, read_time, writes, sectors_written,
+               write_time, io_time) < 0:
+            continue
+        requests = reads + writes
+        rates[decoded] = {
+            'read_rate': int(sectors_read * SECTOR_SIZE / seconds + 0.5),
+            'write_rate': int(sectors_written * SECTOR_SIZE / seconds + 0.5),
+            'read_iops': round(reads / seconds, 1),
+            'write_iops': round(writes / seconds, 1),
+            'await': (round(float(read_time + write_time) / requests, 2)
+                      if requests > 0 else 0.0),
+            'util': _percent(io_time, seconds * 1000)}
+    return rates
+
+
+def net_rates(prev, stats, seconds, patterns=('*',)):
+    """Return the rates of each network interface between two net_dev().
+
+    Args:
+        prev (dict): counters returned by a previous net_dev() call.
+        stats (dict): counters returned by the last net_dev() call.
+        seconds (float): time elapsed between both calls.
+        patterns (tuple): see disk_rates().
+
+    Returns:
+        dict: recv_rate and sent_rate (B/s) and the received and sent
+            packets, errors and drops per second of each interface, indexed
+            by name.
+
+    """
+    rates = {}
+    for name, decoded in _select(stats, patterns):
+        if name not in prev:
+            continue
+        (recv_bytes, recv_packets, recv_errors, recv_drops, sent_bytes,
+         sent_packets, sent_errors, sent_drops) = _deltas(
+            prev[name], stats[name],
+            (NET_RX_BYTES, NET_RX_PACKETS, NET_RX_ERRORS, NET_RX_DROPS,
+             NET_TX_BYTES, NET_TX_PACKETS, NET_TX_ERRORS, NET_TX_DROPS))
+        if min(recv_bytes, recv_packets, recv_errors, recv_drops, sent_bytes,
+               sent_packets, sent_errors, sent_drops) < 0:
+            continue
+        rates[decoded] = {
+            'recv_rate': int(recv_bytes / seconds + 0.5),
+            'recv_packets': round(recv_packets / seconds, 1),
+            'recv_errors': round(recv_errors / seconds, 1),
+            'recv_drops': round(recv_drops / seconds, 1),
+            'sent_rate': int(sent_bytes / seconds + 0.5),
+            'sent_packets': round(sent_packets / seconds, 1),
+            'sent_errors': round(sent_errors / seconds, 1),
+            'sent_drops': round(sent_drops / seconds, 1)}
+    return rates
+
+
+def stall_percent(prev, totals, seconds):
+    """Return the share of time tasks were stalled on each resource.
+
+    Args:
+        prev (dict): totals returned by a previous
+            HostStatsCollector.pressure() call, or None for the totals since
+            boot.
+        totals (dict): totals returned by HostStatsCollector.pressure().
+        seconds (float): time elapsed between both calls.
+
+    Returns:
+        dict: percent of the elapsed time, rounded to two decimals, indexed
+            by PSI_TOTALS name.
+
+    """
+    prev = prev or {}
+    stalls = {}
+    for name, total in totals.items():
+        stall = 100.0 * (total - prev.get(name, 0)) / (seconds * 1000000)
+        stalls[name] = round(min(max(stall, 0.0), 100.0), 2)
+    return stalls
+
+
+def thread_cpu_time():
+    """Return the CPU time used by the calling thread, in seconds."""
+    return time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+
+
+def boot_time():
+    """Return the time the host started, in seconds since the Epoch."""
+    with open(PROC_UPTIME) as uptime_file:
+        return time.time() - float(uptime_file.readline().split()[0])
+
+
+class DeadlineTask(threading.Thread):
+    """Daemon thread calling a function periodically, on the monotonic clock.
+
+    The function is called at absolute deadlines, every 'interval' seconds
+    since the task started, instead of sleeping 'interval' seconds after
+    each call: the time taken by the calls does not make the schedule drift
+    and wall clock steps do not affect it. Deadlines already missed when a
+    call returns are skipped.
+
+    Args:
+        interval (float): time between deadlines, in seconds.
+        function (callable): called with the time it was called at and its
+            deadline, in monotonic() seconds.
+
+    """
+
+    def __init__(self, interval, function):
+        super(DeadlineTask, self).__init__(name='HostStatsCollector')
+        self.daemon = True
+        self.interval = interval
+        self.function = function
+        self._stopped = threading.Event()
+
+    def run(self):
+        deadline = monotonic() + self.interval
+        while True:
+            self._stopped.wait(max(deadline - monotonic(), 0))
+            if self._stopped.is_set():
+                return
+
+            self.function(monotonic(), deadline)
+            deadline += self.interval
+            late = monotonic() - deadline
+            if late > 0:
+                deadline += (int(late // self.interval) + 1) * self.interval
+
+    def cancel(self):
+        self._stopped.set()
+
+
+class CollectorStats(object):
+    """Self-instrumentation of the host statistics collector.
+
+    It accounts the wall and CPU time of each sub-collector, the scheduling
+    jitter of the collector ticks, the ticks that were missed, i.e. that
+    started one or more intervals late, and the samples dropped because of
+    a CounterReset.
+
+    Args:
+        interval (int): expected time between ticks, in seconds.
+
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.ticks = 0
+        self.collected = 0
+        self.missed = 0
+        self.dropped = 0
+        self.duration = 0.0
+        self.jitter_sum = 0.0
+        # the last bucket counts the ticks later than JITTER_BUCKETS[-1]
+        self.jitter_counts = [0] * (len(JITTER_BUCKETS) + 1)
+        self.collectors = {}
+
+    def tick(self, now, deadline):
+        """Account a collector tick, which started at 'now'.
+
+        Args:
+            now (float): start of the tick, in monotonic() seconds.
+            deadline (float): when the tick should have started.
+
+        """
+        self.ticks += 1
+        jitter = max(now - deadline, 0.0)
+        self.jitter_sum += jitter
+        bucket = 0
+        while (bucket < len(JITTER_BUCKETS) and
+               jitter > JITTER_BUCKETS[bucket]):
+            bucket += 1
+        self.jitter_counts[bucket] += 1
+        self.missed += int(jitter // self.interval)
+
+    @contextmanager
+    def collect(self):
+        """Account the collection of a sample. A collection which raises
+        is timed, but not counted as collected."""
+        start = monotonic()
+        try:
+            yield
+            self.collected += 1
+        finally:
+            self.duration = monotonic() - start
+
+    @contextmanager
+    def measure(self, name):
+        """Account the wall and CPU time of a sub-collector, even when it
+        raises."""
+        wall = monotonic()
+        cpu = thread_cpu_time()
+        try:
+            yield
+        finally:
+            cpu = thread_cpu_time() - cpu
+            wall = monotonic() - wall
+            stats = self.collectors.get(name)
+            if stats is None:
+                stats = {'wall': 0.0, 'cpu': 0.0, 'wall_total': 0.0,
+                         'cpu_total': 0.0, 'calls': 0}
+            stats = dict(stats, wall=wall, cpu=cpu,
+                         wall_total=stats['wall_total'] + wall,
+                         cpu_total=stats['cpu_total'] + cpu,
+                         calls=stats['calls'] + 1)
+            # replaced at once, so todict() never sees a partial update
+            self.collectors[name] = stats
+
+    def todict(self):
+        """Return the collector statistics.
+
+        Returns:
+            dict: the 'interval', the number of 'ticks', of samples
+                'collected' and 'dropped', of 'missed' ticks, the 'duration'
+                of the last collection, the 'jitter' histogram (cumulative
+                'buckets' as [upper bound, count] pairs, the last one
+                unbounded, with the 'sum' and 'count' of the jitters) and
+                the times of each sub-collector under 'collectors': the
+                'wall' and 'cpu' time of its last call, their totals and the
+                number of 'calls', in seconds.
+
+        """
+        buckets = []
+        count = 0
+        for bound, bucket_count in zip(JITTER_BUCKETS + (None,),
+                                       self.jitter_counts):
+            count += bucket_count
+            buckets.append([bound, count])
+
+        return {'interval': self.interval,
+                'ticks': self.ticks,
+                'collected': self.collected,
+                'missed': self.missed,
+                'dropped': self.dropped,
+                'duration': self.duration,
+                'jitter': {'buckets': buckets,
+                           'sum': self.jitter_sum,
+                           'count': count},
+                'collectors': dict((name, dict(stats)) for name, stats in
+                                   self.collectors.items())}
+
+
+def _read_file(path, size=4096):
+    """Read a small file with a single read(), without a file object."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+def _list_pids():
+    """Return the PIDs listed in PROC, as strings."""
+    return [entry.name for entry in os.scandir(PROC) if entry.name.isdigit()]
+
+
+class ProcessSampler(object):
+    """Sample the resource usage of every process of the host.
+
+    A scan lists PROC and reads /proc/<pid>/stat, which holds the CPU time
+    and resident set size, of every process. /proc/<pid>/io is only read
+    for the processes which may have done I/O since the previous scan: new
+    ones, the ones that used CPU time and the ones in uninterruptible sleep.
+    This bounds the cost of a scan on hosts with thousands of mostly idle
+    processes, which is dominated by one read of a small file per process.
+
+    Rates are computed from the counters of the previous scan. Processes not
+    seen by the previous scan, e.g. on the first one, are reported with
+    their average rates since they started.
+
+    Scans are serialized and their result is shared by the callers for
+    'cache' seconds, so concurrent callers do not scan again.
+
+    Args:
+        cache (float): seconds a scan is shared by its callers.
+
+    """
+
+    # fields of the scanned rows: sort keys first, see PROCESS_SORT_KEYS
+    _ROW_FIELDS = ('cpu', 'rss', 'io', 'read_rate', 'write_rate', 'pid',
+                   'name', 'state')
+
+    def __init__(self, cache=PROCESS_SAMPLE_CACHE):
+        self.cache = cache
+        self.clock_ticks = float(os.sysconf('SC_CLK_TCK'))
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self._lock = threading.Lock()
+        # pid: (starttime, cpu ticks, read bytes, written bytes)
+        self._counters = {}
+        self._uptime = None
+        self._scanned = None
+        self._rows = (0.0, [])
+        self.duration = 0.0
+
+    def top(self, count, key):
+        """Return the 'count' processes using the most of 'key'.
+
+        Args:
+            count (int): maximum number of processes returned.
+            key (str): one of PROCESS_SORT_KEYS.
+
+        Returns:
+            tuple: (seconds, processes), where seconds is the time covered
+                by the rates, 0 on the first scan, and processes a list of
+                dictionaries, sorted by decreasing 'key', with the 'pid',
+                the command 'name', the 'state', the 'cpu' utilization, in
+                percent of one CPU, the 'rss' in bytes, the 'read_rate' and
+                'write_rate' to the storage layer, in B/s, and their sum,
+                under 'io'.
+
+        """
+        with self._lock:
+            now = monotonic()
+            if self._scanned is None or now - self._scanned >= self.cache:
+                self._rows = self._scan()
+                self._scanned = now
+                self.duration = monotonic() - now
+            seconds, rows = self._rows
+
+        # only the selected rows are converted to dictionaries
+        index = PROCESS_SORT_KEYS.index(key)
+        top = heapq.nlargest(count, rows, key=operator.itemgetter(index))
+        processes = []
+        for row in top:
+            process = dict(zip(self._ROW_FIELDS, row))
+            process['name'] = process['name'].decode('utf-8', 'replace')
+            process['state'] = process['state'].decode('ascii')
+            processes.append(process)
+        return seconds, processes
+
+    def _scan(self):
+        with open(PROC_UPTIME) as uptime_file:
+            uptime = float(uptime_file.readline().split()[0])
+        seconds = uptime - self._uptime if self._uptime else 0.0
+        self._uptime = uptime
+
+        clock_ticks = self.clock_ticks
+        min_elapsed = 1.0 / clock_ticks
+        prev_counters = self._counters
+        counters = {}
+        rows = []
+        for pid in _list_pids():
+            path = PROC + '/' + pid
+            try:
+                stat = _read_file(path + '/stat')
+            except (IOError, OSError):
+                # the process exited
+                continue
+
+            # pid (name) state ppid ...: the name may contain spaces and
+            # parentheses
+            name_end = stat.rfind(b')')
+            fields = stat[name_end + 2:].split(None, PID_RSS + 1)
+            starttime = int(fields[PID_STARTTIME])
+            ticks = int(fields[PID_UTIME]) + int(fields[PID_STIME])
+            state = fields[PID_STATE]
+            prev = prev_counters.get(pid)
+            if prev is not None and prev[0] != starttime:
+                # PID reused by a new process
+                prev = None
+
+            if prev is None or ticks != prev[1] or state == b'D':
+                try:
+                    io_counters = _read_file(path + '/io').split()
+                    # rchar wchar syscr syscw read_bytes write_bytes ...
+                    read_bytes = int(io_counters[9])
+                    write_bytes = int(io_counters[11])
+                except (IOError, OSError, IndexError):
+                    # not permitted, or the process exited
+                    read_bytes = write_bytes = 0
+            else:
+                read_bytes, write_bytes = prev[2:]
+            counters[pid] = (starttime, ticks, read_bytes, write_bytes)
+
+            if prev is None:
+                # average since the process started
+                elapsed = uptime - starttime / clock_ticks
+                prev = (starttime, 0, 0, 0)
+            else:
+                elapsed = seconds
+            if elapsed < min_elapsed:
+                elapsed = min_elapsed
+
+            read_rate = max(int((read_bytes - prev[2]) / elapsed + 0.5), 0)
+            write_rate = max(int((write_bytes - prev[3]) / elapsed + 0.5), 0)
+            rows.append((round(100.0 * (ticks - prev[1]) / clock_ticks /
+                               elapsed, 1),
+                         int(fields[PID_RSS]) * self.page_size,
+                         read_rate + write_rate, read_rate, write_rate,
+                         int(pid), stat[stat.find(b'(') + 1:name_end],
+                         state))
+
+        self._counters = counters
+        return seconds, rows
+
+
+def _unescape(path):
+    """Decode the octal escapes (e.g. \\040 for a space) of a mountinfo
+    path."""
+    return re.sub(br'\\([0-7]{3})',
+                  lambda match: bytes(bytearray([int(match.group(1), 8)])),
+                  path)
+
+
+class FilesystemCollector(object):
+    """Collect the capacity and inode usage of the mounted filesystems.
+
+    The mount table is read from PROC_MOUNTINFO, kept open, and only parsed
+    again when its content changes. Filesystems without a backing device,
+    listed as 'nodev' in PROC_FILESYSTEMS, are not reported: pseudo
+    filesystems (proc, cgroup...) have no meaningful capacity, and statvfs()
+    of network filesystems blocks the collector while their server does not
+    answer. MEMORY_FILESYSTEMS are the exception. Other mounts of an already
+    reported device, such as bind mounts, and mounts hidden by a later mount
+    on the same mount point are not reported either.
+    """
+
+    def __init__(self):
+        self._mountinfo = ProcFile(PROC_MOUNTINFO, 16384)
+        with open(PROC_FILESYSTEMS, 'rb') as filesystems:
+            self._nodev = set(line.split()[-1] for line in filesystems
+                              if line.startswith(b'nodev'))
+        self._nodev.difference_update(fstype.encode('ascii')
+                                      for fstype in MEMORY_FILESYSTEMS)
+        self._listed = None
+        self._mounts = []
+
+    def mounts(self):
+        """Return the reported mounts.
+
+        Returns:
+            list: (mount point, path, type, device) tuples, in mount order,
+                where path is the mount point as bytes.
+
+        """
+        buf, length = self._mountinfo.read()
+        listed = bytes(buf[:length])
+        if listed == self._listed:
+            return self._mounts
+
+        mounts = []
+        devices = set()
+        for line in listed.splitlines():
+            # id parent major:minor root mount_point options [optional...]
+            # - type source super_options
+            fields = line.split()
+            separator = fields.index(b'-', 6)
+            fstype = fields[separator + 1]
+            if fstype in self._nodev or fields[2] in devices:
+                continue
+
+            devices.add(fields[2])
+            path = _unescape(fields[4])
+            # a mount hides the previous mounts on the same mount point
+            mounts = [mount for mount in mounts if mount[1] != path]
+            mounts.append((path.decode('utf-8', 'replace'), path,
+                           fstype.decode('utf-8', 'replace'),
+                           _unescape(fields[separator + 2]).decode(
+                               'utf-8', 'replace')))
+
+        self._mounts = mounts
+        self._listed = listed
+        return mounts
+
+    def usage(self):
+        """Return the capacity and usage of the mounted filesystems.
+
+        Returns:
+            dict: {mount point: usage} where usage holds the 'device' and
+                filesystem 'type', the 'size', 'used' and 'avail' (to
+                unprivileged users) bytes, and the 'inodes', 'inodes_used'
+                and 'inodes_avail'. Filesystems without inode limits, such
+                as btrfs, report 0 inodes.
+
+        """
+        usage = {}
+        for mount_point, path, fstype, device in self.mounts():
+            try:
+                st = os.statvfs(path)
+            except OSError:
+                # unmounted since the mount table was read, or not
+                # accessible
+                continue
+
+            size = st.f_blocks * st.f_frsize
+            usage[mount_point] = {
+                'device': device,
+                'type': fstype,
+                'size': size,
+                'used': size - st.f_bfree * st.f_frsize,
+                'avail': st.f_bavail * st.f_frsize,
+                'inodes': st.f_files,
+                'inodes_used': st.f_files - st.f_ffree,
+                'inodes_avail': st.f_favail}
+        return usage
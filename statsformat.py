@@ -0,0 +1,180 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+"""Columnar wire formats of the host statistics history."""
+import array
+import json
+import operator
+import struct
+import sys
+
+# a list of values per metric, grouped in a dictionary per sample
+JSON_MEDIA_TYPE = 'application/json'
+
+# a JSON array per column, sharing the seq and timestamp columns
+COLUMNS_MEDIA_TYPE = 'application/vnd.gingerbase.columns+json'
+
+# as COLUMNS_MEDIA_TYPE, with the integer columns delta-encoded
+DELTA_MEDIA_TYPE = 'application/vnd.gingerbase.columns-delta+json'
+
+# a JSON header followed by a little-endian float64 array per column
+BINARY_MEDIA_TYPE = 'application/vnd.gingerbase.columns'
+
+MEDIA_TYPES = (JSON_MEDIA_TYPE, COLUMNS_MEDIA_TYPE, DELTA_MEDIA_TYPE,
+               BINARY_MEDIA_TYPE)
+
+BINARY_MAGIC = b'GGBC'
+
+# array.array type codes of integer values
+INT_TYPECODES = 'bBhHiIlLqQ'
+
+
+def negotiate(accept):
+    """Select the media type of a response from an Accept header.
+
+    Args:
+        accept (str): value of the Accept request header, or None.
+
+    Returns:
+        str: the acceptable one of MEDIA_TYPES with the highest quality,
+            JSON_MEDIA_TYPE when the client accepts none of them.
+
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    ranges = []
+    for index, entry in enumerate(accept.split(',')):
+        params = entry.split(';')
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, index, params[0].strip().lower()))
+
+    for _, _, media_type in sorted(ranges):
+        if media_type in MEDIA_TYPES:
+            return media_type
+        elif media_type in ('*/*', 'application/*'):
+            return JSON_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def _delta(values):
+    """Return the first value followed by the difference of each value to
+    the previous one."""
+    return values[:1].tolist() + list(map(operator.sub, values[1:],
+                                          values[:-1]))
+
+
+def _float64(values):
+    """Return the values as a little-endian array of doubles."""
+    if values.typecode != 'd' or sys.byteorder != 'little':
+        values = array.array('d', values)
+        if sys.byteorder != 'little':
+            values.byteswap()
+    return values
+
+
+def _groups(history):
+    """Yield the prefix and the (name, values) columns of each group of a
+    history: the averages, then the minimums and maximums if any."""
+    yield '', history['columns']
+    for group in ('min', 'max'):
+        if group in history:
+            yield group + '.', history[group]
+
+
+def encode(history, media_type):
+    """Encode the columns of a history.
+
+    Args:
+        history (dict): (name, array.array) pairs, from the oldest to the
+            newest sample, under 'columns', the cursor under 'cursor', and
+            for consolidated tiers the minimum and maximum columns under
+            'min' and 'max'. See StatsTier.arrays() and
+            HostStatsArchive.arrays().
+        media_type (str): one of MEDIA_TYPES but JSON_MEDIA_TYPE.
+
+    Returns:
+        bytes: the encoded history. With COLUMNS_MEDIA_TYPE, a JSON object
+            with the 'cursor', the number of samples under 'count' and a
+            {name: values} object under 'columns', 'min' and 'max'. With
+            DELTA_MEDIA_TYPE, the same object where the columns listed
+            under 'delta' hold their first value followed by the
+            differences between consecutive values. With BINARY_MEDIA_TYPE,
+            BINARY_MAGIC, the length of a JSON header as a little-endian
+            uint32, the header, padded with spaces to a multiple of 8 bytes,
+            and the values of each column listed by the header, as
+            little-endian float64. The header holds the 'cursor', the
+            'count' and the names of the 'columns', where minimum and
+            maximum columns are prefixed with 'min.' and 'max.'. The
+            'events' of the history, if any, are returned as they are by
+            every format: in the JSON object or in the header.
+
+    Raises:
+        ValueError: if media_type is not a columnar media type.
+
+    """
+    columns = history['columns']
+    count = len(columns[0][1]) if columns else 0
+    if media_type == BINARY_MEDIA_TYPE:
+        names = []
+        arrays = []
+        for prefix, group in _groups(history):
+            for name, values in group:
+                names.append(prefix + name)
+                arrays.append(_float64(values).tobytes())
+
+        header = {'cursor': history['cursor'],
+                  'count': count,
+                  'columns': names}
+        if 'events' in history:
+            header['events'] = history['events']
+        header = json.dumps(header).encode('utf-8')
+        header += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header)) % 8)
+        return b''.join([BINARY_MAGIC, struct.pack('<I', len(header)),
+                         header] + arrays)
+
+    if media_type == COLUMNS_MEDIA_TYPE:
+        def tolist(values):
+            return values.tolist()
+    elif media_type == DELTA_MEDIA_TYPE:
+        def tolist(values):
+            if values.typecode in INT_TYPECODES:
+                return _delta(values)
+            return values.tolist()
+    else:
+        raise ValueError('Not a columnar media type: %s' % media_type)
+
+    result = {'cursor': history['cursor'], 'count': count}
+    for prefix, group in _groups(history):
+        result[prefix.rstrip('.') or 'columns'] = dict(
+            (name, tolist(values)) for name, values in group)
+    if media_type == DELTA_MEDIA_TYPE:
+        result['delta'] = [name for name, values in columns
+                           if values.typecode in INT_TYPECODES]
+    if 'events' in history:
+        result['events'] = history['events']
+    return json.dumps(result).encode('utf-8')
@@ -0,0 +1,105 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import wok.plugins.gingerbase.blockdevs as blockdevs
+
+
+class BlockDeviceGraphTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.sys_block = os.path.join(self.tmpdir, 'class', 'block')
+        os.makedirs(self.sys_block)
+        self.udev_data = os.path.join(self.tmpdir, 'udev')
+        os.makedirs(self.udev_data)
+        self.patchers = [
+            mock.patch.object(blockdevs, 'SYS_CLASS_BLOCK', self.sys_block),
+            mock.patch.object(blockdevs, 'UDEV_DATA', self.udev_data),
+            mock.patch.object(blockdevs, '_graph', None)]
+        for patcher in self.patchers:
+            patcher.start()
+
+        # two paths of a multipath map, with an LVM volume on it, an md
+        # array on two partitions of a disk and a loop device
+        self._device('sda', 'device')
+        self._device('sdb', 'device')
+        self._device('dm-0', 'dm', slaves=['sda', 'sdb'], dm_name='mpatha')
+        self._device('dm-1', 'dm', slaves=['dm-0'], dm_name='vg-lv')
+        self._device('sdc', 'device')
+        self._device('sdc/sdc1', 'partition')
+        self._device('sdc/sdc2', 'partition')
+        self._device('md0', slaves=['sdc1', 'sdc2'])
+        self._device('loop0')
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _device(self, path, flag=None, slaves=(), dm_name=None):
+        name = os.path.basename(path)
+        devpath = os.path.join(self.tmpdir, 'devices', path)
+        os.makedirs(os.path.join(devpath, 'slaves'))
+        os.symlink(devpath, os.path.join(self.sys_block, name))
+        with open(os.path.join(devpath, 'dev'), 'w') as f:
+            f.write('8:%d\n' % len(os.listdir(self.sys_block)))
+        for slave in slaves:
+            os.symlink(os.path.join(self.sys_block, slave),
+                       os.path.join(devpath, 'slaves', slave))
+        if flag is not None:
+            os.makedirs(os.path.join(devpath, flag))
+        if dm_name is not None:
+            with open(os.path.join(devpath, 'dm', 'name'), 'w') as f:
+                f.write(dm_name + '\n')
+
+    def test_graph(self):
+        graph = blockdevs.get_block_graph()
+        self.assertEqual(set(['sda', 'sdb', 'sdc']), graph.physical_disks())
+        self.assertEqual(['sda', 'sdb'], graph.slaves('dm-0'))
+        self.assertEqual(['dm-0'], graph.slaves('vg-lv'))
+        self.assertEqual(['dm-1'], graph.holders('mpatha'))
+        self.assertEqual([], graph.holders('vg-lv'))
+        self.assertEqual(['sdc'], graph.slaves('sdc1'))
+        self.assertEqual(['sdc1', 'sdc2'], graph.slaves('md0'))
+        self.assertEqual(['md0'], graph.holders('sdc2'))
+        self.assertEqual(['sdc1', 'sdc2'], graph.holders('sdc'))
+        self.assertEqual('8:3', graph.majmin('mpatha'))
+        self.assertIn('vg-lv', graph)
+        self.assertNotIn('sdd', graph)
+
+    def test_cache(self):
+        graph = blockdevs.get_block_graph()
+        self.assertIs(graph, blockdevs.get_block_graph())
+
+        # udev event
+        os.utime(self.udev_data, (0, 0))
+        changed = blockdevs.get_block_graph()
+        self.assertIsNot(graph, changed)
+        self.assertIs(changed, blockdevs.get_block_graph())
+
+        # hotplug
+        self._device('sdd', 'device')
+        graph = blockdevs.get_block_graph()
+        self.assertIsNot(graph, changed)
+        self.assertIn('sdd', graph.physical_disks())
@@ -22,6 +22,7 @@ import mock
 from wok.exception import NotFoundError
 from wok.exception import OperationFailed
 from wok.plugins.gingerbase.disks import _get_lsblk_devs
+from wok.plugins.gingerbase.disks import _is_dev_leaf
 from wok.plugins.gingerbase.disks import pvs_with_vg_list
 
 
@@ -59,3 +60,30 @@ class DiskTests(unittest.TestCase):
   /dev/dasdb1""", '', 0]
         outlist = pvs_with_vg_list()
         self.assertEqual(outlist[0].get('/dev/dasdb1'), 'N/A')
+
+    @mock.patch('wok.plugins.gingerbase.disks.get_block_graph')
+    @mock.patch('wok.plugins.gingerbase.disks.run_command')
+    def test_is_dev_leaf(self, mock_run_command, mock_get_block_graph):
+        # lsblk fails on multipath maps: their holders are read from the
+        # block device graph instead
+        mock_run_command.return_value = ['', 'mpath error', 1]
+        graph = mock_get_block_graph.return_value
+        graph.__contains__.return_value = True
+        graph.holders.return_value = []
+        self.assertTrue(_is_dev_leaf('/dev/mapper/mpatha', 'mpatha',
+                                     devtype='mpath'))
+        graph.holders.return_value = ['mpatha1']
+        self.assertFalse(_is_dev_leaf('/dev/mapper/mpatha', 'mpatha',
+                                      devtype='mpath'))
+        graph.holders.assert_called_with('mpatha')
+
+        # other devices are still looked up with lsblk
+        mock_get_block_graph.reset_mock()
+        mock_run_command.return_value = ['NAME="sda"\nNAME="sda1"\n', '', 0]
+        self.assertFalse(_is_dev_leaf('/dev/sda', 'sda', devtype='disk'))
+        mock_run_command.return_value = ['NAME="sda1"\n', '', 0]
+        self.assertTrue(_is_dev_leaf('/dev/sda1', 'sda1', devtype='part'))
+        mock_run_command.return_value = ['NAME="vg-lv"\n', '', 0]
+        self.assertTrue(_is_dev_leaf('/dev/mapper/vg-lv', 'vg-lv',
+                                     devtype='lvm'))
+        self.assertFalse(mock_get_block_graph.called)
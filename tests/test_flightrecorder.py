@@ -0,0 +1,96 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import json
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import time
+import unittest
+
+import mock
+from wok.plugins.gingerbase.flightrecorder import FlightRecorder
+from wok.plugins.gingerbase.procstats import PROCESS_SORT_KEYS
+from wok.plugins.gingerbase.procstats import ProcessSampler
+from wok.plugins.gingerbase.statsformat import BINARY_MAGIC
+
+
+class FlightRecorderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.recorder = FlightRecorder(0.01, 1, lambda: (set(), set()),
+                                       'cpu_utilization > 90 for 2s',
+                                       set(['cpu_utilization']))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_trigger(self):
+        self.assertFalse(self.recorder.update({'cpu_utilization': 95}, 0))
+        self.assertFalse(self.recorder.update({'cpu_utilization': 95}, 1))
+        self.assertTrue(self.recorder.update({'cpu_utilization': 95}, 2))
+        self.assertFalse(self.recorder.update({'cpu_utilization': 95}, 3))
+
+        recorder = FlightRecorder(0.01, 1, lambda: (set(), set()))
+        self.assertFalse(recorder.update({'cpu_utilization': 100}, 0))
+        self.assertRaises(ValueError, FlightRecorder, 0.01, 1,
+                          lambda: (set(), set()), 'foo > 1',
+                          set(['cpu_utilization']))
+
+    def test_shared_sampler(self):
+        # the processes are scanned by the sampler given, not another one
+        sampler = ProcessSampler()
+        recorder = FlightRecorder(0.01, 1, lambda: (set(), set()),
+                                  sampler=sampler)
+        self.assertIs(sampler, recorder.sampler)
+        with mock.patch.object(sampler, 'top',
+                               return_value=(0.0, [])) as top:
+            recorder.update({'cpu_utilization': 1.0}, 0)
+        top.assert_called_once_with(0, PROCESS_SORT_KEYS[0])
+
+    def test_save(self):
+        # the ring holds 100 samples, it wraps around
+        self.recorder.start()
+        time.sleep(1.5)
+        self.recorder.save(self.tmpdir, 'flightrecord-1', 'request', keep=1)
+        path = self.recorder.save(self.tmpdir, 'flightrecord-2', 'trigger',
+                                  keep=1)
+        self.recorder.stop()
+
+        # the oldest record is removed, and no partial one is left
+        self.assertEqual(['flightrecord-2.tar.gz'], os.listdir(self.tmpdir))
+        with tarfile.open(path) as archive:
+            self.assertEqual(['record.json', 'highres.columns'],
+                             archive.getnames())
+            record = json.loads(archive.extractfile('record.json').read())
+            highres = archive.extractfile('highres.columns').read()
+
+        self.assertEqual('flightrecord-2', record['name'])
+        self.assertEqual('trigger', record['reason'])
+        self.assertEqual('cpu_utilization > 90 for 2s', record['trigger'])
+        for key in PROCESS_SORT_KEYS:
+            self.assertTrue(record['processes'][key])
+
+        self.assertEqual(BINARY_MAGIC, highres[:4])
+        length = struct.unpack('<I', highres[4:8])[0]
+        header = json.loads(highres[8:8 + length].decode('utf-8'))
+        self.assertTrue(90 <= header['count'] <= 100)
+        self.assertIn('cpu_utilization', header['columns'])
@@ -29,7 +29,12 @@ import cherrypy
 import mock
 import psutil
 from mock import patch
+from wok.exception import InvalidParameter
+from wok.exception import NotFoundError
+from wok.exception import OperationFailed
 from wok.plugins.gingerbase.model.host import HostModel
+from wok.plugins.gingerbase.model.host import HostStatsModel
+from wok.plugins.gingerbase.model.host import HostStatsProcessesModel
 
 from tests.utils import patch_auth
 from tests.utils import request
@@ -84,10 +89,19 @@ class HostTests(unittest.TestCase):
     def test_hoststats(self):
         time.sleep(1)
         stats_keys = ['cpu_utilization', 'memory', 'disk_read_rate',
-                      'disk_write_rate', 'net_recv_rate', 'net_sent_rate']
+                      'disk_write_rate', 'net_recv_rate', 'net_sent_rate',
+                      'cpu', 'context_switch_rate', 'interrupt_rate', 'load',
+                      'pressure', 'paging', 'anomaly']
         resp = self.request('/plugins/gingerbase/host/stats').read()
         stats = json.loads(resp)
-        self.assertEquals(sorted(stats_keys), sorted(stats.keys()))
+        # numa is only returned by kernels with NUMA support
+        self.assertEquals(sorted(stats_keys + ['seq', 'timestamp',
+                                               'filesystems', 'events']),
+                          sorted(key for key in stats.keys()
+                                 if key != 'numa'))
+        root = stats['filesystems']['/']
+        self.assertTrue(0 < root['used'] <= root['size'])
+        self.assertIn('full_in', root)
 
         cpu_utilization = stats['cpu_utilization']
         self.assertIsInstance(cpu_utilization, float)
@@ -101,9 +115,307 @@ class HostTests(unittest.TestCase):
         self.assertIn('buffers', memory_stats)
         self.assertIn('avail', memory_stats)
 
+        cpu_states = ['user', 'system', 'iowait', 'irq', 'softirq', 'steal',
+                      'guest']
+        self.assertEquals(sorted(cpu_states), sorted(stats['cpu'].keys()))
+        self.assertEquals(['avg1', 'avg15', 'avg5', 'blocked', 'running'],
+                          sorted(stats['load'].keys()))
+        self.assertIn('io_some', stats['pressure'])
+        self.assertIn('swap_total', stats['memory'])
+        self.assertIn('major_fault_rate', stats['paging'])
+        self.assertIn('net_recv_rate', stats['anomaly'])
+
+        uri = '/plugins/gingerbase/host/stats?percpu=true'
+        stats = json.loads(self.request(uri).read())
+        self.assertIn('cpu0', stats['percpu'])
+
+        uri = '/plugins/gingerbase/host/stats?percpu=maybe'
+        resp = self.request(uri)
+        self.assertEquals(400, resp.status)
+
+        uri = '/plugins/gingerbase/host/stats?devices=*'
+        stats = json.loads(self.request(uri).read())
+        self.assertIn('lo', stats['interfaces'])
+        self.assertIn('disks', stats)
+
+        uri = '/plugins/gingerbase/host/stats?devices=lo'
+        stats = json.loads(self.request(uri).read())
+        self.assertEqual(['lo'], list(stats['interfaces']))
+        self.assertEquals({}, stats['disks'])
+
+        uri = '/plugins/gingerbase/host/stats?devices=lo,'
+        resp = self.request(uri)
+        self.assertEquals(400, resp.status)
+
         resp = self.request('/plugins/gingerbase/host/stats/history').read()
         history = json.loads(resp)
-        self.assertEquals(sorted(stats_keys), sorted(history.keys()))
+        history_keys = stats_keys + ['seq', 'timestamp', 'cursor', 'events']
+        self.assertEquals(sorted(history_keys),
+                          sorted(key for key in history.keys()
+                                 if key != 'numa'))
+        self.assertEquals(history['seq'][-1], history['cursor'])
+
+        uri = '/plugins/gingerbase/host/stats/history?since=%d'
+        newer = json.loads(self.request(uri % history['cursor']).read())
+        self.assertTrue(newer['cursor'] >= history['cursor'])
+        self.assertEquals(newer['cursor'] - history['cursor'],
+                          len(newer['seq']))
+
+        uri = '/plugins/gingerbase/host/stats/history?percpu=true'
+        history = json.loads(self.request(uri).read())
+        self.assertEquals(len(history['seq']), len(history['percpu']))
+
+        uri = '/plugins/gingerbase/host/stats/history?since=-1'
+        resp = self.request(uri)
+        self.assertEquals(400, resp.status)
+
+        uri = '/plugins/gingerbase/host/stats/history?resolution=10s&window=1m'
+        history = json.loads(self.request(uri).read())
+        self.assertEquals(sorted(history_keys + ['min', 'max']),
+                          sorted(history.keys()))
+
+        # columnar history, negotiated with the Accept header
+        uri = '/plugins/gingerbase/host/stats/history?window=1m'
+        accept = {'Accept': 'application/vnd.gingerbase.columns+json'}
+        resp = self.request(uri, headers=accept)
+        self.assertEquals('application/vnd.gingerbase.columns+json',
+                          resp.getheader('Content-Type'))
+        history = json.loads(resp.read())
+        self.assertEquals(history['count'],
+                          len(history['columns']['timestamp']))
+        self.assertIn('memory.avail', history['columns'])
+
+        uri = '/plugins/gingerbase/host/stats/history?window=1x'
+        resp = self.request(uri)
+        self.assertEquals(400, resp.status)
+
+        uri = '/plugins/gingerbase/host/stats/history/aggregate?window=1m&' \
+              'metrics=cpu_utilization,memory'
+        result = json.loads(self.request(uri).read())
+        self.assertEquals(['cpu_utilization', 'memory.avail',
+                           'memory.buffers', 'memory.cached', 'memory.free',
+                           'memory.total'], sorted(result['metrics'].keys()))
+        self.assertEquals(['max', 'mean', 'min', 'p50', 'p95', 'p99', 'rate'],
+                          sorted(result['metrics']['cpu_utilization']))
+
+        uri = '/plugins/gingerbase/host/stats/history/aggregate?metrics=foo'
+        resp = self.request(uri)
+        self.assertEquals(400, resp.status)
+
+    def test_hoststats_shared(self):
+        # every host statistics resource uses the same collector
+        stats = model.hoststats_lookup.__self__
+        self.assertIs(stats, HostStatsModel(objstore=model.objstore))
+        self.assertIs(stats, model.hoststatshistory_lookup.__self__.history)
+        self.assertIs(stats,
+                      model.hoststatsbursthistory_lookup.__self__.stats)
+        self.assertIs(stats, model.hoststatsalertrules_create.__self__.stats)
+        self.assertIs(stats, model.hoststatsalertrule_lookup.__self__.stats)
+
+        # so the archive gets one sample per tick
+        self.request('/plugins/gingerbase/host/stats').read()
+        time.sleep(3 * stats.interval + 1)
+        uri = '/plugins/gingerbase/host/stats/history?window=%ds' % \
+            (3 * stats.interval)
+        history = json.loads(self.request(uri).read())
+        seq, timestamps = history['seq'], history['timestamp']
+        self.assertEqual(list(range(seq[0], seq[-1] + 1)), seq)
+        for prev, timestamp in zip(timestamps, timestamps[1:]):
+            self.assertGreater(timestamp - prev, stats.interval / 2.0)
+
+    def test_hoststats_stream(self):
+        # a client reconnecting with the id of the last event it received
+        # gets the samples it missed, then the new ones
+        stats = model.hoststats_stream.__self__
+        self.request('/plugins/gingerbase/host/stats').read()
+        since = stats.stats_snapshot.seq
+        time.sleep(3 * stats.interval + 0.5)
+        missed = stats.stats_snapshot.seq - since
+        self.assertGreaterEqual(missed, 2)
+
+        frames = model.hoststats_stream(since=str(since))
+        samples = []
+        for frame in frames:
+            if frame.startswith(b'id: '):
+                ident, data = frame.decode('utf-8').split('\n')[:2]
+                sample = json.loads(data[len('data: '):])
+                self.assertEqual(int(ident[len('id: '):]), sample['seq'])
+                samples.append(sample)
+            if len(samples) > missed:
+                break
+        frames.close()
+        self.assertEqual(list(range(since + 1, since + missed + 2)),
+                         [sample['seq'] for sample in samples])
+        self.assertIn('events', samples[0])
+
+    def test_hoststats_stream_clients(self):
+        # the slots are taken by stream() and released by the generators,
+        # even those closed before their first frame
+        stats = model.hoststats_stream.__self__
+        clients = stats._stream_clients
+        with patch('wok.plugins.gingerbase.model.host.'
+                   'HOST_STATS_STREAM_MAX_CLIENTS', clients + 1):
+            frames = model.hoststats_stream()
+            self.assertEqual(clients + 1, stats._stream_clients)
+            self.assertRaises(OperationFailed, model.hoststats_stream)
+            frames.close()
+        self.assertEqual(clients, stats._stream_clients)
+
+    def test_hoststats_metrics(self):
+        time.sleep(1)
+        resp = self.request('/plugins/gingerbase/host/stats/metrics')
+        self.assertEquals(200, resp.status)
+        self.assertTrue(resp.getheader('Content-Type').startswith(
+            'text/plain'))
+        exposition = resp.read().decode('utf-8')
+        self.assertIn('# TYPE gingerbase_stats_samples_total counter',
+                      exposition)
+        self.assertIn('gingerbase_cpu_seconds_total{mode="user"}', exposition)
+        self.assertIn('gingerbase_memory_bytes{field="total"}', exposition)
+
+    def test_hoststats_health(self):
+        time.sleep(1)
+        resp = self.request('/plugins/gingerbase/host/stats/health').read()
+        health = json.loads(resp)
+        self.assertTrue(health['collected'] > 0)
+        self.assertEquals(['calls', 'cpu', 'cpu_total', 'wall', 'wall_total'],
+                          sorted(health['collectors']['disk'].keys()))
+        self.assertEquals(health['jitter']['count'],
+                          health['jitter']['buckets'][-1][1])
+
+    def test_hoststats_processes(self):
+        resp = self.request('/plugins/gingerbase/host/stats/processes'
+                            '?count=3&sort=rss')
+        self.assertEquals(200, resp.status)
+        processes = json.loads(resp.read())
+        self.assertEquals('rss', processes['sort'])
+        self.assertTrue(0 < len(processes['processes']) <= 3)
+        rss = [process['rss'] for process in processes['processes']]
+        self.assertEquals(sorted(rss, reverse=True), rss)
+        self.assertEquals(['cpu', 'io', 'name', 'pid', 'read_rate', 'rss',
+                           'state', 'write_rate'],
+                          sorted(processes['processes'][0].keys()))
+        # a scan reads one small file per process
+        self.assertTrue(0 <= processes['scan_duration'] < 5)
+
+        # the previous scan is kept by the shared sampler
+        sampler = model.hoststatsprocesses_lookup.__self__.sampler
+        self.assertIs(sampler, HostStatsProcessesModel().sampler)
+
+        resp = self.request('/plugins/gingerbase/host/stats/processes'
+                            '?sort=foo')
+        self.assertEquals(400, resp.status)
+        resp = self.request('/plugins/gingerbase/host/stats/processes'
+                            '?count=0')
+        self.assertEquals(400, resp.status)
+
+    def test_hoststats_burst(self):
+        def _task_lookup(taskid):
+            return json.loads(self.request('/plugins/gingerbase/tasks/%s' %
+                                           taskid).read())
+
+        uri = '/plugins/gingerbase/host/stats/burst'
+        resp = self.request(uri, json.dumps({'interval': 5}), 'POST')
+        self.assertEquals(400, resp.status)
+        resp = self.request(uri, json.dumps({'interval': 10,
+                                             'duration': 60}), 'POST')
+        self.assertEquals(400, resp.status)
+
+        resp = self.request(uri, json.dumps({'interval': 50,
+                                             'duration': 1}), 'POST')
+        self.assertEquals(202, resp.status)
+        task = json.loads(resp.read())
+        wait_task(_task_lookup, task['id'])
+        self.assertEquals('finished', _task_lookup(task['id'])['status'])
+
+        # the burst history resource reads the samples the burst action
+        # recorded, on the shared collector
+        self.assertIsNotNone(
+            model.hoststatsbursthistory_lookup.__self__.stats.burst_history)
+        uri = '/plugins/gingerbase/host/stats/bursthistory'
+        resp = self.request(uri)
+        self.assertEqual(200, resp.status)
+        history = json.loads(resp.read())
+        self.assertTrue(0 < len(history['seq']) <= 20)
+        self.assertEquals(history['seq'][-1], history['cursor'])
+        self.assertEquals(len(history['seq']),
+                          len(history['net_recv_rate']))
+
+        accept = {'Accept': 'application/vnd.gingerbase.columns+json'}
+        columns = json.loads(self.request(uri, headers=accept).read())
+        self.assertEqual(history['cursor'], columns['cursor'])
+        self.assertEqual(history['seq'], columns['columns']['seq'])
+
+    def test_hoststats_flightrecord(self):
+        def _task_lookup(taskid):
+            return json.loads(self.request('/plugins/gingerbase/tasks/%s' %
+                                           taskid).read())
+
+        stats = model.hoststats_flightrecord.__self__
+        with patch.object(stats, 'flight_delay', 0):
+            resp = self.request('/plugins/gingerbase/host/stats/flightrecord',
+                                '{}', 'POST')
+            self.assertEquals(202, resp.status)
+            task = json.loads(resp.read())
+            wait_task(_task_lookup, task['id'])
+        self.assertEquals('finished', _task_lookup(task['id'])['status'])
+
+        # the record is listed with the debug reports
+        name = task['target_uri'].split('/')[-1]
+        self.assertTrue(name.startswith('flightrecord-'))
+        resp = self.request('/plugins/gingerbase/debugreports/' + name)
+        self.assertEquals(200, resp.status)
+        self.assertTrue(json.loads(resp.read())['uri'].endswith('.tar.gz'))
+        resp = self.request('/plugins/gingerbase/debugreports/' + name, '{}',
+                            'DELETE')
+        self.assertEquals(204, resp.status)
+
+    def test_hoststats_alertrules(self):
+        uri = '/plugins/gingerbase/host/stats/alertrules'
+        rule = {'name': 'cpu_high', 'rule': 'cpu_utilization > 90 for 5m'}
+        resp = self.request(uri, json.dumps(rule), 'POST')
+        self.assertEquals(201, resp.status)
+        self.assertIn('cpu_high', json.loads(self.request(uri).read()))
+
+        resp = self.request(uri + '/cpu_high').read()
+        self.assertEquals({'name': 'cpu_high', 'rule': rule['rule'],
+                           'source': 'api', 'state': 'inactive'},
+                          json.loads(resp))
+
+        resp = self.request(uri, json.dumps(rule), 'POST')
+        self.assertEquals(400, resp.status)
+        resp = self.request(uri, json.dumps({'name': 'foo',
+                                             'rule': 'foo > 1'}), 'POST')
+        self.assertEquals(400, resp.status)
+
+        resp = self.request(uri + '/cpu_high', '{}', 'DELETE')
+        self.assertEquals(204, resp.status)
+        resp = self.request(uri + '/cpu_high')
+        self.assertEquals(404, resp.status)
+
+        resp = self.request('/plugins/gingerbase/host/stats/alerts')
+        self.assertEquals(200, resp.status)
+
+    def test_hoststats_alertrules_shared(self):
+        # a rule created through the collection is seen by the rule
+        # resource: both use the alert engine of the shared collector
+        collection = model.hoststatsalertrules_create.__self__
+        resource = model.hoststatsalertrule_lookup.__self__
+        self.assertIs(collection.stats.alert_engine,
+                      resource.stats.alert_engine)
+
+        model.hoststatsalertrules_create({'name': 'load_high',
+                                          'rule': 'load.avg1 > 100'})
+        self.assertIn('load_high', model.hoststatsalertrules_get_list())
+        rule = model.hoststatsalertrule_lookup('load_high')
+        self.assertEqual('api', rule['source'])
+        model.hoststatsalertrule_delete('load_high')
+        self.assertRaises(NotFoundError, model.hoststatsalertrule_lookup,
+                          'load_high')
+        self.assertNotIn('load_high', model.hoststatsalertrules_get_list())
+
+        self.assertRaises(InvalidParameter, model.hoststatsalertrules_create,
+                          {'name': 'load high', 'rule': 'load.avg1 > 100'})
 
     def test_host_actions(self):
         resp = self.request('/plugins/gingerbase/host/shutdown', '{}', 'POST')
@@ -111,6 +423,22 @@ class HostTests(unittest.TestCase):
         resp = self.request('/plugins/gingerbase/host/reboot', '{}', 'POST')
         self.assertEquals(200, resp.status)
 
+    def test_hoststats_events(self):
+        resp = self.request('/plugins/gingerbase/host/reboot', '{}', 'POST')
+        self.assertEquals(200, resp.status)
+
+        # the events are returned with the samples around them
+        uri = '/plugins/gingerbase/host/stats/history?window=1m'
+        for _ in range(10):
+            time.sleep(0.5)
+            history = json.loads(self.request(uri).read())
+            events = [event for event in history['events']
+                      if event['name'] == 'reboot']
+            if events:
+                break
+        self.assertEquals('finished', events[-1]['status'])
+        self.assertTrue(events[-1]['start'] <= events[-1]['end'])
+
     def test_packages_update(self):
         def _task_lookup(taskid):
             return json.loads(self.request('/plugins/gingerbase/tasks/%s' %
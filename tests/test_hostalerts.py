@@ -0,0 +1,128 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import unittest
+
+from wok.plugins.gingerbase.hostalerts import AlertEngine
+from wok.plugins.gingerbase.hostalerts import AlertRule
+from wok.plugins.gingerbase.hostalerts import flatten_sample
+from wok.plugins.gingerbase.hostalerts import parse_rule
+
+
+METRICS = set(['cpu_utilization', 'memory.avail', 'memory.total'])
+
+
+class _Dispatcher(object):
+
+    def __init__(self):
+        self.alerts = []
+
+    def send(self, alert):
+        self.alerts.append(alert)
+
+
+class AlertRuleTests(unittest.TestCase):
+
+    def test_parse_rule(self):
+        self.assertEqual({'metric': 'cpu_utilization', 'operator': '>',
+                          'threshold': 90.0, 'reference': None,
+                          'duration': 300},
+                         parse_rule('cpu_utilization > 90 for 5m', METRICS))
+        self.assertEqual({'metric': 'memory.avail', 'operator': '<',
+                          'threshold': 0.05, 'reference': 'memory.total',
+                          'duration': 0},
+                         parse_rule('memory.avail < 5% of memory.total',
+                                    METRICS))
+        for text in ('cpu_utilization', 'cpu_utilization = 90',
+                     'cpu_utilization > 90 for', 'cpu_utilization > 5%',
+                     'memory.avail < 5 of memory.total',
+                     'disk_read_rate > 10', 'cpu_utilization > 90 for 5x'):
+            self.assertRaises(ValueError, parse_rule, text, METRICS)
+
+    def test_flatten_sample(self):
+        self.assertEqual({'cpu_utilization': 10.0, 'memory.avail': 5,
+                          'memory.total': 100},
+                         flatten_sample({'cpu_utilization': 10.0,
+                                         'memory': {'avail': 5, 'total': 100},
+                                         'filesystems': {'/': {'size': 1}},
+                                         'name': 'host'}))
+
+    def test_duration(self):
+        rule = AlertRule('cpu', 'cpu_utilization > 90 for 10s', METRICS)
+        self.assertEqual('inactive', rule.todict()['state'])
+        self.assertIsNone(rule.evaluate({'cpu_utilization': 95}, 100))
+        self.assertEqual('pending', rule.todict()['state'])
+        self.assertIsNone(rule.evaluate({'cpu_utilization': 80}, 105))
+        self.assertEqual('inactive', rule.todict()['state'])
+
+        for ts in (110, 115):
+            self.assertIsNone(rule.evaluate({'cpu_utilization': 95}, ts))
+        alert = rule.evaluate({'cpu_utilization': 98}, 120)
+        self.assertEqual({'id': 'cpu-120000', 'rule': 'cpu',
+                          'condition': 'cpu_utilization > 90 for 10s',
+                          'metric': 'cpu_utilization', 'state': 'firing',
+                          'value': 96.0, 'fired': 120, 'resolved': None},
+                         alert)
+        self.assertEqual('firing', rule.todict()['state'])
+
+        # fires once, then resolves with the same id
+        self.assertIsNone(rule.evaluate({'cpu_utilization': 99}, 125))
+        self.assertIsNone(rule.evaluate({}, 130))
+        alert = rule.evaluate({'cpu_utilization': 50}, 135)
+        self.assertEqual(('cpu-120000', 'resolved', 120, 135, 96.75),
+                         (alert['id'], alert['state'], alert['fired'],
+                          alert['resolved'], alert['value']))
+        self.assertEqual('inactive', rule.todict()['state'])
+        self.assertIsNone(rule.evaluate({'cpu_utilization': 50}, 140))
+
+    def test_relative_threshold(self):
+        rule = AlertRule('memory', 'memory.avail < 5% of memory.total',
+                         METRICS)
+        self.assertIsNone(rule.evaluate({'memory.avail': 10,
+                                         'memory.total': 100}, 1))
+        alert = rule.evaluate({'memory.avail': 4, 'memory.total': 100}, 2)
+        self.assertEqual(('firing', 4.0), (alert['state'], alert['value']))
+
+
+class AlertEngineTests(unittest.TestCase):
+
+    def test_rules(self):
+        dispatcher = _Dispatcher()
+        engine = AlertEngine(METRICS, dispatcher)
+        engine.add('cpu', 'cpu_utilization > 90', 'conf')
+        rules = engine.rules
+        engine.add('memory', 'memory.avail < 5% of memory.total')
+        self.assertEqual(['cpu'], list(rules))
+        self.assertEqual(['cpu', 'memory'], sorted(engine.rules))
+        self.assertEqual('conf', engine.rules['cpu'].source)
+        self.assertRaises(KeyError, engine.add, 'cpu', 'cpu_utilization > 1')
+        self.assertRaises(ValueError, engine.add, 'disk', 'disk > 1')
+        for name in ('', 'cpu high', 'cpu/high', 'cpu\xe9'):
+            self.assertRaises(ValueError, engine.add, name,
+                              'cpu_utilization > 1')
+
+        alerts = engine.evaluate({'cpu_utilization': 95.0,
+                                  'memory': {'avail': 1, 'total': 100}}, 10)
+        self.assertEqual(['cpu', 'memory'],
+                         sorted(alert['rule'] for alert in alerts))
+        self.assertEqual(alerts, dispatcher.alerts)
+
+        engine.remove('memory')
+        self.assertEqual(['cpu'], list(engine.rules))
+        self.assertRaises(KeyError, engine.remove, 'memory')
+        self.assertEqual([], engine.evaluate({'cpu_utilization': 95.0}, 20))
@@ -0,0 +1,166 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import array
+import unittest
+
+import mock
+from wok.plugins.gingerbase import hostevents
+from wok.plugins.gingerbase.hostevents import EVENT_OBJECT_TYPE
+from wok.plugins.gingerbase.hostevents import EventLog
+
+
+class _ObjectStore(object):
+    """In-memory object store, with the session API of wok's."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def get_list(self, obj_type):
+        return [ident for kind, ident in self.objects if kind == obj_type]
+
+    def get(self, obj_type, ident):
+        return dict(self.objects[(obj_type, ident)])
+
+    def store(self, obj_type, ident, data):
+        self.objects[(obj_type, ident)] = dict(data)
+
+    def delete(self, obj_type, ident, ignore_missing=False):
+        self.objects.pop((obj_type, ident), None)
+
+
+class EventLogTests(unittest.TestCase):
+
+    def _at(self, timestamp):
+        return mock.patch('wok.plugins.gingerbase.hostevents.time.time',
+                          return_value=timestamp)
+
+    def test_start_and_end(self):
+        events = EventLog()
+        with self._at(100.0):
+            swupdate = events.start('swupdate')
+            # same name, same millisecond
+            upgrade = events.start('upgrade', 'vim')
+            other = events.start('upgrade', 'vim')
+        with self._at(160.0):
+            events.end(upgrade)
+        with self._at(170.0):
+            events.end(other, 'failed')
+
+        self.assertEqual('swupdate-100000', swupdate)
+        self.assertEqual(['upgrade-100000', 'upgrade-100001'],
+                         [upgrade, other])
+        self.assertEqual([{'id': 'swupdate-100000', 'name': 'swupdate',
+                           'target': None, 'start': 100.0, 'end': None,
+                           'status': 'running'},
+                          {'id': 'upgrade-100000', 'name': 'upgrade',
+                           'target': 'vim', 'start': 100.0, 'end': 160.0,
+                           'status': 'finished'},
+                          {'id': 'upgrade-100001', 'name': 'upgrade',
+                           'target': 'vim', 'start': 100.0, 'end': 170.0,
+                           'status': 'failed'}],
+                         events.between(0, 200))
+
+    def test_between(self):
+        events = EventLog()
+        for start, end in [(10.0, 20.0), (30.0, 40.0), (50.0, None)]:
+            with self._at(start):
+                ident = events.start('reboot')
+            if end is not None:
+                with self._at(end):
+                    events.end(ident)
+
+        def starts(start, end):
+            return [event['start'] for event in events.between(start, end)]
+
+        self.assertEqual([10.0, 30.0, 50.0], starts(0, 100))
+        self.assertEqual([30.0], starts(25, 35))
+        self.assertEqual([30.0, 50.0], starts(40, 55))
+        self.assertEqual([], starts(21, 29))
+        # running events go on
+        self.assertEqual([50.0], starts(1000, 2000))
+
+        history = {'cursor': 2,
+                   'columns': [('seq', array.array('l', [1, 2])),
+                               ('timestamp', array.array('d', [15, 35]))]}
+        self.assertEqual([10.0, 30.0], [event['start'] for event in
+                                        events.annotate(history)['events']])
+        history['columns'] = [('seq', array.array('l')),
+                              ('timestamp', array.array('d'))]
+        self.assertEqual([], events.annotate(history)['events'])
+
+    def test_record_and_task(self):
+        events = EventLog()
+        with events.record('smt_enable', '2'):
+            pass
+        with self.assertRaises(ValueError):
+            with events.record('smt_disable'):
+                raise ValueError()
+
+        def update(cb, params):
+            cb('Updating')
+            cb('OK', params)
+
+        statuses = []
+        for success in (True, False):
+            events.task('swupdate', update)(
+                lambda msg, ok=None: statuses.append((msg, ok)), success)
+
+        self.assertEqual([('Updating', None), ('OK', True),
+                          ('Updating', None), ('OK', False)], statuses)
+        self.assertEqual([('smt_enable', '2', 'finished'),
+                          ('smt_disable', None, 'failed'),
+                          ('swupdate', None, 'finished'),
+                          ('swupdate', None, 'failed')],
+                         [(event['name'], event['target'], event['status'])
+                          for event in events.between(0, float('inf'))])
+
+    def test_store(self):
+        objstore = _ObjectStore()
+        events = EventLog(objstore)
+        with self._at(100.0):
+            reboot = events.start('reboot')
+            upgrade = events.start('upgrade', 'vim')
+        with self._at(200.0):
+            running = events.start('swupdate')
+        self.assertEqual(3, len(objstore.get_list(EVENT_OBJECT_TYPE)))
+
+        # the host restarted at 150: the events running then are ended
+        events = EventLog(objstore, 150.0)
+        self.assertEqual([(reboot, 150.0, 'finished'),
+                          (upgrade, 150.0, 'interrupted'),
+                          (running, None, 'running')],
+                         [(event['id'], event['end'], event['status'])
+                          for event in events.between(0, 1000)])
+        self.assertEqual('interrupted',
+                         objstore.get(EVENT_OBJECT_TYPE, upgrade)['status'])
+
+        # only the newest events are kept
+        with mock.patch.object(hostevents, 'EVENT_HISTORY_SIZE', 2):
+            with self._at(300.0):
+                events.start('reboot')
+        self.assertEqual([running, 'reboot-300000'],
+                         [event['id'] for event in events.between(0, 1000)])
+        self.assertEqual(sorted([running, 'reboot-300000']),
+                         sorted(objstore.get_list(EVENT_OBJECT_TYPE)))
@@ -0,0 +1,53 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import unittest
+
+from wok.plugins.gingerbase.hostmetrics import MetricsWriter
+
+
+class MetricsWriterTests(unittest.TestCase):
+
+    def test_exposition(self):
+        writer = MetricsWriter()
+        writer.add('samples_total', 'counter', 'Samples.', 10)
+        writer.add('cpu_seconds_total', 'counter', 'CPU time.',
+                   [((('mode', 'user'),), 1.5),
+                    ((('mode', 'a"b\\c\n'),), 2)])
+        self.assertEqual(b'# HELP gingerbase_samples_total Samples.\n'
+                         b'# TYPE gingerbase_samples_total counter\n'
+                         b'gingerbase_samples_total 10\n'
+                         b'# HELP gingerbase_cpu_seconds_total CPU time.\n'
+                         b'# TYPE gingerbase_cpu_seconds_total counter\n'
+                         b'gingerbase_cpu_seconds_total{mode="user"} 1.5\n'
+                         b'gingerbase_cpu_seconds_total{mode="a\\"b\\\\c\\n"}'
+                         b' 2\n',
+                         writer.getvalue())
+
+    def test_histogram(self):
+        writer = MetricsWriter()
+        writer.add_histogram('jitter_seconds', 'Jitter.',
+                             [[0.01, 2], [1, 3], [None, 4]], 2.5)
+        self.assertEqual(b'# HELP gingerbase_jitter_seconds Jitter.\n'
+                         b'# TYPE gingerbase_jitter_seconds histogram\n'
+                         b'gingerbase_jitter_seconds_bucket{le="0.01"} 2\n'
+                         b'gingerbase_jitter_seconds_bucket{le="1.0"} 3\n'
+                         b'gingerbase_jitter_seconds_bucket{le="+Inf"} 4\n'
+                         b'gingerbase_jitter_seconds_sum 2.5\n'
+                         b'gingerbase_jitter_seconds_count 4\n',
+                         writer.getvalue())
@@ -0,0 +1,506 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import array
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+from wok.plugins.gingerbase.hostevents import EventLog
+from wok.plugins.gingerbase.hoststats import aggregate
+from wok.plugins.gingerbase.hoststats import ANOMALY_METRICS
+from wok.plugins.gingerbase.hoststats import ANOMALY_WARMUP
+from wok.plugins.gingerbase.hoststats import AnomalyDetector
+from wok.plugins.gingerbase.hoststats import Baseline
+from wok.plugins.gingerbase.hoststats import FilesystemHistory
+from wok.plugins.gingerbase.hoststats import FLOAT_TYPECODE
+from wok.plugins.gingerbase.hoststats import HostStatsArchive
+from wok.plugins.gingerbase.hoststats import HostStatsHistory
+from wok.plugins.gingerbase.hoststats import MEMORY_FIELDS
+from wok.plugins.gingerbase.hoststats import numa_columns
+from wok.plugins.gingerbase.hoststats import parse_duration
+from wok.plugins.gingerbase.hoststats import parse_tiers
+from wok.plugins.gingerbase.hoststats import percpu_columns
+from wok.plugins.gingerbase.hoststats import RingBuffer
+from wok.plugins.gingerbase.hoststats import StatsTier
+from wok.plugins.gingerbase.statsformat import COLUMNS_MEDIA_TYPE
+
+
+def _sample(value):
+    return {'cpu_utilization': float(value),
+            'disk_read_rate': value,
+            'disk_write_rate': value,
+            'net_recv_rate': value,
+            'net_sent_rate': value,
+            'memory': {'total': 100, 'free': value, 'cached': value,
+                       'buffers': value, 'avail': value, 'swap_total': 50,
+                       'swap_free': 50, 'hugepages_total': 0,
+                       'hugepages_free': 0, 'anon_hugepages': value},
+            'paging': {'swap_in_rate': 0, 'swap_out_rate': value,
+                       'major_fault_rate': 0.5, 'thp_fault_rate': 0.0,
+                       'thp_collapse_rate': 0.0},
+            'context_switch_rate': value,
+            'interrupt_rate': value,
+            'cpu': {'user': float(value), 'system': 1.0, 'iowait': 0.0,
+                    'irq': 0.0, 'softirq': 0.0, 'steal': 0.0, 'guest': 0.0},
+            'load': {'avg1': 1.5, 'avg5': 1.0, 'avg15': 0.5, 'running': 2,
+                     'blocked': 0},
+            'pressure': {'cpu_some': 0.5, 'cpu_full': 0.0,
+                         'memory_some': 0.0, 'memory_full': 0.0,
+                         'io_some': float(value), 'io_full': 0.25},
+            'anomaly': dict((metric, 0.0) for metric, _ in ANOMALY_METRICS)}
+
+
+def _stored_sample(value, seq, timestamp=None):
+    sample = _sample(value)
+    sample['seq'] = seq
+    sample['timestamp'] = float(value if timestamp is None else timestamp)
+    return sample
+
+
+class RingBufferTests(unittest.TestCase):
+
+    def test_append_and_wrap(self):
+        ring = RingBuffer(3, 'l')
+        self.assertEqual(0, len(ring))
+        self.assertEqual([], ring.tolist())
+        self.assertRaises(IndexError, ring.last)
+
+        ring.append(1)
+        ring.append(2)
+        self.assertEqual([1, 2], ring.tolist())
+        self.assertEqual(2, ring.last())
+
+        for value in range(3, 8):
+            ring.append(value)
+        self.assertEqual(3, len(ring))
+        self.assertEqual([5, 6, 7], ring.tolist())
+        self.assertEqual([6, 7], ring.tolist(2))
+        self.assertEqual(7, ring.last())
+
+    def test_invalid_capacity(self):
+        self.assertRaises(ValueError, RingBuffer, 0)
+
+
+class HostStatsHistoryTests(unittest.TestCase):
+
+    def test_snapshot(self):
+        history = HostStatsHistory(size=4)
+        self.assertEqual(0, history.last_seq())
+        for value in range(6):
+            history.append(_stored_sample(value, value + 1))
+
+        self.assertEqual(4, len(history))
+        self.assertEqual(6, history.last_seq())
+        self.assertEqual(_stored_sample(5, 6), history.last())
+
+        snapshot = history.snapshot()
+        self.assertEqual([2.0, 3.0, 4.0, 5.0], snapshot['cpu_utilization'])
+        self.assertEqual([2, 3, 4, 5], snapshot['net_sent_rate'])
+        self.assertEqual([3, 4, 5, 6], snapshot['seq'])
+        self.assertEqual([_sample(v)['memory'] for v in range(2, 6)],
+                         snapshot['memory'])
+
+
+class StatsTierTests(unittest.TestCase):
+
+    def test_parse_duration(self):
+        self.assertEqual(30, parse_duration('30'))
+        self.assertEqual(30, parse_duration(30))
+        self.assertEqual(600, parse_duration('10m'))
+        self.assertEqual(2 * 24 * 3600, parse_duration('2D'))
+        for value in ['', 'm', '0s', '-1', '1x', '1.5h']:
+            self.assertRaises(ValueError, parse_duration, value)
+
+    def test_parse_tiers(self):
+        self.assertEqual([(1, 300), (10, 2160), (60, 10080), (3600, 8760)],
+                         parse_tiers('1h:1y, 1s:5m, 10s:6h, 1m:7d'))
+        self.assertEqual([(1, 60), (60, 60)], parse_tiers(['1s:1m', '1m:1h']))
+        for value in ['', '1s', '1m:10s', '1s:5m:1h']:
+            self.assertRaises(ValueError, parse_tiers, value)
+
+    def test_consolidation(self):
+        tier = StatsTier(10, 3)
+        for timestamp in range(100, 125):
+            tier.add(_sample(timestamp % 7), timestamp)
+
+        # the bucket started at 120 is not complete yet
+        snapshot = tier.snapshot()
+        self.assertEqual([30.0 / 10, 32.0 / 10],
+                         snapshot['cpu_utilization'])
+        self.assertEqual([3, 3], snapshot['disk_read_rate'])
+        self.assertEqual([0, 0], snapshot['min']['disk_read_rate'])
+        self.assertEqual([6, 6], snapshot['max']['net_sent_rate'])
+        self.assertEqual(6, snapshot['max']['memory'][0]['avail'])
+        self.assertEqual([1, 2], snapshot['seq'])
+        self.assertEqual([100.0, 110.0], snapshot['timestamp'])
+        self.assertEqual(2, snapshot['cursor'])
+
+        tier.add(_sample(0), 130)
+        self.assertEqual(3, len(tier.snapshot()['net_recv_rate']))
+
+    def test_archive(self):
+        archive = HostStatsArchive(parse_tiers('1s:1m, 10s:10m, 1m:1h'))
+        self.assertTrue(archive.tiers[0].raw)
+        self.assertFalse(archive.tiers[1].raw)
+
+        for timestamp in range(1000, 1200):
+            archive.add(_sample(timestamp), timestamp)
+        self.assertEqual(_stored_sample(1199, 200), archive.last())
+
+        self.assertEqual(1, archive.get_tier().step)
+        self.assertEqual(10, archive.get_tier(resolution=5).step)
+        self.assertEqual(60, archive.get_tier(resolution=3600).step)
+        self.assertEqual(10, archive.get_tier(window=300).step)
+        self.assertEqual(60, archive.get_tier(window=24 * 3600).step)
+
+        history = archive.snapshot()
+        self.assertEqual(list(range(1140, 1200)), history['disk_read_rate'])
+        self.assertEqual(list(range(141, 201)), history['seq'])
+        self.assertEqual(200, history['cursor'])
+        self.assertNotIn('min', history)
+
+        history = archive.snapshot(since=195)
+        self.assertEqual([1195, 1196, 1197, 1198, 1199],
+                         history['net_recv_rate'])
+        self.assertEqual([1195.0, 1196.0, 1197.0, 1198.0, 1199.0],
+                         history['timestamp'])
+        self.assertEqual(200, history['cursor'])
+        self.assertEqual([], archive.snapshot(since=200)['seq'])
+        self.assertEqual(60, len(archive.snapshot(since=0)['seq']))
+        self.assertEqual(60, len(archive.snapshot(since=1000)['seq']))
+        self.assertEqual(2, len(archive.snapshot(window=2, since=0)['seq']))
+
+        history = archive.snapshot(resolution=10, window=30)
+        self.assertEqual([1165, 1175, 1185], history['disk_read_rate'])
+        self.assertEqual([1160, 1170, 1180], history['min']['disk_read_rate'])
+        self.assertEqual([1164.5, 1174.5, 1184.5],
+                         [cpu['user'] for cpu in history['cpu']])
+
+    def test_concurrent_reads(self):
+        # the collector writes while requests read: every read returns
+        # columns of the same samples, up to the cursor
+        archive = HostStatsArchive(parse_tiers('1s:1m, 10s:10m'),
+                                   raw_columns=percpu_columns(64))
+        sample = _sample(0)
+        sample['percpu'] = dict(('cpu%d' % cpu, 1.0) for cpu in range(64))
+        archive.add(sample, 1000)
+        stopped = threading.Event()
+
+        def write():
+            timestamp = 1001
+            while not stopped.is_set():
+                sample.update(_sample(timestamp))
+                archive.add(sample, timestamp)
+                timestamp += 1
+                time.sleep(0.0005)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(300):
+                history = archive.arrays(window=30)
+                columns = dict(history['columns'])
+                self.assertEqual(set([len(columns['seq'])]),
+                                 set(len(values) for values in
+                                     columns.values()))
+                cursor = history['cursor']
+                self.assertEqual(cursor, columns['seq'][-1])
+                self.assertEqual(999 + cursor, columns['timestamp'][-1])
+                self.assertEqual(columns['timestamp'][-1],
+                                 columns['disk_read_rate'][-1])
+
+                history = archive.arrays(resolution=10, window=300)
+                seq = dict(history['max'])['seq']
+                self.assertEqual(history['cursor'], seq[-1] if seq else 0)
+                self.assertEqual(dict(history['min'])['timestamp'],
+                                 dict(history['columns'])['timestamp'])
+        finally:
+            stopped.set()
+            writer.join()
+
+    def test_aggregate(self):
+        values = array.array(FLOAT_TYPECODE, [5.0, 1.0, 4.0, 2.0, 3.0])
+        timestamps = array.array(FLOAT_TYPECODE,
+                                 [1e9 + t for t in [0, 1, 2, 3, 4]])
+        result = aggregate(values, timestamps)
+        self.assertEqual({'min': 1.0, 'max': 5.0, 'mean': 3.0, 'p50': 3.0,
+                          'p95': 4.8, 'p99': 4.96, 'rate': -0.3},
+                         dict((k, round(v, 6)) for k, v in result.items()))
+
+        result = aggregate(array.array(FLOAT_TYPECODE, [7.0]), timestamps)
+        self.assertEqual(7.0, result['p99'])
+        self.assertEqual(0.0, result['rate'])
+        self.assertIsNone(aggregate(array.array(FLOAT_TYPECODE), [])['p50'])
+
+    def test_archive_aggregate(self):
+        archive = HostStatsArchive(parse_tiers('1s:1m, 10s:10m'))
+        for timestamp in range(1000, 1100):
+            archive.add(_sample(timestamp), timestamp)
+
+        result = archive.aggregate(['disk_read_rate', 'memory'], window=10)
+        self.assertEqual(1, result['resolution'])
+        self.assertEqual(10, result['samples'])
+        self.assertEqual((1090.0, 1099.0), (result['start'], result['end']))
+        self.assertEqual(100, result['cursor'])
+        self.assertEqual(['disk_read_rate'] + sorted(
+            'memory.' + field for field in MEMORY_FIELDS),
+            sorted(result['metrics']))
+        stats = result['metrics']['disk_read_rate']
+        self.assertEqual((1090, 1099, 1094.5), (stats['min'], stats['max'],
+                                                stats['mean']))
+        self.assertAlmostEqual(1.0, stats['rate'])
+
+        result = archive.aggregate(['cpu_utilization'], since=98)
+        self.assertEqual(2, result['samples'])
+        result = archive.aggregate(['cpu_utilization'], since=100)
+        self.assertEqual(0, result['samples'])
+        self.assertIsNone(result['metrics']['cpu_utilization']['mean'])
+
+        # consolidated tiers keep the extremes of each step
+        result = archive.aggregate(['net_sent_rate'], resolution=10,
+                                   window=30)
+        stats = result['metrics']['net_sent_rate']
+        self.assertEqual(10, result['resolution'])
+        self.assertEqual((1060, 1089, 1075.0), (stats['min'], stats['max'],
+                                                stats['mean']))
+
+        self.assertRaises(KeyError, archive.aggregate, ['unknown'])
+
+    def test_percpu(self):
+        archive = HostStatsArchive(
+            parse_tiers('1s:1m, 10s:10m'),
+            raw_columns=percpu_columns(2) + numa_columns(['node0']))
+        for timestamp in range(1000, 1030):
+            sample = _sample(timestamp)
+            sample['percpu'] = {'cpu0': 10.0, 'cpu1': float(timestamp)}
+            sample['numa'] = {'node0': timestamp}
+            archive.add(sample, timestamp)
+
+        self.assertNotIn('percpu', archive.last(exclude=('percpu',)))
+        self.assertEqual({'cpu0': 10.0, 'cpu1': 1029.0},
+                         archive.last()['percpu'])
+
+        history = archive.snapshot(window=2)
+        self.assertEqual([{'cpu0': 10.0, 'cpu1': 1028.0},
+                          {'cpu0': 10.0, 'cpu1': 1029.0}], history['percpu'])
+        history = archive.snapshot(window=2, exclude=('percpu',))
+        self.assertNotIn('percpu', history)
+
+        self.assertEqual({'node0': 1029}, archive.last()['numa'])
+
+        # per-CPU utilization and NUMA are only kept by the raw tiers
+        history = archive.snapshot(resolution=10)
+        self.assertNotIn('percpu', history)
+        self.assertNotIn('numa', history)
+        self.assertEqual([1005, 1015], history['disk_read_rate'])
+
+    def test_publish(self):
+        archive = HostStatsArchive(parse_tiers('1s:1m'),
+                                   raw_columns=percpu_columns(1))
+        snapshot = archive.publish()
+        self.assertEqual(0, snapshot.seq)
+        self.assertRaises(IndexError, snapshot.last)
+        self.assertEqual([], snapshot.history()['cpu_utilization'])
+
+        for timestamp in range(1000, 1003):
+            sample = _sample(timestamp)
+            sample['percpu'] = {'cpu0': 10.0}
+            archive.add(sample, timestamp)
+        snapshot = archive.publish()
+        self.assertEqual(3, snapshot.seq)
+        self.assertEqual(archive.last(), snapshot.last())
+        self.assertEqual(archive.snapshot(exclude=('percpu',)),
+                         snapshot.history(('percpu',)))
+
+        # the snapshot does not change with the archive and is encoded once:
+        # its history is only read when first used, up to its own sample
+        snapshot = archive.publish()
+        encoded = snapshot.encode('last', ('percpu',))
+        self.assertIs(encoded, snapshot.encode('last', ('percpu',)))
+        sample = _sample(1003)
+        sample['percpu'] = {'cpu0': 10.0}
+        archive.add(sample, 1003)
+        self.assertEqual(3, snapshot.history()['cursor'])
+        self.assertEqual(_stored_sample(1002, 3),
+                         json.loads(encoded.decode('utf-8')))
+        self.assertEqual([1000, 1001, 1002],
+                         json.loads(snapshot.encode('history').decode(
+                             'utf-8'))['disk_read_rate'])
+        columns = json.loads(snapshot.encode(
+            'history', ('percpu',), COLUMNS_MEDIA_TYPE).decode('utf-8'))
+        self.assertEqual([1000, 1001, 1002],
+                         columns['columns']['disk_read_rate'])
+        self.assertNotIn('percpu.cpu0', columns['columns'])
+
+        # the samples a stream client missed
+        self.assertEqual([_stored_sample(1002, 3), _stored_sample(1003, 4)],
+                         archive.samples(2, ('percpu',)))
+        self.assertEqual([], archive.samples(4))
+        self.assertEqual([], archive.samples(10))
+
+        snapshot = archive.publish({'filesystems': {}})
+        self.assertEqual({}, snapshot.last()['filesystems'])
+        self.assertNotIn('filesystems', archive.last())
+        self.assertNotIn('events', snapshot.history())
+
+        # the events overlapping the samples come with the history
+        events = EventLog()
+        events.start('swupdate')
+        self.assertEqual([], archive.publish(events=events).history()[
+            'events'])
+        with mock.patch('wok.plugins.gingerbase.hostevents.time.time',
+                        return_value=1002.5):
+            events.end(events.start('reboot'))
+        snapshot = archive.publish(events=events)
+        self.assertEqual(['reboot'], [event['name'] for event in
+                                      snapshot.history()['events']])
+        self.assertEqual(['reboot'], [event['name'] for event in
+                                      archive.snapshot(events=events)[
+                                          'events']])
+
+
+class FilesystemHistoryTests(unittest.TestCase):
+
+    def _usage(self, used, inodes_used):
+        return {'/var': {'device': '/dev/sda2', 'type': 'ext4',
+                         'size': 10000, 'used': used, 'avail': 9000 - used,
+                         'inodes': 1000, 'inodes_used': inodes_used,
+                         'inodes_avail': 1000 - inodes_used}}
+
+    def test_forecast(self):
+        history = FilesystemHistory(3)
+        usage = self._usage(1000, 100)
+        history.add(usage, 1000)
+        forecast = history.forecast(usage)['/var']
+        self.assertEqual(0.0, forecast['growth_rate'])
+        self.assertIsNone(forecast['full_in'])
+
+        # 10 bytes per second, the oldest sample is overwritten; the
+        # inodes do not grow
+        for timestamp in range(1060, 1240, 60):
+            usage = self._usage(1000 + (timestamp - 1000) * 10, 100)
+            history.add(usage, timestamp)
+        forecast = history.forecast(usage)['/var']
+        self.assertEqual(10.0, forecast['growth_rate'])
+        self.assertEqual((9000 - 2800) // 10, forecast['full_in'])
+        self.assertEqual(0.0, forecast['inodes_growth_rate'])
+        self.assertIsNone(forecast['inodes_full_in'])
+        self.assertEqual(2800, forecast['used'])
+
+        # unmounted filesystems are forgotten
+        history.add({}, 1240)
+        self.assertEqual({}, history.forecast({}))
+        self.assertEqual(0.0, history.forecast(usage)['/var']['growth_rate'])
+
+
+class AnomalyDetectorTests(unittest.TestCase):
+
+    def test_baseline(self):
+        baseline = Baseline(60, 0.1)
+        for value in (1, 2, 3):
+            baseline.add(value, 1)
+        # the first samples are averaged evenly
+        self.assertAlmostEqual(2.0, baseline.mean)
+        self.assertAlmostEqual(2 / 3.0, baseline.variance)
+        self.assertAlmostEqual(3.0, baseline.score(2 + 3 * baseline.stddev()))
+
+        # then older samples fade with time
+        for _ in range(1000):
+            baseline.add(10, 1)
+        self.assertAlmostEqual(10.0, baseline.mean, places=3)
+        self.assertEqual(0.1, baseline.stddev())
+
+    def test_update(self):
+        detector = AnomalyDetector(600, 4)
+        sample = _sample(0)
+        for timestamp in range(ANOMALY_WARMUP):
+            sample['cpu_utilization'] = 10.0 + timestamp % 2
+            anomalies = detector.update(sample, timestamp)
+            self.assertEqual(0.0, anomalies['cpu_utilization'])
+        self.assertEqual(set(metric for metric, _ in ANOMALY_METRICS),
+                         set(anomalies))
+
+        sample['cpu_utilization'] = 12.0
+        self.assertEqual(0.0, detector.update(sample, 30)['cpu_utilization'])
+
+        # a burst, which deviates by (90 - 10.5) / 1 (the minimum standard
+        # deviation of the CPU utilization) sigmas
+        sample['cpu_utilization'] = 90.0
+        anomalies = detector.update(sample, 31)
+        self.assertTrue(anomalies['cpu_utilization'] > 70)
+        self.assertEqual(0.0, anomalies['disk_read_rate'])
+
+    def test_seasonal(self):
+        detector = AnomalyDetector(60, 4, seasonal=True)
+        sample = _sample(0)
+        day = 24 * 60 * 60
+        # a nightly burst from 2:00 to 2:05, for 3 days
+        for timestamp in range(0, 3 * day, 60):
+            hour = time.localtime(timestamp).tm_hour
+            sample['cpu_utilization'] = 90.0 if hour == 2 else 10.0
+            anomalies = detector.update(sample, timestamp)
+            if hour == 2 and timestamp >= 2 * day:
+                self.assertEqual(0.0, anomalies['cpu_utilization'])
+
+        detector = AnomalyDetector(60, 4)
+        for timestamp in range(0, day, 60):
+            hour = time.localtime(timestamp).tm_hour
+            sample['cpu_utilization'] = 90.0 if hour == 2 else 10.0
+            anomalies = detector.update(sample, timestamp)
+            if hour == 2 and time.localtime(timestamp).tm_min == 0:
+                self.assertTrue(anomalies['cpu_utilization'] > 4)
+
+
+@unittest.skipUnless(hasattr(memoryview, 'cast'),
+                     'Memory-mapped archive requires Python 3')
+class HostStatsArchiveFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'hoststats')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_reload(self):
+        tiers = parse_tiers('1s:10s, 5s:1m')
+        archive = HostStatsArchive(tiers, path=self.path)
+        for timestamp in range(100, 117):
+            archive.add(_sample(timestamp), timestamp)
+        history = archive.snapshot(resolution=5)
+        del archive
+
+        archive = HostStatsArchive(tiers, path=self.path)
+        self.assertEqual(_stored_sample(116, 17), archive.last())
+        self.assertEqual(list(range(107, 117)),
+                         archive.snapshot()['disk_write_rate'])
+        self.assertEqual(history, archive.snapshot(resolution=5))
+
+        # the archive is recreated when the tiers change
+        archive.add(_sample(117), 117)
+        self.assertEqual(18, archive.snapshot()['cursor'])
+
+        archive = HostStatsArchive(parse_tiers('1s:20s'), path=self.path)
+        self.assertRaises(IndexError, archive.last)
+        self.assertEqual([], archive.snapshot()['cpu_utilization'])
@@ -0,0 +1,581 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+import wok.plugins.gingerbase.procstats as procstats
+
+PROC_STAT = """\
+cpu  100 0 100 700 100 0 0 0 0 0
+cpu0 100 0 100 700 100 0 0 0 0 0
+intr 130367 0 0 0
+ctxt 250000
+btime 1500000000
+procs_running 3
+procs_blocked 1
+"""
+
+PROC_LOADAVG = "0.50 0.25 0.10 3/120 4242\n"
+
+PROC_PRESSURE_CPU = """\
+some avg10=1.00 avg60=0.50 avg300=0.25 total=1000000
+full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+"""
+
+PROC_PRESSURE_IO = """\
+some avg10=0.00 avg60=0.00 avg300=0.00 total=500000
+full avg10=0.00 avg60=0.00 avg300=0.00 total=250000
+"""
+
+PROC_MEMINFO = """\
+MemTotal:        6147400 kB
+MemFree:         4536432 kB
+MemAvailable:    5602368 kB
+Buffers:          386000 kB
+Cached:           837460 kB
+SwapCached:            0 kB
+SwapTotal:       2097148 kB
+SwapFree:        2000000 kB
+AnonHugePages:    409600 kB
+HugePages_Total:      16
+HugePages_Free:        4
+Hugepagesize:       2048 kB
+"""
+
+PROC_VMSTAT = """\
+nr_free_pages 1134108
+pswpin 100
+pswpout 250
+pgmajfault 4242
+thp_fault_alloc 12
+thp_fault_alloc_failed 1
+"""
+
+NODE_MEMINFO = """\
+Node %d MemTotal:        3073700 kB
+Node %d MemFree:         %d kB
+"""
+
+PROC_DISKSTATS = """\
+   7       0 loop0 10 0 8 0 0 0 0 0 0 0 0
+   8       0 sda 100 0 1000 0 50 0 500 0 0 0 0
+   8       1 sda1 60 0 600 0 30 0 300 0 0 0 0
+   8       2 sda2 40 0 400 0 20 0 200 0 0 0 0
+"""
+
+PROC_NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    \
+packets errs drop fifo colls carrier compressed
+    lo: 1000 10 0 0 0 0 0 0 1000 10 0 0 0 0 0 0
+  eth0: 2000 20 0 0 0 0 0 0 3000 30 0 0 0 0 0 0
+  eth1: 4000 40 0 0 0 0 0 0 5000 50 0 0 0 0 0 0
+"""
+
+
+class HostStatsCollectorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.patchers = []
+        for name, content in [('PROC_STAT', PROC_STAT),
+                              ('PROC_MEMINFO', PROC_MEMINFO),
+                              ('PROC_DISKSTATS', PROC_DISKSTATS),
+                              ('PROC_NET_DEV', PROC_NET_DEV),
+                              ('PROC_LOADAVG', PROC_LOADAVG),
+                              ('PROC_VMSTAT', PROC_VMSTAT)]:
+            path = self._write(name, content)
+            patcher = mock.patch.object(procstats, name, path)
+            patcher.start()
+            self.patchers.append(patcher)
+
+        # no memory pressure file, as when PSI is not available
+        os.mkdir(os.path.join(self.tmpdir, 'pressure'))
+        self._write('pressure/cpu', PROC_PRESSURE_CPU)
+        self._write('pressure/io', PROC_PRESSURE_IO)
+        patcher = mock.patch.object(procstats, 'PROC_PRESSURE',
+                                    os.path.join(self.tmpdir, 'pressure'))
+        patcher.start()
+        self.patchers.append(patcher)
+
+        os.mkdir(os.path.join(self.tmpdir, 'node'))
+        for node, free in [(1, 1000), (0, 2000)]:
+            os.mkdir(os.path.join(self.tmpdir, 'node', 'node%d' % node))
+            self._write('node/node%d/meminfo' % node,
+                        NODE_MEMINFO % (node, node, free))
+        os.mkdir(os.path.join(self.tmpdir, 'node', 'possible'))
+        patcher = mock.patch.object(procstats, 'SYS_NODE',
+                                    os.path.join(self.tmpdir, 'node'))
+        patcher.start()
+        self.patchers.append(patcher)
+
+        self.collector = procstats.HostStatsCollector(
+            lambda: ['eth0', 'eth1', 'eth2'])
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_read_grows_buffer(self):
+        proc_file = procstats.ProcFile(procstats.PROC_MEMINFO, 16)
+        buf, length = proc_file.read()
+        self.assertEqual(PROC_MEMINFO.encode('ascii'), bytes(buf[:length]))
+        proc_file.close()
+
+    @mock.patch('wok.plugins.gingerbase.procstats.os.sysconf')
+    def test_cpu(self, mock_sysconf):
+        mock_sysconf.return_value = 2
+        self.collector = procstats.HostStatsCollector(lambda: [])
+        self.assertEqual(2, self.collector.cpus)
+
+        cpu = self.collector.cpu()
+        self.assertEqual(20.0, cpu['utilization'])
+        self.assertEqual({'user': 10.0, 'system': 10.0, 'iowait': 10.0,
+                          'irq': 0.0, 'softirq': 0.0, 'steal': 0.0,
+                          'guest': 0.0}, cpu['states'])
+        # cpu1 is offline
+        self.assertEqual({'cpu0': 20.0, 'cpu1': 0.0}, cpu['percpu'])
+
+        self._write('PROC_STAT',
+                    PROC_STAT.replace('100 0 100 700 100 0 0 0 0 0',
+                                      '150 0 130 720 100 0 0 0 0 0'))
+        cpu = self.collector.cpu()
+        self.assertEqual(80.0, cpu['utilization'])
+        self.assertEqual(50.0, cpu['states']['user'])
+        self.assertEqual(30.0, cpu['states']['system'])
+        self.assertEqual(0.0, cpu['states']['iowait'])
+        self.assertEqual({'cpu0': 80.0, 'cpu1': 0.0}, cpu['percpu'])
+
+        cpu = self.collector.cpu()
+        self.assertEqual(0.0, cpu['utilization'])
+
+    def test_cpu_guest(self):
+        self._write('PROC_STAT',
+                    'cpu  600 0 100 200 0 0 0 100 400 0\n')
+        cpu = self.collector.cpu()
+        # guest time is not accounted as user time
+        self.assertEqual(20.0, cpu['states']['user'])
+        self.assertEqual(40.0, cpu['states']['guest'])
+        self.assertEqual(10.0, cpu['states']['steal'])
+        self.assertEqual(80.0, cpu['utilization'])
+
+    def test_load(self):
+        self.collector.cpu()
+        self.assertEqual(250000, self.collector.stat_counters[
+            'context_switches'])
+        self.assertEqual(130367, self.collector.stat_counters['interrupts'])
+        # the collector itself is not counted as running
+        self.assertEqual({'avg1': 0.5, 'avg5': 0.25, 'avg15': 0.1,
+                          'running': 2, 'blocked': 1},
+                         self.collector.load())
+
+    def test_pressure(self):
+        totals = self.collector.pressure()
+        self.assertEqual({'cpu_some': 1000000, 'cpu_full': 0,
+                          'memory_some': 0, 'memory_full': 0,
+                          'io_some': 500000, 'io_full': 250000}, totals)
+
+        self._write('pressure/cpu', PROC_PRESSURE_CPU.replace(
+            'total=1000000', 'total=1500000'))
+        stalls = procstats.stall_percent(totals, self.collector.pressure(),
+                                         2)
+        self.assertEqual(25.0, stalls['cpu_some'])
+        self.assertEqual(0.0, stalls['io_some'])
+        self.assertEqual(2.5, procstats.stall_percent(None, totals,
+                                                      10)['io_full'])
+
+    def test_memory(self):
+        self.assertEqual({'total': 6147400 * 1024,
+                          'free': 4536432 * 1024,
+                          'avail': 5602368 * 1024,
+                          'buffers': 386000 * 1024,
+                          'cached': 837460 * 1024,
+                          'swap_total': 2097148 * 1024,
+                          'swap_free': 2000000 * 1024,
+                          'anon_hugepages': 409600 * 1024,
+                          'hugepages_total': 16 * 2048 * 1024,
+                          'hugepages_free': 4 * 2048 * 1024},
+                         self.collector.memory())
+
+    def test_vmstat(self):
+        # thp_collapse_alloc is not provided by this kernel
+        self.assertEqual({'swap_in': 100, 'swap_out': 250,
+                          'major_faults': 4242, 'thp_faults': 12,
+                          'thp_collapses': 0},
+                         self.collector.vmstat())
+
+    def test_numa(self):
+        self.assertEqual(['node0', 'node1'], self.collector.nodes)
+        self.assertEqual({'node0': 2000 * 1024, 'node1': 1000 * 1024},
+                         self.collector.numa())
+
+    @mock.patch('wok.plugins.gingerbase.procstats.udev_stamp')
+    @mock.patch('wok.plugins.gingerbase.procstats.get_block_graph')
+    def test_disk_io(self, mock_graph, mock_stamp):
+        mock_stamp.return_value = 1.0
+        mock_graph.return_value.physical_disks.return_value = set(['sda'])
+        # only the physical disk is accounted, not its partitions
+        self.assertEqual((1000 * 512, 500 * 512), self.collector.disk_io())
+
+        # devices are only discovered again when the list changes
+        self.collector.disk_io()
+        self.assertEqual(1, mock_graph.call_count)
+
+        mock_graph.return_value.physical_disks.return_value = set(['sda',
+                                                                   'sdb'])
+        self._write('PROC_DISKSTATS',
+                    PROC_DISKSTATS + '   8 16 sdb 1 0 2 0 1 0 4 0 0 0 0\n')
+        self.assertEqual((1002 * 512, 504 * 512), self.collector.disk_io())
+        self.assertEqual(2, mock_graph.call_count)
+
+        # or on udev events
+        mock_stamp.return_value = 2.0
+        self.collector.disk_io()
+        self.assertEqual(3, mock_graph.call_count)
+
+    def test_net_io(self):
+        self.assertEqual((6000, 8000), self.collector.net_io())
+
+        prev = self.collector.net_dev()
+        self._write('PROC_NET_DEV', PROC_NET_DEV.replace(
+            'eth1: 4000 40 0 0', 'eth1: 6000 60 2 1') +
+            '  eth2: 10 1 0 0 0 0 0 0 10 1 0 0 0 0 0 0\n')
+        # eth2 was added since prev
+        self.assertEqual((2000, 0), self.collector.net_io(prev=prev))
+
+        # eth0 was reset
+        prev = self.collector.net_dev()
+        self._write('PROC_NET_DEV', PROC_NET_DEV.replace(
+            'eth0: 2000 20', 'eth0: 100 1'))
+        self.assertRaises(procstats.CounterReset, self.collector.net_io,
+                          prev=prev)
+        self.assertNotIn('eth0', procstats.net_rates(
+            prev, self.collector.net_dev(), 1.0))
+
+    def test_burst_recorder(self):
+        recorder = procstats.BurstRecorder(2, set([b'sda', b'sdb']),
+                                           set([b'eth0', b'eth1']))
+        calls = []
+
+        def clock():
+            # the counters change before the second sample is copied
+            calls.append(None)
+            if len(calls) == 4:
+                self._write('PROC_STAT', PROC_STAT.replace(
+                    'cpu  100 0 100', 'cpu  200 0 200').replace(
+                    'ctxt 250000', 'ctxt 250500').replace(
+                    'intr 130367', 'intr 130467'))
+                self._write('PROC_DISKSTATS', PROC_DISKSTATS.replace(
+                    'sda 100 0 1000', 'sda 200 0 2000'))
+                self._write('PROC_NET_DEV', PROC_NET_DEV.replace(
+                    'eth0: 2000', 'eth0: 3000').replace(
+                    '5000 50', '5500 55'))
+            return len(calls) * 0.25
+
+        with mock.patch.object(procstats, 'monotonic', clock):
+            recorder.record(0)
+        self.assertEqual(2, recorder.count)
+        self.assertEqual([(1.0, {'cpu_utilization': 100.0,
+                                 'disk_read_rate': 1000 * 512 * 2,
+                                 'disk_write_rate': 0,
+                                 'net_recv_rate': 2000,
+                                 'net_sent_rate': 1000,
+                                 'context_switch_rate': 1000,
+                                 'interrupt_rate': 200})],
+                         list(recorder.rates()))
+
+    def test_burst_recorder_ring(self):
+        recorder = procstats.BurstRecorder(2, set([b'sda']), set([b'eth0']))
+        stopped = threading.Event()
+        times = []
+
+        def clock():
+            times.append(len(times) * 0.25)
+            if len(times) == 7:
+                # after the third sample, whose counters changed
+                stopped.set()
+            elif len(times) == 6:
+                self._write('PROC_DISKSTATS', PROC_DISKSTATS.replace(
+                    'sda 100 0 1000', 'sda 200 0 2000'))
+            return times[-1]
+
+        with mock.patch.object(procstats, 'monotonic', clock):
+            recorder.record(0, stopped, ring=True)
+        self.assertEqual(3, recorder.count)
+        # only the last two samples are kept
+        rates = list(recorder.rates())
+        self.assertEqual(1, len(rates))
+        self.assertEqual(1.25, rates[0][0])
+        self.assertEqual(1000 * 512 * 2, rates[0][1]['disk_read_rate'])
+
+    def test_disk_rates(self):
+        prev = self.collector.diskstats()
+        self._write('PROC_DISKSTATS',
+                    PROC_DISKSTATS.replace(
+                        'sda1 60 0 600 0 30 0 300 0 0 0 0',
+                        'sda1 70 0 2600 30 50 0 700 70 0 500 0') +
+                    '   8 16 sdb 1 0 2 0 1 0 4 0 0 0 0\n')
+        rates = procstats.disk_rates(prev, self.collector.diskstats(), 2.0,
+                                     ['sd*1', 'sdb'])
+        # sdb was added after the previous call
+        self.assertEqual(['sda1'], list(rates))
+        self.assertEqual({'read_rate': 1000 * 512, 'write_rate': 200 * 512,
+                          'read_iops': 5.0, 'write_iops': 10.0,
+                          'await': 3.33, 'util': 25.0}, rates['sda1'])
+
+    def test_net_rates(self):
+        prev = self.collector.net_dev()
+        self._write('PROC_NET_DEV', PROC_NET_DEV.replace(
+            'eth1: 4000 40 0 0', 'eth1: 6000 60 2 1'))
+        rates = procstats.net_rates(prev, self.collector.net_dev(), 2.0)
+        self.assertEqual(['eth0', 'eth1', 'lo'], sorted(rates))
+        self.assertEqual({'recv_rate': 1000, 'recv_packets': 10.0,
+                          'recv_errors': 1.0, 'recv_drops': 0.5,
+                          'sent_rate': 0, 'sent_packets': 0.0,
+                          'sent_errors': 0.0, 'sent_drops': 0.0},
+                         rates['eth1'])
+
+
+def _pid_stat(pid, name, state, ticks, starttime, rss):
+    # pid (name) state ppid ... utime stime ... starttime vsize rss ...
+    fields = [state] + ['0'] * 10 + [str(ticks), '0'] + ['0'] * 6 + \
+        [str(starttime), '0', str(rss)] + ['0'] * 10
+    return '%d (%s) %s\n' % (pid, name, ' '.join(fields))
+
+
+def _pid_io(read_bytes, write_bytes):
+    return ('rchar: 0\nwchar: 0\nsyscr: 0\nsyscw: 0\nread_bytes: %d\n'
+            'write_bytes: %d\ncancelled_write_bytes: 0\n' %
+            (read_bytes, write_bytes))
+
+
+class ProcessSamplerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.patchers = [
+            mock.patch.object(procstats, 'PROC', self.tmpdir),
+            mock.patch.object(procstats, 'PROC_UPTIME',
+                              os.path.join(self.tmpdir, 'uptime')),
+            mock.patch('wok.plugins.gingerbase.procstats.os.sysconf',
+                       {'SC_CLK_TCK': 100, 'SC_PAGE_SIZE': 4096}.get)]
+        for patcher in self.patchers:
+            patcher.start()
+        os.mkdir(os.path.join(self.tmpdir, 'self'))
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.mkdir(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _processes(self, uptime, init_ticks, io_bytes):
+        self._write('uptime', '%.2f 0.00\n' % uptime)
+        self._write('1/stat', _pid_stat(1, 'init', 'S', init_ticks, 0, 100))
+        self._write('1/io', _pid_io(0, 0))
+        self._write('42/stat', _pid_stat(42, 'my (proc)', 'S', 200, 9000,
+                                         1000))
+        self._write('42/io', _pid_io(io_bytes, 0))
+
+    def test_top(self):
+        self._processes(100.0, 1000, 1000000)
+        sampler = procstats.ProcessSampler(cache=0)
+        # first scan: averages since the processes started
+        seconds, processes = sampler.top(1, 'cpu')
+        self.assertEqual(0.0, seconds)
+        # the scan is timed, and cheap
+        self.assertTrue(0 <= sampler.duration < 1)
+        self.assertEqual([{'pid': 42, 'name': 'my (proc)', 'state': 'S',
+                           'cpu': 20.0, 'rss': 4096000, 'io': 100000,
+                           'read_rate': 100000, 'write_rate': 0}],
+                         processes)
+        self.assertEqual([42, 1],
+                         [p['pid'] for p in sampler.top(5, 'rss')[1]])
+
+        # rates since the previous scan; the I/O counters of the processes
+        # which did not run are not read again
+        self._processes(102.0, 1100, 2000000)
+        seconds, processes = sampler.top(5, 'cpu')
+        self.assertAlmostEqual(2.0, seconds)
+        self.assertEqual([(1, 50.0, 0), (42, 0.0, 0)],
+                         [(p['pid'], p['cpu'], p['io']) for p in processes])
+
+    def test_cache(self):
+        self._processes(100.0, 1000, 0)
+        sampler = procstats.ProcessSampler(cache=60)
+        first = sampler.top(5, 'cpu')
+        self._processes(102.0, 1100, 0)
+        self.assertEqual(first, sampler.top(5, 'cpu'))
+
+
+PROC_MOUNTINFO = """\
+22 1 0:21 / /proc rw,nosuid shared:5 - proc proc rw
+25 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+30 25 8:2 / /var/lib/my\\040data rw,relatime shared:2 - xfs /dev/sda2 rw
+31 25 8:2 /images /srv/images rw,relatime - xfs /dev/sda2 rw
+32 25 0:42 / /srv/nfs rw master:3 - nfs4 server:/export rw
+33 25 0:45 / /tmp rw shared:4 - tmpfs tmpfs rw
+34 25 0:46 / /tmp rw - tmpfs tmpfs rw,size=1024k
+"""
+
+PROC_FILESYSTEMS = """\
+nodev\tsysfs
+nodev\ttmpfs
+nodev\tproc
+\text4
+nodev\tnfs4
+\txfs
+"""
+
+
+class FilesystemCollectorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.patchers = []
+        for name, content in [('PROC_MOUNTINFO', PROC_MOUNTINFO),
+                              ('PROC_FILESYSTEMS', PROC_FILESYSTEMS)]:
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'w') as f:
+                f.write(content)
+            patcher = mock.patch.object(procstats, name, path)
+            patcher.start()
+            self.patchers.append(patcher)
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_mounts(self):
+        collector = procstats.FilesystemCollector()
+        mounts = collector.mounts()
+        # no pseudo or network filesystem, bind mount or hidden mount
+        self.assertEqual([('/', b'/', 'ext4', '/dev/sda1'),
+                          ('/var/lib/my data', b'/var/lib/my data', 'xfs',
+                           '/dev/sda2'),
+                          ('/tmp', b'/tmp', 'tmpfs', 'tmpfs')], mounts)
+        # parsed again only when the mount table changes
+        self.assertIs(mounts, collector.mounts())
+        with open(procstats.PROC_MOUNTINFO, 'a') as f:
+            f.write('35 25 8:3 / /home rw - ext4 /dev/sda3 rw\n')
+        self.assertEqual('/home', collector.mounts()[-1][0])
+
+    @mock.patch('wok.plugins.gingerbase.procstats.os.statvfs')
+    def test_usage(self, mock_statvfs):
+        def statvfs(path):
+            if path == b'/tmp':
+                raise OSError('not mounted')
+            return mock.Mock(f_frsize=4096, f_blocks=1000, f_bfree=400,
+                             f_bavail=300, f_files=100, f_ffree=60,
+                             f_favail=50)
+
+        mock_statvfs.side_effect = statvfs
+        usage = procstats.FilesystemCollector().usage()
+        self.assertEqual(['/', '/var/lib/my data'], sorted(usage))
+        self.assertEqual({'device': '/dev/sda1', 'type': 'ext4',
+                          'size': 4096000, 'used': 2457600,
+                          'avail': 1228800, 'inodes': 100,
+                          'inodes_used': 40, 'inodes_avail': 50},
+                         usage['/'])
+
+
+class CollectorStatsTests(unittest.TestCase):
+
+    def test_ticks(self):
+        stats = procstats.CollectorStats(1)
+        for now, deadline in [(101.0, 101.0), (102.003, 102.0),
+                              (103.2, 103.0), (106.3, 104.0)]:
+            stats.tick(now, deadline)
+
+        health = stats.todict()
+        self.assertEqual(4, health['ticks'])
+        # the last tick started 2.3s late
+        self.assertEqual(2, health['missed'])
+        self.assertEqual([[0.001, 1], [0.005, 2], [0.01, 2], [0.05, 2],
+                          [0.1, 2], [0.5, 3], [1.0, 3], [None, 4]],
+                         health['jitter']['buckets'])
+        self.assertEqual(4, health['jitter']['count'])
+        self.assertAlmostEqual(2.503, health['jitter']['sum'])
+
+    def test_measure(self):
+        stats = procstats.CollectorStats(1)
+        with stats.collect():
+            for _ in range(2):
+                with stats.measure('cpu'):
+                    sum(range(1000))
+
+        health = stats.todict()
+        self.assertEqual(1, health['collected'])
+        self.assertEqual(2, health['collectors']['cpu']['calls'])
+        self.assertTrue(health['collectors']['cpu']['wall_total'] >=
+                        health['collectors']['cpu']['wall'] >= 0)
+        self.assertTrue(health['duration'] >=
+                        health['collectors']['cpu']['wall_total'])
+
+        # a sub-collector which raises is still accounted
+        with self.assertRaises(IOError):
+            with stats.collect():
+                with stats.measure('disk'):
+                    raise IOError()
+        health = stats.todict()
+        self.assertEqual(1, health['collected'])
+        self.assertEqual(1, health['collectors']['disk']['calls'])
+        self.assertTrue(health['duration'] >=
+                        health['collectors']['disk']['wall'] >= 0)
+
+
+class DeadlineTaskTests(unittest.TestCase):
+
+    def test_deadlines(self):
+        calls = []
+
+        def tick(now, deadline):
+            calls.append((now, deadline))
+            if len(calls) == 3:
+                task.cancel()
+
+        task = procstats.DeadlineTask(0.05, tick)
+        task.start()
+        task.join(5)
+        self.assertFalse(task.is_alive())
+        self.assertEqual(3, len(calls))
+        for now, deadline in calls:
+            self.assertTrue(now >= deadline)
+        # deadlines are absolute: they do not drift with the calls
+        first = calls[0][1]
+        for i, (_, deadline) in enumerate(calls):
+            self.assertAlmostEqual(first + i * 0.05, deadline)
@@ -0,0 +1,109 @@
+#
+# Project Ginger Base
+#
+# Copyright IBM Corp, 2017
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import array
+import json
+import struct
+import unittest
+
+from wok.plugins.gingerbase.statsformat import BINARY_MAGIC
+from wok.plugins.gingerbase.statsformat import BINARY_MEDIA_TYPE
+from wok.plugins.gingerbase.statsformat import COLUMNS_MEDIA_TYPE
+from wok.plugins.gingerbase.statsformat import DELTA_MEDIA_TYPE
+from wok.plugins.gingerbase.statsformat import encode
+from wok.plugins.gingerbase.statsformat import JSON_MEDIA_TYPE
+from wok.plugins.gingerbase.statsformat import negotiate
+
+
+def _history():
+    return {'cursor': 12,
+            'columns': [('seq', array.array('l', [10, 11, 12])),
+                        ('timestamp', array.array('d', [1.5, 2.5, 3.5])),
+                        ('memory.avail', array.array('l', [100, 90, 95]))],
+            'min': [('seq', array.array('l', [10, 11, 12])),
+                    ('timestamp', array.array('d', [1.5, 2.5, 3.5])),
+                    ('memory.avail', array.array('l', [80, 85, 90]))]}
+
+
+class StatsFormatTests(unittest.TestCase):
+
+    def test_negotiate(self):
+        self.assertEqual(JSON_MEDIA_TYPE, negotiate(None))
+        self.assertEqual(JSON_MEDIA_TYPE,
+                         negotiate('application/json, */*; q=0.01'))
+        self.assertEqual(JSON_MEDIA_TYPE, negotiate('text/html'))
+        self.assertEqual(COLUMNS_MEDIA_TYPE,
+                         negotiate(COLUMNS_MEDIA_TYPE + ', */*; q=0.01'))
+        self.assertEqual(BINARY_MEDIA_TYPE,
+                         negotiate('application/json; q=0.5, ' +
+                                   BINARY_MEDIA_TYPE))
+        self.assertEqual(JSON_MEDIA_TYPE,
+                         negotiate(DELTA_MEDIA_TYPE + '; q=0, */*'))
+
+    def test_columns(self):
+        history = json.loads(encode(_history(), COLUMNS_MEDIA_TYPE).decode(
+            'utf-8'))
+        self.assertEqual(12, history['cursor'])
+        self.assertEqual(3, history['count'])
+        self.assertEqual({'seq': [10, 11, 12],
+                          'timestamp': [1.5, 2.5, 3.5],
+                          'memory.avail': [100, 90, 95]},
+                         history['columns'])
+        self.assertEqual([80, 85, 90], history['min']['memory.avail'])
+        self.assertNotIn('max', history)
+        self.assertRaises(ValueError, encode, _history(), JSON_MEDIA_TYPE)
+
+    def test_delta(self):
+        history = json.loads(encode(_history(), DELTA_MEDIA_TYPE).decode(
+            'utf-8'))
+        self.assertEqual(['seq', 'memory.avail'], history['delta'])
+        self.assertEqual({'seq': [10, 1, 1],
+                          'timestamp': [1.5, 2.5, 3.5],
+                          'memory.avail': [100, -10, 5]},
+                         history['columns'])
+        self.assertEqual([80, 5, 5], history['min']['memory.avail'])
+
+    def test_binary(self):
+        encoded = encode(_history(), BINARY_MEDIA_TYPE)
+        self.assertEqual(BINARY_MAGIC, encoded[:4])
+        length = struct.unpack('<I', encoded[4:8])[0]
+        self.assertEqual(0, (8 + length) % 8)
+        header = json.loads(encoded[8:8 + length].decode('utf-8'))
+        self.assertEqual({'cursor': 12, 'count': 3,
+                          'columns': ['seq', 'timestamp', 'memory.avail',
+                                      'min.seq', 'min.timestamp',
+                                      'min.memory.avail']}, header)
+        values = struct.unpack('<18d', encoded[8 + length:])
+        self.assertEqual((100.0, 90.0, 95.0), values[6:9])
+        self.assertEqual((80.0, 85.0, 90.0), values[15:])
+
+    def test_events(self):
+        history = _history()
+        history['events'] = [{'id': 'reboot-2000', 'name': 'reboot',
+                              'target': None, 'start': 2.0, 'end': 3.0,
+                              'status': 'finished'}]
+        for media_type in (COLUMNS_MEDIA_TYPE, DELTA_MEDIA_TYPE):
+            encoded = json.loads(encode(history, media_type).decode('utf-8'))
+            self.assertEqual(history['events'], encoded['events'])
+
+        encoded = encode(history, BINARY_MEDIA_TYPE)
+        length = struct.unpack('<I', encoded[4:8])[0]
+        self.assertEqual(0, (8 + length) % 8)
+        header = json.loads(encoded[8:8 + length].decode('utf-8'))
+        self.assertEqual(history['events'], header['events'])
+        self.assertEqual(18 * 8, len(encoded) - 8 - length)
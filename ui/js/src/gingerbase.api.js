@@ -95,13 +95,29 @@ var gingerbase = {
             type : 'GET',
             resend: true,
             contentType : 'application/json',
-            headers: {'Wok-Robot': 'wok-robot'},
+            // one array per metric instead of one object per sample
+            headers: {'Wok-Robot': 'wok-robot',
+                      'Accept': 'application/vnd.gingerbase.columns+json'},
             dataType : 'json',
             success : suc,
             error: err
         });
     },
 
+    /**
+     * Open a stream of host stats, receiving each new sample as soon as it
+     * is collected. Returns the EventSource, to be closed by the caller.
+     */
+    getHostStatsStream : function(since, suc, err) {
+        var source = new EventSource('plugins/gingerbase/host/stats/stream' +
+                                     '?since=' + encodeURIComponent(since));
+        source.onmessage = function(event) {
+            suc(JSON.parse(event.data));
+        };
+        source.onerror = err;
+        return source;
+    },
+
     getTask : function(taskId, suc, err) {
         wok.requestJSON({
             url : 'plugins/gingerbase/tasks/' + encodeURIComponent(taskId),
@@ -457,11 +457,108 @@ gingerbase.init_dashboard = function() {
                     points: [],
                     converter: 'number-locale-converter'
                 }
+            },
+            pressure: {
+                c: {
+                    type: 'percent',
+                    legend: i18n['GGBHOST6026M'],
+                    points: [],
+                    converter: 'number-locale-converter'
+                },
+                m: {
+                    type: 'percent',
+                    legend: i18n['GGBHOST6027M'],
+                    'class': 'pressure-memory',
+                    points: [],
+                    converter: 'number-locale-converter'
+                },
+                i: {
+                    type: 'percent',
+                    legend: i18n['GGBHOST6028M'],
+                    'class': 'pressure-io',
+                    points: [],
+                    converter: 'number-locale-converter'
+                }
+            },
+            load: {
+                l: {
+                    type: 'value',
+                    fixed: 2,
+                    locale: wok.lang.get_locale(),
+                    legend: i18n['GGBHOST6024M'],
+                    points: [],
+                    converter: 'number-locale-converter'
+                },
+                r: {
+                    type: 'value',
+                    locale: wok.lang.get_locale(),
+                    legend: i18n['GGBHOST6025M'],
+                    'class': 'load-running',
+                    points: [],
+                    converter: 'number-locale-converter'
+                }
+            },
+            scheduler: {
+                c: {
+                    type: 'value',
+                    locale: wok.lang.get_locale(),
+                    unit: i18n['GGBHOST6031M'],
+                    legend: i18n['GGBHOST6029M'],
+                    points: [],
+                    converter: 'number-locale-converter'
+                },
+                i: {
+                    type: 'value',
+                    locale: wok.lang.get_locale(),
+                    unit: i18n['GGBHOST6031M'],
+                    legend: i18n['GGBHOST6030M'],
+                    'class': 'scheduler-interrupts',
+                    points: [],
+                    converter: 'number-locale-converter'
+                }
+            },
+            paging: {
+                i: {
+                    type: 'value',
+                    base: 2,
+                    fixed: 2,
+                    locale: wok.lang.get_locale(),
+                    unit: i18n['GGBHOST6018M'],
+                    legend: i18n['GGBHOST6032M'],
+                    points: [],
+                    converter: 'number-locale-converter'
+                },
+                o: {
+                    type: 'value',
+                    base: 2,
+                    fixed: 2,
+                    locale: wok.lang.get_locale(),
+                    unit: i18n['GGBHOST6018M'],
+                    legend: i18n['GGBHOST6033M'],
+                    'class': 'paging-swap-out',
+                    points: [],
+                    converter: 'number-locale-converter'
+                },
+                f: {
+                    type: 'value',
+                    fixed: 2,
+                    locale: wok.lang.get_locale(),
+                    unit: i18n['GGBHOST6031M'],
+                    legend: i18n['GGBHOST6034M'],
+                    'class': 'paging-faults',
+                    points: [],
+                    converter: 'number-locale-converter'
+                }
             }
         };
 
         var SIZE = 20;
         var cursor = SIZE;
+        // whether each point of a chart deviates from the baseline
+        var anomalies = {};
+        // time of each point, and the host events around them, by id
+        var timestamps = [];
+        var events = {};
 
         var add = function(stats) {
             for (var key in stats) {
@@ -504,6 +601,76 @@ gingerbase.init_dashboard = function() {
             cursor++;
         };
 
+        var addAnomalies = function(flags) {
+            for (var key in flags) {
+                var ps = (anomalies[key] || []).concat(flags[key]);
+                ps.splice(0, ps.length - SIZE - 1);
+                anomalies[key] = ps;
+            }
+        };
+
+        var getAnomalies = function(which) {
+            var ps = anomalies[which] || [];
+            var positions = [];
+            $.each(ps, function(i, flagged) {
+                if (flagged) {
+                    // percent of the chart width, the newest point on the
+                    // right edge
+                    positions.push(100 * (SIZE - ps.length + 1 + i) / SIZE);
+                }
+            });
+            return positions;
+        };
+
+        var addEvents = function(times, newEvents) {
+            timestamps = timestamps.concat(times);
+            timestamps.splice(0, timestamps.length - SIZE - 1);
+            $.each(newEvents || [], function(i, event) {
+                events[event['id']] = event;
+            });
+            for (var id in events) {
+                var end = events[id]['end'];
+                if (end !== null && end < timestamps[0]) {
+                    delete events[id];
+                }
+            }
+        };
+
+        var getEvents = function() {
+            var count = timestamps.length;
+            var position = function(i) {
+                // percent of the chart width, the newest point on the right
+                // edge
+                return 100 * (SIZE - count + 1 + i) / SIZE;
+            };
+            var markers = [];
+            for (var id in events) {
+                var event = events[id];
+                var first = null;
+                var last = 0;
+                $.each(timestamps, function(i, time) {
+                    if (first === null && time >= event['start']) {
+                        first = i;
+                    }
+                    if (event['end'] === null || time <= event['end']) {
+                        last = i;
+                    }
+                });
+                if (first === null) {
+                    // it started after the newest point
+                    continue;
+                }
+                // an event between two points is drawn on the second one
+                last = Math.max(first, last);
+                markers.push({
+                    event: event,
+                    left: position(first),
+                    width: position(last) - position(first)
+                });
+            }
+            return markers;
+        };
+
         var get = function(which) {
             var stats = statsArray[which];
             var lines = [];
@@ -542,7 +709,11 @@ gingerbase.init_dashboard = function() {
 
         return {
             add: add,
-            get: get
+            get: get,
+            addAnomalies: addAnomalies,
+            getAnomalies: getAnomalies,
+            addEvents: addEvents,
+            getEvents: getEvents
         };
     };
 
@@ -555,16 +726,53 @@ gingerbase.init_dashboard = function() {
             for (var key in charts) {
                 var chart = charts[key];
                 chart.updateUI(statsPool.get(key));
+                if (anomalyMetrics[key]) {
+                    drawAnomalies(key);
+                }
+                drawEvents(key);
             }
         };
 
         var self = this;
 
+        // metrics checked for anomalies on each chart
+        var anomalyMetrics = {
+            cpu: ['cpu_utilization'],
+            diskIO: ['disk_read_rate', 'disk_write_rate'],
+            networkIO: ['net_recv_rate', 'net_sent_rate'],
+            scheduler: ['context_switch_rate', 'interrupt_rate']
+        };
+
+        // field of a group, e.g. pressure.io_some, of one sample or of
+        // every sample of a history
+        var statsField = function(stats, group, name) {
+            var columns = stats['columns'];
+            if (columns) {
+                return columns[group + '.' + name];
+            }
+            var values = stats[group];
+            if (values === undefined) {
+                return undefined;
+            }
+            if (Array.isArray(values)) {
+                return $.map(values, function(value) {
+                    return value[name];
+                });
+            }
+            return values[name];
+        };
+
         var UnifyStats = function(stats) {
+            // columnar history: the arrays are used as they are
+            var columns = stats['columns'];
+            var metrics = columns || stats;
+            var field = function(group, name) {
+                return statsField(stats, group, name);
+            };
             var result = {
                 cpu: {
                     u: {
-                        v: stats['cpu_utilization']
+                        v: metrics['cpu_utilization']
                     }
                 },
                 memory: {
@@ -572,23 +780,64 @@ gingerbase.init_dashboard = function() {
                 },
                 diskIO: {
                     w: {
-                        v: stats['disk_write_rate']
+                        v: metrics['disk_write_rate']
                     },
                     r: {
-                        v: stats['disk_read_rate']
+                        v: metrics['disk_read_rate']
                     }
                 },
                 networkIO: {
                     s: {
-                        v: stats['net_sent_rate']
+                        v: metrics['net_sent_rate']
+                    },
+                    r: {
+                        v: metrics['net_recv_rate']
+                    }
+                },
+                pressure: {
+                    c: {
+                        v: field('pressure', 'cpu_some')
+                    },
+                    m: {
+                        v: field('pressure', 'memory_some')
+                    },
+                    i: {
+                        v: field('pressure', 'io_some')
+                    }
+                },
+                load: {
+                    l: {
+                        v: field('load', 'avg1')
                     },
                     r: {
-                        v: stats['net_recv_rate']
+                        v: field('load', 'running')
+                    }
+                },
+                scheduler: {
+                    c: {
+                        v: metrics['context_switch_rate']
+                    },
+                    i: {
+                        v: metrics['interrupt_rate']
+                    }
+                },
+                paging: {
+                    i: {
+                        v: field('paging', 'swap_in_rate')
+                    },
+                    o: {
+                        v: field('paging', 'swap_out_rate')
+                    },
+                    f: {
+                        v: field('paging', 'major_fault_rate')
                     }
                 }
             };
 
-            if (Array.isArray(stats['memory'])) {
+            if (columns) {
+                result.memory.u['v'] = columns['memory.avail'];
+                result.memory.u['max'] = Math.max.apply(Math, columns['memory.total']);
+            } else if (Array.isArray(stats['memory'])) {
                 result.memory.u['v'] = [];
                 result.memory.u['max'] = -Infinity;
                 for (var i = 0; i < stats['memory'].length; i++) {
@@ -603,20 +852,132 @@ gingerbase.init_dashboard = function() {
         };
 
 
-        var statsCallback = function(stats) {
+        // flags of the samples where a metric of each chart deviates from
+        // its baseline: one flag per sample, or an array for a history
+        var UnifyAnomalies = function(stats) {
+            var result = {};
+            var count = Array.isArray(stats['seq']) ? stats['seq'].length :
+                stats['count'];
+            for (var key in anomalyMetrics) {
+                var flags = count === undefined ? false : [];
+                for (var i = 0; i < (count || 0); i++) {
+                    flags.push(false);
+                }
+                $.each(anomalyMetrics[key], function(i, metric) {
+                    var scores = statsField(stats, 'anomaly', metric);
+                    if (scores === undefined) {
+                        return;
+                    }
+                    if (!Array.isArray(scores)) {
+                        flags = flags || scores !== 0;
+                        return;
+                    }
+                    $.each(scores, function(j, score) {
+                        flags[j] = flags[j] || score !== 0;
+                    });
+                });
+                result[key] = flags;
+            }
+            return result;
+        };
+
+        var drawAnomalies = function(key) {
+            var node = $('#container-chart-' + key.replace(/IO$/, '-io'));
+            var track = node.siblings('.chart-anomalies');
+            if (!track.length) {
+                track = $('<div class="chart-anomalies"></div>');
+                node.after(track);
+            }
+            track.empty();
+            $.each(statsPool.getAnomalies(key), function(i, position) {
+                $('<span class="chart-anomaly"></span>')
+                    .css('left', position + '%')
+                    .attr('title', i18n['GGBHOST6035M'])
+                    .appendTo(track);
+            });
+        };
+
+        // name of each kind of host event
+        var eventLabels = {
+            swupdate: 'GGBHOST6036M',
+            upgrade: 'GGBHOST6037M',
+            reboot: 'GGBHOST6038M',
+            shutdown: 'GGBHOST6039M',
+            smt_enable: 'GGBHOST6040M',
+            smt_disable: 'GGBHOST6041M',
+            debugreport: 'GGBHOST6042M'
+        };
+
+        var drawEvents = function(key) {
+            var node = $('#container-chart-' + key.replace(/IO$/, '-io'));
+            var track = node.siblings('.chart-events');
+            if (!track.length) {
+                // below the anomalies, which overlap the chart
+                var anomalies = node.next('.chart-anomalies');
+                track = $('<div class="chart-events"></div>');
+                (anomalies.length ? anomalies : node).after(track);
+            }
+            track.empty();
+            $.each(statsPool.getEvents(), function(i, marker) {
+                var event = marker['event'];
+                var title = i18n[eventLabels[event['name']]] || event['name'];
+                if (event['target']) {
+                    title += ' ' + event['target'];
+                }
+                $('<span class="chart-event"></span>')
+                    .toggleClass('chart-event-failed',
+                                 event['status'] === 'failed')
+                    .css({left: marker['left'] + '%',
+                          width: marker['width'] + '%'})
+                    .attr('title', title)
+                    .appendTo(track);
+            });
+        };
+
+        var updateCharts = function(stats) {
             var unifiedStats = UnifyStats(stats);
             statsPool.add(unifiedStats);
+            statsPool.addAnomalies(UnifyAnomalies(stats));
+            var times = stats['columns'] ? stats['columns']['timestamp'] :
+                stats['timestamp'];
+            statsPool.addEvents(Array.isArray(times) ? times : [times],
+                                stats['events']);
             for (var key in charts) {
                 var chart = charts[key];
                 chart.updateUI(statsPool.get(key));
+                if (anomalyMetrics[key]) {
+                    drawAnomalies(key);
+                }
+                drawEvents(key);
             }
+        };
+
+        var statsCallback = function(stats) {
+            updateCharts(stats);
             timer = setTimeout(function() {
                 continueTrack();
             }, 1000);
         };
 
+        var stream = null;
+
         var track = function() {
-            gingerbase.getHostStatsHistory(statsCallback,
+            gingerbase.getHostStatsHistory(function(stats) {
+                    updateCharts(stats);
+                    if (!window.EventSource || stats['cursor'] === undefined) {
+                        continueTrack();
+                        return;
+                    }
+                    // Receive new samples as they are collected. Fall back
+                    // to polling when the stream is not available.
+                    stream = gingerbase.getHostStatsStream(stats['cursor'],
+                        updateCharts,
+                        function() {
+                            stream.close();
+                            stream = null;
+                            continueTrack();
+                        });
+                },
                 function() {
                     continueTrack();
                 });
@@ -632,6 +993,8 @@ gingerbase.init_dashboard = function() {
         var destroy = function() {
             timer && clearTimeout(timer);
             timer = null;
+            stream && stream.close();
+            stream = null;
         };
 
         return {
@@ -672,6 +1035,30 @@ gingerbase.init_dashboard = function() {
                 node: 'container-chart-network-io',
                 type: 'value',
                 converters: wok.localeConverters
+            }),
+            pressure: new wok.widget.LineChart({
+                id: 'chart-pressure',
+                node: 'container-chart-pressure',
+                type: 'percent',
+                converters: wok.localeConverters
+            }),
+            load: new wok.widget.LineChart({
+                id: 'chart-load',
+                node: 'container-chart-load',
+                type: 'value',
+                converters: wok.localeConverters
+            }),
+            scheduler: new wok.widget.LineChart({
+                id: 'chart-scheduler',
+                node: 'container-chart-scheduler',
+                type: 'value',
+                converters: wok.localeConverters
+            }),
+            paging: new wok.widget.LineChart({
+                id: 'chart-paging',
+                node: 'container-chart-paging',
+                type: 'value',
+                converters: wok.localeConverters
             })
         };
 